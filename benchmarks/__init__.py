@@ -0,0 +1 @@
+"""Benchmarks de desempenho com um llama.cpp falso (ver `python -m benchmarks -h`)"""
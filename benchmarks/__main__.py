@@ -0,0 +1,143 @@
+"""
+Executa os benchmarks contra o llama.cpp falso
+
+    python -m benchmarks --repeticoes 30 --concorrencia 4 --saida atual.json
+    python -m benchmarks --base base.json --tolerancia 0.15
+
+Sai com código 1 quando algum cenário regrediu em relação à base.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+STUB = Path(__file__).resolve().parent / "stub_llama.py"
+
+
+def _criar_executavel(diretorio: Path, nome: str) -> Path:
+    """Wrapper executável que chama o stub com este Python"""
+    if os.name == "nt":
+        caminho = diretorio / f"{nome}.cmd"
+        caminho.write_text(f'@"{sys.executable}" "{STUB}" %*\n')
+    else:
+        caminho = diretorio / nome
+        caminho.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{STUB}" "$@"\n')
+        caminho.chmod(0o755)
+    return caminho
+
+
+def preparar_ambiente(args, diretorio: Path) -> None:
+    """Aponta o toolkit para o stub (antes de importar llm_toolkit)"""
+    modelo = diretorio / "modelo-falso.gguf"
+    modelo.write_bytes(b"GGUF")
+    os.environ.update({
+        "LLM_BINARIO": str(_criar_executavel(diretorio, "llama-cli")),
+        "LLM_BINARIO_SERVIDOR": str(_criar_executavel(diretorio, "llama-server")),
+        "LLM_MODELO": str(modelo),
+        "LLM_WORKERS": str(args.workers),
+        "STUB_INICIO_MS": str(args.inicio_ms),
+        "STUB_TOKENS_SEG": str(args.tokens_seg),
+        "STUB_TOKENS": str(args.tokens),
+        "STUB_FORMATO": args.formato,
+    })
+    # Caches desligados por padrão: medimos a geração, não o acerto
+    os.environ.setdefault("CACHE_ATIVO", "false")
+    os.environ.setdefault("CACHE_ARQUIVO", "")
+    os.environ.setdefault("LLM_CACHE_PREFIXO", "false")
+    sys.path.insert(0, str(RAIZ))
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _imprimir(resultados: dict) -> None:
+    print(f"{'cenário':<26}{'p50':>10}{'p95':>10}{'p99':>10}{'req/s':>10}{'erros':>7}")
+    for nome, r in resultados.items():
+        print(f"{nome:<26}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+              f"{r['vazao_rps']:>10.2f}{r['erros']:>7}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks do llm_toolkit com llama.cpp falso")
+    parser.add_argument("--cenarios", nargs="+", help="Padrão: todos")
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--concorrencia", type=int, default=1)
+    parser.add_argument("--aquecimento", type=int, default=1)
+    parser.add_argument("--itens", type=int, default=4, help="Prompts por chamada de /gerar-multiplo")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens por resposta")
+    parser.add_argument("--inicio-ms", type=int, default=200, help="Carga simulada do modelo")
+    parser.add_argument("--tokens-seg", type=float, default=50)
+    parser.add_argument("--formato", default="multilinha",
+                        choices=["eco", "multilinha", "marcadores", "vazio"])
+    parser.add_argument("--workers", type=int, default=0, help="LLM_WORKERS (0 = um processo por chamada)")
+    parser.add_argument("--saida", type=Path, help="Arquivo JSON com os resultados")
+    parser.add_argument("--base", type=Path, help="Resultado anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    args = parser.parse_args()
+    base = json.loads(args.base.read_text(encoding="utf-8")) if args.base else None
+
+    with tempfile.TemporaryDirectory(prefix="llm-bench-") as temporario:
+        preparar_ambiente(args, Path(temporario))
+        from .cenarios import CENARIOS, ServidorLocal
+        from .medicao import comparar, medir
+
+        nomes = args.cenarios or list(CENARIOS)
+        desconhecidos = set(nomes) - set(CENARIOS)
+        if desconhecidos:
+            parser.error(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+        opcoes = {"tokens": args.tokens, "itens": args.itens}
+        resultados = {}
+        with contextlib.ExitStack() as pilha:
+            if any(CENARIOS[nome][1] for nome in nomes):
+                opcoes["url"] = pilha.enter_context(ServidorLocal()).url
+            for nome in nomes:
+                fabrica, _ = CENARIOS[nome]
+                print(f"Executando {nome}...", file=sys.stderr)
+                resultados[nome] = medir(fabrica(opcoes), args.repeticoes,
+                                         args.concorrencia, args.aquecimento)
+
+        from llm_toolkit.core.pool import encerrar_pool
+        encerrar_pool()
+
+    saida = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "parametros": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        },
+        "cenarios": resultados,
+    }
+    _imprimir(resultados)
+    if args.saida:
+        args.saida.write_text(json.dumps(saida, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Resultados em {args.saida}", file=sys.stderr)
+
+    if base is None:
+        return 0
+    linhas = comparar(saida, base, args.tolerancia)
+    regressoes = [l for l in linhas if l["regressao"]]
+    for l in linhas:
+        marca = "REGRESSÃO" if l["regressao"] else "ok"
+        print(f"{l['cenario']:<26}{l['metrica']:<11}{l['base']:>10}{l['atual']:>10}"
+              f"{l['razao']:>8.2f}  {marca}")
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
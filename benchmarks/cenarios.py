@@ -0,0 +1,81 @@
+"""
+Cenários de benchmark
+
+Importar só depois de `preparar_ambiente` (em __main__): o llm_toolkit lê os
+caminhos do binário e do modelo no import.
+"""
+
+import logging
+import threading
+from typing import Callable, Dict
+
+import requests
+
+from llm_toolkit.api import GeradorLLM
+from llm_toolkit.client.api import ClienteAPI
+from llm_toolkit.core.llm import RESPOSTAS_ERRO, gerar_resposta
+
+
+class ServidorLocal:
+    """Servidor Flask do toolkit numa porta livre, em thread própria"""
+
+    def __enter__(self) -> "ServidorLocal":
+        from werkzeug.serving import make_server
+        from llm_toolkit.core.servidor import app
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self._servidor = make_server("127.0.0.1", 0, app, threaded=True)
+        self.url = f"http://127.0.0.1:{self._servidor.server_port}"
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._servidor.shutdown()
+        self._thread.join(timeout=5)
+
+
+def _prompt(i: int) -> str:
+    # Prompts distintos: nada de acerto em cache entre repetições
+    return f"qual o resultado do teste numero {i}"
+
+
+def gerar_resposta_direto(opcoes: Dict) -> Callable[[int], bool]:
+    return lambda i: not gerar_resposta(_prompt(i), 0.7, opcoes["tokens"]).startswith(RESPOSTAS_ERRO)
+
+
+def gerador_llm(opcoes: Dict) -> Callable[[int], bool]:
+    gerador = GeradorLLM(tokens=opcoes["tokens"])
+    return lambda i: gerador.gerar(_prompt(i)).sucesso
+
+
+def endpoint_gerar(opcoes: Dict) -> Callable[[int], bool]:
+    def _chamar(i: int) -> bool:
+        resp = requests.post(f"{opcoes['url']}/gerar", timeout=120,
+                             json={"prompt": _prompt(i), "tokens": opcoes["tokens"]})
+        return resp.status_code == 200
+    return _chamar
+
+
+def endpoint_gerar_multiplo(opcoes: Dict) -> Callable[[int], bool]:
+    def _chamar(i: int) -> bool:
+        prompts = [_prompt(i * 100 + j) for j in range(opcoes["itens"])]
+        resp = requests.post(f"{opcoes['url']}/gerar-multiplo", timeout=300,
+                             json={"prompts": prompts, "tokens": opcoes["tokens"]})
+        return resp.status_code == 200 and resp.json().get("falhas") == 0
+    return _chamar
+
+
+def cliente_api(opcoes: Dict) -> Callable[[int], bool]:
+    cliente = ClienteAPI(opcoes["url"])
+    return lambda i: cliente.gerar(_prompt(i), tokens=opcoes["tokens"]).sucesso
+
+
+# nome -> (fábrica, precisa do servidor HTTP)
+CENARIOS = {
+    "gerar_resposta": (gerar_resposta_direto, False),
+    "gerador_llm": (gerador_llm, False),
+    "endpoint_gerar": (endpoint_gerar, True),
+    "endpoint_gerar_multiplo": (endpoint_gerar_multiplo, True),
+    "cliente_api": (cliente_api, True),
+}
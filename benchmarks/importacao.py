@@ -0,0 +1,77 @@
+"""
+Orçamento de tempo de import do pacote
+
+    python -m benchmarks.importacao
+    python -m benchmarks.importacao --fator 2   # máquina lenta: dobra os orçamentos
+
+Cada import é medido em processos novos (mediana de `--repeticoes`) e falha
+se passar do orçamento ou se carregar algum módulo proibido (a pilha HTTP
+só deve ser importada por quem usa servidor ou cliente).
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+PILHA_HTTP = ("flask", "werkzeug", "requests", "aiohttp", "urllib.request")
+
+# nome -> (instrução, orçamento em ms, módulos que não podem ser carregados)
+IMPORTACOES = {
+    "pacote": ("import llm_toolkit", 30, PILHA_HTTP),
+    "gerar_resposta": ("from llm_toolkit import gerar_resposta", 100, PILHA_HTTP),
+    "gerador_llm": ("from llm_toolkit import GeradorLLM", 150, PILHA_HTTP),
+}
+
+_MEDIDOR = """
+import json, sys, time
+inicio = time.perf_counter()
+exec({instrucao!r})
+ms = (time.perf_counter() - inicio) * 1000
+print(json.dumps({{"ms": ms, "carregados": [m for m in {proibidos!r} if m in sys.modules]}}))
+"""
+
+
+def medir(instrucao: str, proibidos: tuple, repeticoes: int) -> dict:
+    """Mediana do tempo de `instrucao` em interpretadores novos"""
+    codigo = _MEDIDOR.format(instrucao=instrucao, proibidos=proibidos)
+    amostras = []
+    carregados = set()
+    # Primeira execução compila os .pyc e não entra na conta
+    for i in range(repeticoes + 1):
+        saida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, check=True,
+                               capture_output=True, text=True).stdout
+        resultado = json.loads(saida.strip().splitlines()[-1])
+        carregados.update(resultado["carregados"])
+        if i:
+            amostras.append(resultado["ms"])
+    return {"ms": round(statistics.median(amostras), 2), "carregados": sorted(carregados)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Confere o tempo de import do llm_toolkit")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--fator", type=float, default=1.0, help="Multiplica todos os orçamentos")
+    args = parser.parse_args()
+
+    falhas = 0
+    for nome, (instrucao, orcamento, proibidos) in IMPORTACOES.items():
+        resultado = medir(instrucao, proibidos, args.repeticoes)
+        limite = orcamento * args.fator
+        problemas = []
+        if resultado["ms"] > limite:
+            problemas.append(f"acima do orçamento de {limite:.0f} ms")
+        if resultado["carregados"]:
+            problemas.append(f"carregou {', '.join(resultado['carregados'])}")
+        falhas += bool(problemas)
+        marca = "; ".join(problemas) if problemas else "ok"
+        print(f"{nome:<16}{resultado['ms']:>8.1f} ms  (orçamento {limite:.0f} ms)  {marca}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Medição de latência/vazão e comparação com uma execução de referência"""
+
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por posição mais próxima (valores ordenados)"""
+    if not valores:
+        return 0.0
+    posicao = max(1, math.ceil(p / 100 * len(valores)))
+    return valores[posicao - 1]
+
+
+def medir(funcao: Callable[[int], bool], repeticoes: int = 20, concorrencia: int = 1,
+          aquecimento: int = 1) -> Dict:
+    """
+    Executa `funcao(i)` `repeticoes` vezes com `concorrencia` threads
+
+    `funcao` retorna True quando a chamada teve sucesso. Latências em ms.
+    """
+    for i in range(aquecimento):
+        funcao(-1 - i)
+
+    latencias = []
+    falhas = []
+
+    def _chamar(i: int) -> None:
+        inicio = time.perf_counter()
+        try:
+            ok = funcao(i)
+        except Exception:
+            ok = False
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        if not ok:
+            falhas.append(i)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(_chamar, range(repeticoes)))
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "repeticoes": repeticoes,
+        "concorrencia": concorrencia,
+        "erros": len(falhas),
+        "p50_ms": round(percentil(latencias, 50), 2),
+        "p95_ms": round(percentil(latencias, 95), 2),
+        "p99_ms": round(percentil(latencias, 99), 2),
+        "media_ms": round(sum(latencias) / len(latencias), 2) if latencias else 0.0,
+        "min_ms": round(latencias[0], 2) if latencias else 0.0,
+        "max_ms": round(latencias[-1], 2) if latencias else 0.0,
+        "vazao_rps": round(repeticoes / duracao, 3) if duracao > 0 else 0.0,
+    }
+
+
+def comparar(atual: Dict, base: Dict, tolerancia: float = 0.10) -> List[Dict]:
+    """
+    Compara cenários em comum; regressão = p50/p95 maior ou vazão menor que a tolerância
+
+    Returns:
+        Uma linha por (cenário, métrica) com razão atual/base e flag `regressao`
+    """
+    linhas = []
+    for nome, resultado in atual.get("cenarios", {}).items():
+        referencia = base.get("cenarios", {}).get(nome)
+        if not referencia:
+            continue
+        for metrica, maior_pior in (("p50_ms", True), ("p95_ms", True), ("vazao_rps", False)):
+            antes, depois = referencia.get(metrica), resultado.get(metrica)
+            if not antes or depois is None:
+                continue
+            razao = depois / antes
+            regressao = razao > 1 + tolerancia if maior_pior else razao < 1 - tolerancia
+            linhas.append({
+                "cenario": nome, "metrica": metrica, "base": antes, "atual": depois,
+                "razao": round(razao, 3), "regressao": regressao
+            })
+    return linhas
@@ -0,0 +1,93 @@
+"""
+Latência do cache aproximado com muitas entradas
+
+    python -m benchmarks.similares
+    python -m benchmarks.similares --entradas 500000 --fator 2
+
+Grava prompts sintéticos, consulta variações (maiúsculas, pontuação, uma
+palavra trocada) e prompts novos, e falha se o p99 da consulta passar do
+orçamento ou se as variações não forem achadas.
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from llm_toolkit.core.similares import CacheSimilares
+
+ORCAMENTO_MS = 1.0
+# Fração mínima das variações de uma palavra que devem ser achadas
+ACERTO_MIN = 0.8
+
+_SILABAS = "ba be ca co da de fa ga go la le li ma me mo na ne pa po ra re sa se ta te to va ve".split()
+
+
+def _vocabulario(gerador: random.Random, tamanho: int = 5000) -> list:
+    return ["".join(gerador.choice(_SILABAS) for _ in range(gerador.randint(1, 4))) for _ in range(tamanho)]
+
+
+_PALAVRAS = _vocabulario(random.Random(3))
+
+
+def _prompt(gerador: random.Random) -> str:
+    return " ".join(gerador.choice(_PALAVRAS) for _ in range(gerador.randint(15, 40)))
+
+
+def _variacao(prompt: str, gerador: random.Random) -> str:
+    """Mesmo prompt com maiúsculas, pontuação e uma palavra trocada"""
+    palavras = prompt.split()
+    palavras[gerador.randrange(len(palavras))] = gerador.choice(_PALAVRAS)
+    return " ".join(palavras).capitalize() + "?"
+
+
+def _percentil(amostras: list, p: float) -> float:
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Mede consultas no cache aproximado")
+    parser.add_argument("--entradas", type=int, default=200_000)
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--limiar", type=float, default=0.85)
+    parser.add_argument("--fator", type=float, default=1.0, help="Multiplica o orçamento")
+    args = parser.parse_args()
+
+    gerador = random.Random(7)
+    cache = CacheSimilares(limiar=args.limiar, memoria_max=1 << 40)
+    prompts = [_prompt(gerador) for _ in range(args.entradas)]
+    inicio = time.perf_counter()
+    for i, prompt in enumerate(prompts):
+        cache.gravar(prompt, "ctx", f"resposta {i}")
+    gravacao = time.perf_counter() - inicio
+
+    tempos = {"variacao": [], "nova": []}
+    acertos = 0
+    for _ in range(args.consultas):
+        for tipo, prompt in (("variacao", _variacao(gerador.choice(prompts), gerador)),
+                             ("nova", _prompt(gerador))):
+            inicio = time.perf_counter()
+            achada = cache.obter(prompt, "ctx")
+            tempos[tipo].append((time.perf_counter() - inicio) * 1000)
+            acertos += tipo == "variacao" and achada is not None
+
+    stats = cache.estatisticas()
+    print(f"{args.entradas} entradas gravadas em {gravacao:.1f}s (~{stats['memoria_mb']} MB), "
+          f"LSH {stats['bandas']}x{stats['linhas']}")
+    limite = ORCAMENTO_MS * args.fator
+    falhas = 0
+    for tipo, amostras in tempos.items():
+        p50, p99 = statistics.median(amostras), _percentil(amostras, 0.99)
+        marca = "ok" if p99 <= limite else f"acima do orçamento de {limite:.2f} ms"
+        falhas += p99 > limite
+        print(f"{tipo:<10} p50 {p50:.3f} ms  p99 {p99:.3f} ms  {marca}")
+    taxa = acertos / args.consultas
+    falhas += taxa < ACERTO_MIN
+    print(f"variações achadas: {taxa:.1%} (mínimo {ACERTO_MIN:.0%})")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
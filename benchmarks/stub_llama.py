@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Executável falso do llama.cpp para benchmarks
+
+Responde como `llama-cli` (argumentos -p/-n, saída no stdout e tempos no
+stderr) ou, com `--port`, como `llama-server` (/health e /completion, com
+lote de prompts e streaming SSE). Como o llama.cpp, só conta como avaliado
+o trecho do prompt além do prefixo já guardado (--prompt-cache no
+llama-cli, KV do slot no llama-server). O comportamento vem do ambiente:
+
+    STUB_INICIO_MS   carga simulada do modelo (padrão 200)
+    STUB_TOKENS_SEG  velocidade de geração (padrão 50)
+    STUB_TOKENS      tokens por resposta, limitado por -n/n_predict (padrão 32)
+    STUB_FORMATO     eco | multilinha | marcadores | vazio (padrão multilinha)
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INICIO = int(os.getenv("STUB_INICIO_MS", "200")) / 1000
+TOKENS_SEG = float(os.getenv("STUB_TOKENS_SEG", "50"))
+TOKENS = int(os.getenv("STUB_TOKENS", "32"))
+FORMATO = os.getenv("STUB_FORMATO", "multilinha")
+
+
+def _argumento(args, nome, padrao=None):
+    return args[args.index(nome) + 1] if nome in args else padrao
+
+
+def _tokens(prompt: str, limite: int) -> list:
+    """Resposta no formato escolhido, já separada em tokens (palavras)"""
+    if FORMATO == "vazio":
+        return []
+    pergunta = prompt.split("Q:")[-1].split("\n")[0].split() or ["ok"]
+    palavras = [pergunta[i % len(pergunta)] for i in range(min(TOKENS, limite))]
+    if FORMATO == "marcadores":
+        palavras = ["Resposta:"] + palavras
+    elif FORMATO == "multilinha":
+        # Continuação que gerar_resposta descarta (só a primeira linha vale)
+        palavras[-1:] = [palavras[-1] + "\nQ:", "e", "depois?\nA:", "texto", "extra"] if palavras else []
+    return palavras
+
+
+def _parar(tokens: list, paradas: list) -> tuple:
+    """Corta os tokens na primeira sequência de parada (como o `stop` do llama-server)"""
+    texto = ""
+    for i, token in enumerate(tokens):
+        texto += token + " "
+        achadas = [texto.find(p) for p in paradas if p and p in texto.lstrip()]
+        if achadas:
+            return texto[:min(achadas)].strip(), i + 1, True
+    return " ".join(tokens), len(tokens), False
+
+
+def _reaproveitado(prompt: str, anterior: str) -> int:
+    """Palavras do início de `prompt` que já estavam no estado guardado"""
+    comum = 0
+    for nova, velha in zip(prompt.split(), anterior.split()):
+        if nova != velha:
+            break
+        comum += 1
+    return comum
+
+
+def _tempos(prompt: str, n: int, duracao: float, anterior: str = "") -> dict:
+    n_prompt = len(prompt.split()) - _reaproveitado(prompt, anterior)
+    return {"prompt_n": n_prompt, "prompt_ms": n_prompt * 0.5,
+            "predicted_n": n, "predicted_ms": duracao * 1000}
+
+
+def cli(args: list) -> int:
+    prompt = _argumento(args, "-p", "")
+    limite = int(_argumento(args, "-n", "256"))
+    cache = _argumento(args, "--prompt-cache")
+    anterior = ""
+    if cache and os.path.exists(cache):
+        with open(cache, encoding="utf-8") as f:
+            anterior = f.read()
+    if cache and "--prompt-cache-ro" not in args:
+        with open(cache, "w", encoding="utf-8") as f:
+            f.write(prompt)
+
+    inicio = time.perf_counter()
+    time.sleep(INICIO)
+    carga = time.perf_counter() - inicio
+    if "--no-display-prompt" not in args:
+        sys.stdout.write(prompt)
+    tokens = _tokens(prompt, limite)
+    comeco = time.perf_counter()
+    for token in tokens:
+        time.sleep(1 / TOKENS_SEG)
+        sys.stdout.write(token + " ")
+        sys.stdout.flush()
+
+    if "--log-disable" not in args:
+        t = _tempos(prompt, len(tokens), time.perf_counter() - comeco, anterior)
+        sys.stderr.write(
+            f"llama_perf_context_print:        load time = {carga * 1000:10.2f} ms\n"
+            f"llama_perf_context_print: prompt eval time = {t['prompt_ms']:10.2f} ms / {t['prompt_n']:5d} tokens\n"
+            f"llama_perf_context_print:        eval time = {t['predicted_ms']:10.2f} ms / {t['predicted_n']:5d} runs\n"
+            f"llama_perf_context_print:       total time = {(time.perf_counter() - inicio) * 1000:10.2f} ms\n"
+        )
+    return 0
+
+
+class _Servidor(BaseHTTPRequestHandler):
+    pronto = threading.Event()
+    slots = threading.Semaphore(1)
+    # Último prompt de cada slot (o KV que o cache_prompt reaproveita)
+    kv = {}
+
+    def _anterior(self, pedido: dict, prompt) -> str:
+        """Prompt anterior do slot pedido e registra o novo"""
+        if not isinstance(prompt, str) or not pedido.get("cache_prompt"):
+            return ""
+        slot = pedido.get("id_slot", 0)
+        anterior, self.kv[slot] = self.kv.get(slot, ""), prompt
+        return anterior
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status: int, corpo) -> None:
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._json(404, {"error": "not found"})
+        if not self.pronto.is_set():
+            return self._json(503, {"status": "loading model"})
+        self._json(200, {"status": "ok"})
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length", 0))
+        pedido = json.loads(self.rfile.read(tamanho) or b"{}")
+        prompt = pedido.get("prompt", "")
+        limite = int(pedido.get("n_predict", 256))
+        anterior = self._anterior(pedido, prompt)
+
+        if pedido.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            with self.slots:
+                comeco = time.perf_counter()
+                tokens = _tokens(prompt, limite)
+                for token in tokens:
+                    time.sleep(1 / TOKENS_SEG)
+                    evento = {"content": token + " ", "stop": False}
+                    self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode())
+                    self.wfile.flush()
+                fim = {"content": "", "stop": True,
+                       "timings": _tempos(prompt, len(tokens), time.perf_counter() - comeco, anterior)}
+                self.wfile.write(f"data: {json.dumps(fim)}\n\n".encode())
+            return
+
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        with self.slots:
+            # Slots paralelos: o lote custa o tempo da maior resposta
+            comeco = time.perf_counter()
+            respostas = [_parar(_tokens(p, limite), pedido.get("stop") or []) for p in prompts]
+            time.sleep(max((n for _, n, _ in respostas), default=0) / TOKENS_SEG)
+            duracao = time.perf_counter() - comeco
+        resultados = [
+            {"index": i, "content": texto, "tokens_predicted": n, "stopped_word": parou,
+             "timings": _tempos(p, n, duracao, anterior)}
+            for i, (p, (texto, n, parou)) in enumerate(zip(prompts, respostas))
+        ]
+        self._json(200, resultados if isinstance(prompt, list) else resultados[0])
+
+
+def servidor(args: list) -> int:
+    porta = int(_argumento(args, "--port"))
+    # Cada worker real atende um lote por vez (os slots decodificam juntos)
+    _Servidor.slots = threading.Semaphore(1)
+    http = ThreadingHTTPServer((_argumento(args, "--host", "127.0.0.1"), porta), _Servidor)
+    threading.Timer(INICIO, _Servidor.pronto.set).start()
+    try:
+        http.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    sys.exit(servidor(argumentos) if "--port" in argumentos else cli(argumentos))
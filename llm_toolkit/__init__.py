@@ -1,19 +1,44 @@
 """LLM Toolkit - Chat local com Gemma 2B"""
 
-from .core.llm import gerar_resposta
-from .api import GeradorLLM, obter_gerador, ClienteAPI
-from .client.models import RespostaCliente
-from .config import config
+from importlib import import_module
+
 from .constantes import *
 
+# Superfície pública carregada sob demanda: `from llm_toolkit import gerar_resposta`
+# não importa Flask, requests nem aiohttp
+_EXPORTS = {
+    "gerar_resposta": ".core.llm",
+    "gerar_resposta_async": ".core.llm",
+    "gerar_resposta_detalhada": ".core.llm",
+    "GeradorLLM": ".api.server",
+    "obter_gerador": ".api.server",
+    "ClienteAPI": ".client.api",
+    "ClienteAPIAsync": ".client.api_async",
+    "RespostaCliente": ".client.models",
+    "config": ".config",
+}
+
 __all__ = [
     "gerar_resposta",
+    "gerar_resposta_async",
+    "gerar_resposta_detalhada",
     "GeradorLLM",
     "obter_gerador",
     "ClienteAPI",
+    "ClienteAPIAsync",
     "RespostaCliente",
     "config"
 ]
 __version__ = "1.0.0"
 
 
+def __getattr__(nome: str):
+    if nome not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    valor = getattr(import_module(_EXPORTS[nome], __name__), nome)
+    globals()[nome] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
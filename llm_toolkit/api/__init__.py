@@ -1,7 +1,14 @@
 """API - Exports públicas para servidor e cliente"""
 
-from .server import GeradorLLM, obter_gerador, resetar_gerador
-from .client import ClienteAPI
+from importlib import import_module
+
+# Carregados sob demanda (o cliente puxa requests; o gerador, o llama.cpp)
+_EXPORTS = {
+    "GeradorLLM": ".server",
+    "obter_gerador": ".server",
+    "resetar_gerador": ".server",
+    "ClienteAPI": ".client",
+}
 
 __all__ = [
     "GeradorLLM",
@@ -9,3 +16,15 @@ __all__ = [
     "resetar_gerador",
     "ClienteAPI"
 ]
+
+
+def __getattr__(nome: str):
+    if nome not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    valor = getattr(import_module(_EXPORTS[nome], __name__), nome)
+    globals()[nome] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,11 +1,19 @@
 """API Server - Geração de respostas LLM"""
 
-from functools import lru_cache
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from contextlib import nullcontext
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
 import logging
+import time
 
-from ..core.llm import gerar_resposta
+from ..core.llm import (gerar_resposta_detalhada, gerar_resposta_detalhada_async, gerar_resposta_stream,
+                        gerar_resposta_stream_async, gerar_turno, sessoes, tokens_prompt)
 from ..client.models import RespostaCliente
+from ..config import config
+from ..core.agendador import Admissao, FilaCheia
+from ..core.coalescencia import obter_coalescencia
+from ..core.historico import Historico
+from ..core.perfil import ativar, fase, rastreio_atual
 from ..constantes import *
 
 logger = logging.getLogger(__name__)
@@ -17,61 +25,421 @@ class GeradorLLM:
     def __init__(self, temp: float = 0.7, tokens: int = 256):
         self.temp = max(TEMPERATURA_MIN, min(TEMPERATURA_MAX, float(temp)))
         self.tokens = max(TOKEN_MIN, min(TOKEN_MAX, int(tokens)))
-        self.historico = []
+        self.historico = Historico(
+            capacidade=config.historico.capacidade,
+            arquivo=config.historico.arquivo or None,
+            retencao=config.historico.retencao
+        )
         logger.info(f"GeradorLLM: temp={self.temp}, tokens={self.tokens}")
     
     @staticmethod
-    @lru_cache(maxsize=128)
-    def _validar_prompt(prompt: str) -> tuple[bool, Optional[str]]:
-        """Valida prompt com cache"""
+    def _validar_prompt(prompt: str, modelo: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+        """
+        Valida prompt (e o nome do modelo)
+        
+        Sem cache aqui: a contagem depende do vocabulário do modelo e do
+        system.txt, e o tokenizador já guarda a contagem por texto montado.
+        """
         if not prompt or not isinstance(prompt, str):
             return False, ERRO_PROMPT_VAZIO
-        if len(prompt) > PROMPT_MAX_LENGTH:
-            return False, ERRO_PROMPT_LONGO
+        try:
+            usados = tokens_prompt(prompt, modelo)
+        except ValueError as e:
+            return False, str(e)
+        if usados is None:
+            # Sem o vocabulário do modelo: limite por caracteres
+            if len(prompt) > PROMPT_MAX_LENGTH:
+                return False, ERRO_PROMPT_LONGO
+        elif usados >= config.llm.contexto:
+            return False, ERRO_PROMPT_CONTEXTO.format(tokens=usados, contexto=config.llm.contexto)
         return True, None
     
+    def _parametros(self, temp: Optional[float], tokens: Optional[int]) -> Tuple[float, int]:
+        """Aplica limites ou usa os padrões da instância"""
+        temp_final = max(TEMPERATURA_MIN, min(TEMPERATURA_MAX, temp)) if temp is not None else self.temp
+        tokens_final = max(TOKEN_MIN, min(TOKEN_MAX, tokens)) if tokens is not None else self.tokens
+        return temp_final, tokens_final
+    
+    @staticmethod
+    def _chave_voo(prompt: str, temp: float, tokens: int, modelo: Optional[str]) -> Optional[Tuple]:
+        """Chave de coalescência; None se a geração não pode ser compartilhada (temperatura > 0)"""
+        if not config.llm.coalescer or temp != 0:
+            return None
+        return prompt.strip(), tokens, modelo or config.llm.modelo_padrao
+    
     def gerar(self, prompt: str, temp: Optional[float] = None,
-              tokens: Optional[int] = None) -> RespostaCliente:
-        """Gera resposta com validação"""
+              tokens: Optional[int] = None, modelo: Optional[str] = None,
+              admissao: Optional[Admissao] = None) -> RespostaCliente:
+        """
+        Gera resposta com validação (`modelo`: nome no registro; None = padrão)
+        
+        Com temperatura 0, chamadas iguais simultâneas esperam a geração
+        da primeira (LLM_COALESCER); `fim["coalescida"]` marca as que esperaram.
+        Só quem gera reserva a vaga de `admissao` (FilaCheia chega ao chamador).
+        """
         # Validar
-        valido, erro = self._validar_prompt(prompt)
+        valido, erro = self._validar_prompt(prompt, modelo)
+        if not valido:
+            logger.error(f"Validação falhou: {erro}")
+            return RespostaCliente(sucesso=False, erro=erro)
+        
+        temp_final, tokens_final = self._parametros(temp, tokens)
+        
+        try:
+            logger.info(LOG_GERACAO_INICIADA.format(prompt=prompt[:50]))
+            chave = self._chave_voo(prompt, temp_final, tokens_final, modelo)
+            
+            def gerar():
+                with admissao.vaga() if admissao else nullcontext():
+                    return gerar_resposta_detalhada(prompt, temp=temp_final, tokens=tokens_final, modelo=modelo)
+            
+            if chave is None:
+                resposta, fim = gerar()
+            else:
+                (resposta, fim), coalescida = obter_coalescencia().executar(
+                    chave, gerar, admissao.dispensar if admissao else None)
+                if coalescida:
+                    fim = {**fim, "coalescida": True}
+            return self._concluir(prompt, resposta, temp_final, tokens_final, fim, modelo)
+        except FilaCheia:
+            raise
+        except Exception as e:
+            logger.error(LOG_GERACAO_ERRO.format(erro=e))
+            return RespostaCliente(sucesso=False, erro=str(e)[:100])
+    
+    async def gerar_async(self, prompt: str, temp: Optional[float] = None,
+                          tokens: Optional[int] = None, modelo: Optional[str] = None,
+                          admissao: Optional[Admissao] = None) -> RespostaCliente:
+        """Como `gerar`, sem bloquear o event loop"""
+        valido, erro = self._validar_prompt(prompt, modelo)
         if not valido:
             logger.error(f"Validação falhou: {erro}")
             return RespostaCliente(sucesso=False, erro=erro)
         
-        # Parâmetros
-        temp_final = max(TEMPERATURA_MIN, min(TEMPERATURA_MAX, temp)) if temp else self.temp
-        tokens_final = max(TOKEN_MIN, min(TOKEN_MAX, tokens)) if tokens else self.tokens
+        temp_final, tokens_final = self._parametros(temp, tokens)
         
         try:
             logger.info(LOG_GERACAO_INICIADA.format(prompt=prompt[:50]))
-            resposta = gerar_resposta(prompt, temp=temp_final, tokens=tokens_final)
+            chave = self._chave_voo(prompt, temp_final, tokens_final, modelo)
             
-            # Verificar erros
-            if any(resposta.startswith(x) for x in ["Erro:", "Falta", "Timeout"]):
-                return RespostaCliente(sucesso=False, erro=resposta)
+            async def gerar():
+                async with admissao.vaga_async() if admissao else nullcontext():
+                    return await gerar_resposta_detalhada_async(prompt, temp=temp_final, tokens=tokens_final,
+                                                                modelo=modelo)
             
-            # Registrar
-            self.historico.append({
+            if chave is None:
+                resposta, fim = await gerar()
+            else:
+                (resposta, fim), coalescida = await obter_coalescencia().executar_async(
+                    chave, gerar, admissao.dispensar if admissao else None)
+                if coalescida:
+                    fim = {**fim, "coalescida": True}
+            return self._concluir(prompt, resposta, temp_final, tokens_final, fim, modelo)
+        except FilaCheia:
+            raise
+        except Exception as e:
+            logger.error(LOG_GERACAO_ERRO.format(erro=e))
+            return RespostaCliente(sucesso=False, erro=str(e)[:100])
+    
+    def gerar_turno(self, sessao: str, prompt: str, temp: Optional[float] = None,
+                    tokens: Optional[int] = None) -> RespostaCliente:
+        """Acrescenta um turno à sessão `sessao` (KeyError se ela não existe ou expirou)"""
+        if not prompt or not isinstance(prompt, str):
+            return RespostaCliente(sucesso=False, erro=ERRO_PROMPT_VAZIO)
+        atual = sessoes().obter(sessao)
+        temp_final, tokens_final = self._parametros(temp, tokens)
+        
+        try:
+            logger.info(LOG_GERACAO_INICIADA.format(prompt=prompt[:50]))
+            resposta, fim = gerar_turno(atual, prompt, temp=temp_final, tokens=tokens_final)
+            return self._concluir(prompt, resposta, temp_final, tokens_final, fim, atual.modelo, atual.id)
+        except Exception as e:
+            logger.error(LOG_GERACAO_ERRO.format(erro=e))
+            return RespostaCliente(sucesso=False, erro=str(e)[:100])
+    
+    def _concluir(self, prompt: str, resposta: str, temp: float, tokens: int,
+                  fim: Optional[Dict] = None, modelo: Optional[str] = None,
+                  sessao: Optional[str] = None) -> RespostaCliente:
+        """Converte a resposta do llama.cpp e registra no histórico"""
+        # Verificar erros
+        if any(resposta.startswith(x) for x in ["Erro:", "Falta", "Timeout"]):
+            return RespostaCliente(sucesso=False, erro=resposta, fim=fim)
+        
+        # Registrar
+        with fase("historico"):
+            self.historico.registrar({
                 "prompt": prompt,
                 "resposta": resposta,
-                "temperatura": temp_final,
-                "tokens": tokens_final
+                "temperatura": temp,
+                "tokens": tokens,
+                **({"modelo": modelo} if modelo else {}),
+                **({"sessao": sessao} if sessao else {})
             })
-            
-            logger.info(LOG_GERACAO_SUCESSO)
-            return RespostaCliente(sucesso=True, dados=resposta)
+        
+        logger.info(LOG_GERACAO_SUCESSO)
+        return RespostaCliente(sucesso=True, dados=resposta, fim=fim)
+    
+    def gerar_multiplo(self, prompts: List[str], temp: Optional[float] = None,
+                       tokens: Optional[int] = None, max_paralelo: Optional[int] = None,
+                       timeout_item: Optional[float] = None,
+                       prioridade: Optional[str] = None,
+                       modelo: Optional[str] = None) -> List[RespostaCliente]:
+        """
+        Gera várias respostas em paralelo, na mesma ordem dos prompts
+        
+        Args:
+            max_paralelo: Gerações simultâneas do lote (limitado a config.llm.max_paralelo)
+            timeout_item: Tempo máximo de cada item a partir do seu início
+            prioridade: Se informada, cada item passa pelo agendador global
+        
+        Returns:
+            Uma RespostaCliente por prompt; falhas e timeouts são reportados por item
+        """
+        if not prompts:
+            return []
+        
+        limite = config.llm.max_paralelo
+        paralelo = max(1, min(limite, max_paralelo or limite, len(prompts)))
+        timeout_item = timeout_item or config.llm.timeout_item
+        # Marca o início de cada item: ao sair da fila do agendador (ou ao começar, sem prioridade)
+        admissoes = [Admissao(prioridade, forcar=True) for _ in prompts]
+        # Itens somam suas fases no rastreio da requisição (tempo acumulado)
+        rastreio = rastreio_atual()
+        
+        def _executar(indice: int, prompt: str) -> RespostaCliente:
+            admissao = admissoes[indice]
+            with ativar(rastreio):
+                if prioridade is None:
+                    admissao.dispensar()
+                    return self.gerar(prompt, temp, tokens, modelo)
+                # Lote já admitido: itens esperam vaga sem contar na capacidade da fila
+                return self.gerar(prompt, temp, tokens, modelo, admissao=admissao)
+        
+        executor = ThreadPoolExecutor(max_workers=paralelo, thread_name_prefix="gerar-multiplo")
+        futuros = []
+        try:
+            futuros = [executor.submit(_executar, i, p) for i, p in enumerate(prompts)]
+            for futuro, admissao in zip(futuros, admissoes):
+                # Item que termina (ou é cancelado) sem sair da fila não prende a espera
+                futuro.add_done_callback(lambda _, a=admissao: a.dispensar())
+            return [
+                self._aguardar_item(futuro, admissoes[i], i, timeout_item)
+                for i, futuro in enumerate(futuros)
+            ]
+        finally:
+            # Não bloqueia em itens que estouraram o tempo; os que nem começaram são cancelados
+            # (o mesmo que shutdown(cancel_futures=True), que só existe a partir do Python 3.9)
+            for futuro in futuros:
+                futuro.cancel()
+            executor.shutdown(wait=False)
+    
+    async def gerar_multiplo_async(self, prompts: List[str], temp: Optional[float] = None,
+                                   tokens: Optional[int] = None, max_paralelo: Optional[int] = None,
+                                   timeout_item: Optional[float] = None,
+                                   prioridade: Optional[str] = None,
+                                   modelo: Optional[str] = None) -> List[RespostaCliente]:
+        """
+        Como `gerar_multiplo`, com corrotinas no lugar das threads
+        
+        Aqui o item que estoura `timeout_item` é cancelado (encerra o llama-cli
+        ou a conexão com o worker); na versão com threads ele segue até o fim
+        em segundo plano, só a resposta é dada como timeout.
+        """
+        import asyncio
+        
+        if not prompts:
+            return []
+        
+        limite = config.llm.max_paralelo
+        semaforo = asyncio.Semaphore(max(1, min(limite, max_paralelo or limite, len(prompts))))
+        timeout_item = timeout_item or config.llm.timeout_item
+        
+        async def _executar(prompt: str) -> RespostaCliente:
+            # O timeout conta a partir do início do item (fora da fila), como na versão com threads
+            async with semaforo:
+                admissao = Admissao(prioridade, forcar=True)
+                tarefa = asyncio.ensure_future(self.gerar_async(
+                    prompt, temp, tokens, modelo, admissao=admissao if prioridade is not None else None))
+                tarefa.add_done_callback(lambda _: admissao.dispensar())
+                if prioridade is None:
+                    admissao.dispensar()
+                try:
+                    await admissao.esperar_async()
+                    restante = admissao.inicio + timeout_item - time.monotonic()
+                    await asyncio.wait((tarefa,), timeout=max(0.0, restante))
+                    if not tarefa.done():
+                        logger.error(f"Item excedeu {timeout_item}s")
+                        return RespostaCliente(sucesso=False, erro=f"Timeout ({timeout_item}s)")
+                    try:
+                        return tarefa.result()
+                    except Exception as e:
+                        logger.error(LOG_GERACAO_ERRO.format(erro=e))
+                        return RespostaCliente(sucesso=False, erro=str(e)[:100])
+                finally:
+                    tarefa.cancel()
+        
+        # Tarefas herdam o contexto: as fases dos itens vão para o rastreio da requisição
+        return list(await asyncio.gather(*(_executar(p) for p in prompts)))
+    
+    @staticmethod
+    def _aguardar_item(futuro, admissao: Admissao, indice: int, timeout_item: float) -> RespostaCliente:
+        """
+        Aguarda um item contando o timeout a partir de quando ele saiu da fila
+        
+        Threads não podem ser interrompidas: o item que estoura o tempo segue
+        gerando em segundo plano (e ocupando a vaga) até terminar.
+        """
+        admissao.esperar()
+        try:
+            return futuro.result(timeout=max(0.0, admissao.inicio + timeout_item - time.monotonic()))
+        except FuturoTimeout:
+            logger.error(f"Item {indice} excedeu {timeout_item}s")
+            return RespostaCliente(sucesso=False, erro=f"Timeout ({timeout_item}s)")
         except Exception as e:
             logger.error(LOG_GERACAO_ERRO.format(erro=e))
             return RespostaCliente(sucesso=False, erro=str(e)[:100])
     
+    def gerar_stream(self, prompt: str, temp: Optional[float] = None,
+                     tokens: Optional[int] = None, modelo: Optional[str] = None,
+                     admissao: Optional[Admissao] = None) -> Iterator[str]:
+        """
+        Gera resposta em blocos (ValueError se o prompt ou o modelo for inválido)
+        
+        Com temperatura 0, streams iguais simultâneos compartilham a geração:
+        quem chega depois recebe os blocos já produzidos e segue junto.
+        Só quem inicia a geração reserva a vaga de `admissao`, já nesta
+        chamada (FilaCheia chega ao chamador, que devolve a vaga ao terminar).
+        """
+        valido, erro = self._validar_prompt(prompt, modelo)
+        if not valido:
+            logger.error(f"Validação falhou: {erro}")
+            raise ValueError(erro)
+        
+        temp_final, tokens_final = self._parametros(temp, tokens)
+        logger.info(LOG_GERACAO_INICIADA.format(prompt=prompt[:50]))
+        blocos = self._blocos(prompt, temp_final, tokens_final, modelo, admissao)
+        return self._stream_com_historico(prompt, temp_final, tokens_final, modelo, blocos)
+    
+    def _stream_com_historico(self, prompt: str, temp: float, tokens: int,
+                              modelo: Optional[str], blocos: Iterator[str]) -> Iterator[str]:
+        """Repassa blocos e registra a resposta completa ao final"""
+        partes = []
+        try:
+            for bloco in blocos:
+                partes.append(bloco)
+                yield bloco
+        finally:
+            blocos.close()
+        
+        self.historico.registrar({
+            "prompt": prompt,
+            "resposta": "".join(partes).strip(),
+            "temperatura": temp,
+            "tokens": tokens,
+            **({"modelo": modelo} if modelo else {})
+        })
+        logger.info(LOG_GERACAO_SUCESSO)
+    
+    async def gerar_stream_async(self, prompt: str, temp: Optional[float] = None,
+                                 tokens: Optional[int] = None, modelo: Optional[str] = None,
+                                 admissao: Optional[Admissao] = None) -> AsyncIterator[str]:
+        """
+        Como `gerar_stream`, para `async for` (ValueError se o prompt ou o modelo for inválido)
+        
+        `async for bloco in await gerador.gerar_stream_async(...)`: a vaga de
+        quem inicia a geração é reservada antes de a chamada retornar.
+        """
+        valido, erro = self._validar_prompt(prompt, modelo)
+        if not valido:
+            logger.error(f"Validação falhou: {erro}")
+            raise ValueError(erro)
+        
+        temp_final, tokens_final = self._parametros(temp, tokens)
+        logger.info(LOG_GERACAO_INICIADA.format(prompt=prompt[:50]))
+        blocos = await self._blocos_async(prompt, temp_final, tokens_final, modelo, admissao)
+        return self._stream_com_historico_async(prompt, temp_final, tokens_final, modelo, blocos)
+    
+    async def _stream_com_historico_async(self, prompt: str, temp: float, tokens: int,
+                                          modelo: Optional[str], blocos: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Repassa blocos e registra a resposta completa ao final"""
+        partes = []
+        try:
+            async for bloco in blocos:
+                partes.append(bloco)
+                yield bloco
+        finally:
+            await blocos.aclose()
+        
+        self.historico.registrar({
+            "prompt": prompt,
+            "resposta": "".join(partes).strip(),
+            "temperatura": temp,
+            "tokens": tokens,
+            **({"modelo": modelo} if modelo else {})
+        })
+        logger.info(LOG_GERACAO_SUCESSO)
+    
+    def _blocos(self, prompt: str, temp: float, tokens: int, modelo: Optional[str],
+                admissao: Optional[Admissao] = None) -> Iterator[str]:
+        """Stream do llama.cpp, compartilhado com chamadas iguais em andamento quando possível"""
+        def gerar():
+            if admissao is None:
+                return gerar_resposta_stream(prompt, temp=temp, tokens=tokens, modelo=modelo)
+            admissao.adquirir()
+            try:
+                return gerar_resposta_stream(prompt, temp=temp, tokens=tokens, modelo=modelo)
+            except BaseException:
+                admissao.liberar(medir=False)
+                raise
+        
+        chave = self._chave_voo(prompt, temp, tokens, modelo)
+        if chave is None:
+            return gerar()
+        blocos = obter_coalescencia().transmitir(chave, gerar)
+        if admissao is not None and blocos.coalescida:
+            # Outra igual começou enquanto esperávamos a vaga: seguimos a dela
+            admissao.liberar(medir=False)
+        return blocos
+    
+    async def _blocos_async(self, prompt: str, temp: float, tokens: int, modelo: Optional[str],
+                            admissao: Optional[Admissao] = None) -> AsyncIterator[str]:
+        """Como `_blocos`: a transmissão só é publicada depois que a vaga foi reservada"""
+        async def gerar():
+            if admissao is None:
+                return gerar_resposta_stream_async(prompt, temp=temp, tokens=tokens, modelo=modelo)
+            await admissao.adquirir_async()
+            try:
+                return gerar_resposta_stream_async(prompt, temp=temp, tokens=tokens, modelo=modelo)
+            except BaseException:
+                admissao.liberar(medir=False)
+                raise
+        
+        chave = self._chave_voo(prompt, temp, tokens, modelo)
+        if chave is None:
+            return await gerar()
+        try:
+            blocos = await obter_coalescencia().transmitir_async(chave, gerar)
+        except BaseException:
+            if admissao is not None:
+                admissao.liberar(medir=False)
+            raise
+        if admissao is not None and blocos.coalescida:
+            # Outra igual começou enquanto esperávamos a vaga: seguimos a dela
+            admissao.liberar(medir=False)
+        return blocos
+    
     def obter_historico(self, ultimos: int = HISTORICO_PADRAO) -> List[Dict]:
         """Obtém histórico"""
-        return self.historico[-ultimos:]
+        return self.historico.ultimos(ultimos)
+    
+    def listar_historico(self, limite: int = HISTORICO_PADRAO, cursor: Optional[int] = None,
+                         busca: Optional[str] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Página do histórico anterior a `cursor` (ver Historico.listar)"""
+        return self.historico.listar(limite, cursor, busca)
     
     def limpar_historico(self) -> None:
         """Limpa histórico"""
-        self.historico.clear()
+        self.historico.limpar()
         logger.info("Histórico limpo")
 
 
@@ -1,7 +1,24 @@
 """Cliente Python para interagir com a API REST"""
 
-from .models import RespostaCliente
-from .api import ClienteAPI
+from importlib import import_module
 
-__all__ = ["ClienteAPI", "RespostaCliente"]
+# Carregados sob demanda: ClienteAPI puxa requests e ClienteAPIAsync, aiohttp
+_EXPORTS = {
+    "ClienteAPI": ".api",
+    "ClienteAPIAsync": ".api_async",
+    "RespostaCliente": ".models",
+}
 
+__all__ = ["ClienteAPI", "ClienteAPIAsync", "RespostaCliente"]
+
+
+def __getattr__(nome: str):
+    if nome not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    valor = getattr(import_module(_EXPORTS[nome], __name__), nome)
+    globals()[nome] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,8 +1,9 @@
 """Cliente REST compacto e eficiente"""
 
-from typing import List, Dict
+import math
+from typing import Iterator, List, Dict, Optional
 from .models import RespostaCliente
-from .http import get, post
+from .http import delete, get, post, post_stream
 
 
 class ClienteAPI:
@@ -15,10 +16,12 @@ class ClienteAPI:
                  dados: Dict = None, timeout: int = 120) -> RespostaCliente:
         """Chamada genérica (DRY)"""
         url = f"{self.url_base}{endpoint}"
-        resposta_json = (
-            post(url, dados, timeout) if metodo == "POST" 
-            else get(url, dados, timeout)
-        )
+        if metodo == "POST":
+            resposta_json = post(url, dados, timeout)
+        elif metodo == "DELETE":
+            resposta_json = delete(url, timeout)
+        else:
+            resposta_json = get(url, dados, timeout)
         
         if not resposta_json:
             return RespostaCliente(sucesso=False, erro="Falha na requisição")
@@ -27,7 +30,8 @@ class ClienteAPI:
             sucesso=resposta_json.get('sucesso', False),
             dados=resposta_json.get('dados'),
             erro=resposta_json.get('erro'),
-            timestamp=resposta_json.get('timestamp')
+            timestamp=resposta_json.get('timestamp'),
+            fim=resposta_json.get('fim')
         )
     
     def verificar_saude(self) -> bool:
@@ -35,41 +39,132 @@ class ClienteAPI:
         resposta = self._chamada("/health", timeout=5)
         return resposta.sucesso
     
+    @staticmethod
+    def _corpo(prompt: str, temperatura: float, tokens: int, modelo: Optional[str]) -> Dict:
+        """Corpo de /gerar e /gerar-stream (`modelo` só quando escolhido)"""
+        dados = {"prompt": prompt, "temperatura": temperatura, "tokens": tokens}
+        if modelo:
+            dados["modelo"] = modelo
+        return dados
+    
     def gerar(self, prompt: str, temperatura: float = 0.7, 
-              tokens: int = 256) -> RespostaCliente:
-        """Gera resposta"""
+              tokens: int = 256, modelo: Optional[str] = None) -> RespostaCliente:
+        """Gera resposta (`modelo`: nome no registro do servidor; None = padrão)"""
         return self._chamada(
             "/gerar",
             "POST",
-            {"prompt": prompt, "temperatura": temperatura, "tokens": tokens}
+            self._corpo(prompt, temperatura, tokens, modelo)
         )
     
+    def gerar_stream(self, prompt: str, temperatura: float = 0.7,
+                     tokens: int = 256, modelo: Optional[str] = None) -> Iterator[str]:
+        """
+        Gera resposta em blocos via /gerar-stream
+        
+        Raises:
+            RuntimeError: erro reportado pela API
+            ConnectionError: falha de rede
+        """
+        for evento, dados in post_stream(
+            f"{self.url_base}/gerar-stream",
+            self._corpo(prompt, temperatura, tokens, modelo)
+        ):
+            if evento == "erro":
+                raise RuntimeError(dados.get("erro") or "Falha na requisição")
+            if "token" in dados:
+                yield dados["token"]
+    
     def gerar_multiplo(self, prompts: List[str], temperatura: float = 0.7,
-                       tokens: int = 256) -> List[RespostaCliente]:
-        """Gera múltiplas respostas"""
-        resposta = self._chamada(
-            "/gerar-multiplo",
-            "POST",
-            {"prompts": prompts, "temperatura": temperatura, "tokens": tokens},
-            timeout=300
-        )
+                       tokens: int = 256, max_paralelo: Optional[int] = None,
+                       timeout_item: Optional[int] = None,
+                       modelo: Optional[str] = None) -> List[RespostaCliente]:
+        """
+        Gera múltiplas respostas (executadas em paralelo no servidor)
+        
+        Returns:
+            Uma resposta por prompt, na mesma ordem; falhas vêm por item
+        """
+        dados = {"prompts": prompts, "temperatura": temperatura, "tokens": tokens}
+        if max_paralelo:
+            dados["max_paralelo"] = max_paralelo
+        if timeout_item:
+            dados["timeout_item"] = timeout_item
+        if modelo:
+            dados["modelo"] = modelo
+        
+        # Lote inteiro: ondas de `max_paralelo` itens, cada uma até `timeout_item`
+        ondas = math.ceil(len(prompts) / max_paralelo) if max_paralelo else len(prompts)
+        timeout = max(300, (timeout_item or 120) * max(1, ondas) + 30)
+        
+        resposta = self._chamada("/gerar-multiplo", "POST", dados, timeout=timeout)
         
         if not resposta.sucesso:
             return [resposta]
         
-        # Parse da resposta formatada
+        dados = resposta.dados
+        if not isinstance(dados, list):
+            return [resposta]
         try:
-            import json
-            dados = json.loads(resposta.dados) if isinstance(resposta.dados, str) else resposta.dados
-            return [RespostaCliente(**item) for item in dados] if isinstance(dados, list) else [resposta]
-        except:
+            return [RespostaCliente(**item) for item in dados]
+        except TypeError:
             return [resposta]
     
+    def listar_modelos(self) -> Dict:
+        """Modelos do servidor com residência e contadores ({} se indisponível)"""
+        resposta = self._chamada("/modelos", timeout=5)
+        return resposta.dados if resposta.sucesso else {}
+    
+    def criar_sessao(self, modelo: Optional[str] = None) -> Optional[str]:
+        """Abre uma sessão de conversa no servidor; retorna o id (None se falhou)"""
+        resposta = self._chamada("/sessoes", "POST", {"modelo": modelo} if modelo else {}, timeout=10)
+        return resposta.dados.get("id") if resposta.sucesso else None
+    
+    def enviar_turno(self, sessao: str, prompt: str, temperatura: float = 0.7,
+                     tokens: int = 256) -> RespostaCliente:
+        """
+        Acrescenta um turno à sessão: só o prompt novo é enviado e avaliado
+        
+        `fim["tokens_avaliados"]` traz os tokens de prompt que o modelo
+        processou neste turno (o resto da conversa já estava no KV).
+        """
+        return self._chamada(
+            f"/sessoes/{sessao}/turnos",
+            "POST",
+            {"prompt": prompt, "temperatura": temperatura, "tokens": tokens}
+        )
+    
+    def obter_sessao(self, sessao: str) -> Dict:
+        """Sessão com a conversa até aqui ({} se não existe ou expirou)"""
+        resposta = self._chamada(f"/sessoes/{sessao}", timeout=5)
+        return resposta.dados if resposta.sucesso else {}
+    
+    def encerrar_sessao(self, sessao: str) -> bool:
+        """Encerra a sessão e libera seu estado no servidor"""
+        resposta = self._chamada(f"/sessoes/{sessao}", "DELETE", timeout=5)
+        return resposta.sucesso
+    
     def obter_historico(self, ultimos: int = 10) -> List[Dict]:
         """Obtém histórico"""
         resposta = self._chamada("/historico", "GET", {"ultimos": ultimos}, timeout=5)
         return resposta.dados if resposta.sucesso else []
     
+    def paginar_historico(self, limite: int = 50, busca: str = None) -> Iterator[Dict]:
+        """Percorre o histórico do mais recente ao mais antigo, página a página"""
+        cursor = None
+        while True:
+            params = {"limite": limite}
+            if cursor:
+                params["cursor"] = cursor
+            if busca:
+                params["busca"] = busca
+            resposta = get(f"{self.url_base}/historico", params, timeout=5)
+            if not resposta or not resposta.get("sucesso"):
+                return
+            yield from reversed(resposta.get("dados") or [])
+            cursor = resposta.get("proximo_cursor")
+            if not cursor:
+                return
+    
     def limpar_historico(self) -> bool:
         """Limpa histórico"""
         resposta = self._chamada("/limpar-historico", "POST", timeout=5)
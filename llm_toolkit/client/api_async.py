@@ -0,0 +1,248 @@
+"""Cliente REST assíncrono (asyncio + aiohttp) com conexões persistentes"""
+
+import asyncio
+import json
+import logging
+import math
+from typing import AsyncIterator, Dict, List, Optional
+
+from .models import RespostaCliente
+
+try:
+    import aiohttp
+except ImportError:  # dependência opcional: pip install llm-toolkit[async]
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+class ClienteAPIAsync:
+    """
+    Mesma interface do ClienteAPI, mas com corrotinas
+
+    Uma única sessão mantém as conexões keep-alive; um semáforo limita
+    as requisições simultâneas. Use como `async with ClienteAPIAsync() as c:`
+    ou chame `fechar()` ao final.
+    """
+
+    def __init__(self, url_base: str = "http://127.0.0.1:5000",
+                 max_conexoes: int = 10, timeout: float = 120):
+        if aiohttp is None:
+            raise ImportError("ClienteAPIAsync requer aiohttp: pip install aiohttp")
+        self.url_base = url_base.rstrip('/')
+        self.max_conexoes = max_conexoes
+        self.timeout = timeout
+        self._semaforo = asyncio.Semaphore(max_conexoes)
+        self._sessao = None
+
+    async def __aenter__(self) -> "ClienteAPIAsync":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.fechar()
+
+    def _obter_sessao(self) -> "aiohttp.ClientSession":
+        """Sessão criada no primeiro uso (dentro do event loop)"""
+        if self._sessao is None or self._sessao.closed:
+            conector = aiohttp.TCPConnector(limit=self.max_conexoes, keepalive_timeout=60)
+            self._sessao = aiohttp.ClientSession(connector=conector)
+        return self._sessao
+
+    async def fechar(self) -> None:
+        """Fecha a sessão e suas conexões"""
+        if self._sessao is not None and not self._sessao.closed:
+            await self._sessao.close()
+        self._sessao = None
+
+    async def _chamada(self, endpoint: str, metodo: str = "GET",
+                       dados: Dict = None, timeout: float = None) -> RespostaCliente:
+        """Chamada genérica (mesmo contrato do ClienteAPI._chamada)"""
+        url = f"{self.url_base}{endpoint}"
+        kwargs = {"json": dados} if metodo == "POST" else {"params": dados}
+
+        try:
+            async with self._semaforo:
+                resposta_json = await asyncio.wait_for(
+                    self._requisicao(metodo, url, **kwargs),
+                    timeout=timeout or self.timeout
+                )
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout na requisição {metodo} {url}")
+            return RespostaCliente(sucesso=False, erro="Timeout na requisição")
+        except aiohttp.ClientError as e:
+            logger.error(f"Erro na requisição {metodo} {url}: {e}")
+            resposta_json = None
+
+        if not resposta_json:
+            return RespostaCliente(sucesso=False, erro="Falha na requisição")
+
+        return RespostaCliente(
+            sucesso=resposta_json.get('sucesso', False),
+            dados=resposta_json.get('dados'),
+            erro=resposta_json.get('erro'),
+            timestamp=resposta_json.get('timestamp'),
+            fim=resposta_json.get('fim')
+        )
+
+    async def _requisicao(self, metodo: str, url: str, **kwargs) -> Optional[Dict]:
+        async with self._obter_sessao().request(metodo, url, **kwargs) as resp:
+            return await resp.json() if resp.ok else None
+
+    async def verificar_saude(self) -> bool:
+        """Verifica disponibilidade"""
+        resposta = await self._chamada("/health", timeout=5)
+        return resposta.sucesso
+
+    @staticmethod
+    def _corpo(prompt: str, temperatura: float, tokens: int, modelo: Optional[str]) -> Dict:
+        """Corpo de /gerar e /gerar-stream (`modelo` só quando escolhido)"""
+        dados = {"prompt": prompt, "temperatura": temperatura, "tokens": tokens}
+        if modelo:
+            dados["modelo"] = modelo
+        return dados
+
+    async def gerar(self, prompt: str, temperatura: float = 0.7,
+                    tokens: int = 256, modelo: Optional[str] = None) -> RespostaCliente:
+        """Gera resposta (`modelo`: nome no registro do servidor; None = padrão)"""
+        return await self._chamada(
+            "/gerar",
+            "POST",
+            self._corpo(prompt, temperatura, tokens, modelo)
+        )
+
+    async def gerar_varios(self, prompts: List[str], temperatura: float = 0.7,
+                           tokens: int = 256, modelo: Optional[str] = None) -> List[RespostaCliente]:
+        """Fan-out no cliente: um /gerar por prompt, concorrentes, na ordem de entrada"""
+        return list(await asyncio.gather(
+            *(self.gerar(p, temperatura, tokens, modelo) for p in prompts)
+        ))
+
+    async def gerar_multiplo(self, prompts: List[str], temperatura: float = 0.7,
+                             tokens: int = 256, max_paralelo: Optional[int] = None,
+                             timeout_item: Optional[int] = None,
+                             modelo: Optional[str] = None) -> List[RespostaCliente]:
+        """Gera múltiplas respostas via /gerar-multiplo (paralelismo no servidor)"""
+        dados = {"prompts": prompts, "temperatura": temperatura, "tokens": tokens}
+        if max_paralelo:
+            dados["max_paralelo"] = max_paralelo
+        if timeout_item:
+            dados["timeout_item"] = timeout_item
+        if modelo:
+            dados["modelo"] = modelo
+
+        # Lote inteiro: ondas de `max_paralelo` itens, cada uma até `timeout_item`
+        ondas = math.ceil(len(prompts) / max_paralelo) if max_paralelo else len(prompts)
+        timeout = max(300, (timeout_item or 120) * max(1, ondas) + 30)
+        resposta = await self._chamada("/gerar-multiplo", "POST", dados, timeout=timeout)
+        if not resposta.sucesso or not isinstance(resposta.dados, list):
+            return [resposta]
+        try:
+            return [RespostaCliente(**item) for item in resposta.dados]
+        except TypeError:
+            return [resposta]
+
+    async def gerar_stream(self, prompt: str, temperatura: float = 0.7,
+                           tokens: int = 256, modelo: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Gera resposta em blocos via /gerar-stream
+
+        Raises:
+            RuntimeError: erro reportado pela API
+            ConnectionError: falha de rede
+        """
+        dados = self._corpo(prompt, temperatura, tokens, modelo)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with self._semaforo:
+            try:
+                async with self._obter_sessao().post(
+                    f"{self.url_base}/gerar-stream", json=dados, timeout=timeout
+                ) as resp:
+                    if resp.status != 200:
+                        try:
+                            erro = (await resp.json()).get("erro")
+                        except (aiohttp.ContentTypeError, ValueError):
+                            erro = f"HTTP {resp.status}"
+                        raise RuntimeError(erro or "Falha na requisição")
+
+                    evento = "message"
+                    async for bruto in resp.content:
+                        linha = bruto.decode("utf-8", errors="ignore").strip()
+                        if not linha:
+                            evento = "message"
+                        elif linha.startswith("event:"):
+                            evento = linha[6:].strip()
+                        elif linha.startswith("data:"):
+                            conteudo = json.loads(linha[5:])
+                            if evento == "erro":
+                                raise RuntimeError(conteudo.get("erro") or "Falha na requisição")
+                            if "token" in conteudo:
+                                yield conteudo["token"]
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Erro no stream: {e}")
+                raise ConnectionError(str(e)) from e
+
+    async def listar_modelos(self) -> Dict:
+        """Modelos do servidor com residência e contadores ({} se indisponível)"""
+        resposta = await self._chamada("/modelos", timeout=5)
+        return resposta.dados if resposta.sucesso else {}
+
+    async def criar_sessao(self, modelo: Optional[str] = None) -> Optional[str]:
+        """Abre uma sessão de conversa no servidor; retorna o id (None se falhou)"""
+        resposta = await self._chamada("/sessoes", "POST", {"modelo": modelo} if modelo else {}, timeout=10)
+        return resposta.dados.get("id") if resposta.sucesso else None
+
+    async def enviar_turno(self, sessao: str, prompt: str, temperatura: float = 0.7,
+                           tokens: int = 256) -> RespostaCliente:
+        """Acrescenta um turno à sessão (ver ClienteAPI.enviar_turno)"""
+        return await self._chamada(
+            f"/sessoes/{sessao}/turnos",
+            "POST",
+            {"prompt": prompt, "temperatura": temperatura, "tokens": tokens}
+        )
+
+    async def obter_sessao(self, sessao: str) -> Dict:
+        """Sessão com a conversa até aqui ({} se não existe ou expirou)"""
+        resposta = await self._chamada(f"/sessoes/{sessao}", timeout=5)
+        return resposta.dados if resposta.sucesso else {}
+
+    async def encerrar_sessao(self, sessao: str) -> bool:
+        """Encerra a sessão e libera seu estado no servidor"""
+        resposta = await self._chamada(f"/sessoes/{sessao}", "DELETE", timeout=5)
+        return resposta.sucesso
+
+    async def obter_historico(self, ultimos: int = 10) -> List[Dict]:
+        """Obtém histórico"""
+        resposta = await self._chamada("/historico", "GET", {"ultimos": ultimos}, timeout=5)
+        return resposta.dados if resposta.sucesso else []
+
+    async def paginar_historico(self, limite: int = 50, busca: str = None) -> AsyncIterator[Dict]:
+        """Percorre o histórico do mais recente ao mais antigo, página a página"""
+        url = f"{self.url_base}/historico"
+        cursor = None
+        while True:
+            params = {"limite": limite}
+            if cursor:
+                params["cursor"] = cursor
+            if busca:
+                params["busca"] = busca
+            try:
+                async with self._semaforo:
+                    resposta = await asyncio.wait_for(
+                        self._requisicao("GET", url, params=params), timeout=5
+                    )
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                logger.error(f"Erro na requisição GET {url}: {e}")
+                return
+            if not resposta or not resposta.get("sucesso"):
+                return
+            for item in reversed(resposta.get("dados") or []):
+                yield item
+            cursor = resposta.get("proximo_cursor")
+            if not cursor:
+                return
+
+    async def limpar_historico(self) -> bool:
+        """Limpa histórico"""
+        resposta = await self._chamada("/limpar-historico", "POST", timeout=5)
+        return resposta.sucesso
@@ -1,26 +1,125 @@
 """Camada HTTP com decoradores e tratamento centralizado"""
 
+import json
 import logging
+import random
+import threading
+import time
 from functools import wraps
-from typing import Dict, Any, Optional, Callable
+from urllib.parse import urlencode
+from typing import Dict, Any, Iterator, List, Optional, Callable, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from ..config import config
 
 logger = logging.getLogger(__name__)
 
+# Status que indicam sobrecarga/indisponibilidade momentânea
+STATUS_TRANSITORIOS = {429, 502, 503, 504}
+# Status em que o servidor garante não ter processado (seguro repetir POST)
+STATUS_REJEITADOS = {429, 503}
+METODOS_IDEMPOTENTES = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class ErroTransitorio(Exception):
+    """Falha que pode ser repetida com segurança"""
+
+    def __init__(self, mensagem: str, retry_after: Optional[float] = None):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+# Sessão compartilhada (pool de conexões keep-alive)
+_sessao = None
+_sessao_lock = threading.Lock()
+
+def obter_sessao() -> requests.Session:
+    """Sessão global com pool de conexões dimensionado por config.cliente"""
+    global _sessao
+    with _sessao_lock:
+        if _sessao is None:
+            tamanho = config.cliente.pool_tamanho
+            adaptador = HTTPAdapter(pool_connections=tamanho, pool_maxsize=tamanho, max_retries=0)
+            _sessao = requests.Session()
+            _sessao.mount("http://", adaptador)
+            _sessao.mount("https://", adaptador)
+        return _sessao
+
+
+def fechar_sessao() -> None:
+    """Fecha as conexões do pool"""
+    global _sessao
+    with _sessao_lock:
+        if _sessao is not None:
+            _sessao.close()
+            _sessao = None
+
+
+# Tentativa atual da thread (exposta aos observadores)
+_contexto = threading.local()
+
+# Observadores de latência: callback(metodo, url, status, segundos, tentativa)
+_observadores: List[Callable] = []
+
+def adicionar_observador(callback: Callable) -> None:
+    """Registra callback chamado após cada tentativa HTTP"""
+    _observadores.append(callback)
 
-def com_retry(tentativas: int = 3, delay: float = 0.5):
-    """Decorador para retry automático"""
+
+def remover_observador(callback: Callable) -> None:
+    """Remove callback registrado"""
+    if callback in _observadores:
+        _observadores.remove(callback)
+
+
+def _notificar(metodo: str, url: str, status: Optional[int], segundos: float) -> None:
+    tentativa = getattr(_contexto, "tentativa", 0)
+    for callback in list(_observadores):
+        try:
+            callback(metodo, url, status, segundos, tentativa)
+        except Exception as e:
+            logger.warning(f"Observador {callback!r} falhou: {e}")
+
+
+def _backoff(tentativa: int, base: float, maximo: float) -> float:
+    """Exponencial com jitter completo: uniforme em [0, min(max, base * 2^n)]"""
+    return random.uniform(0, min(maximo, base * (2 ** tentativa)))
+
+
+def com_retry(tentativas: Optional[int] = None, base: Optional[float] = None,
+              maximo: Optional[float] = None):
+    """
+    Decorador para retry com backoff exponencial e jitter
+
+    Só repete ErroTransitorio (o chamador decide o que é seguro repetir).
+    Valores omitidos vêm de config.cliente no momento da chamada.
+    """
     def decorador(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
-            for tentativa in range(tentativas):
+            total = tentativas or config.cliente.retry_tentativas
+            for tentativa in range(total):
+                _contexto.tentativa = tentativa
                 try:
                     return func(*args, **kwargs)
-                except Exception as e:
-                    if tentativa == tentativas - 1:
-                        logger.error(f"{func.__name__} falhou após {tentativas} tentativas: {e}")
+                except ErroTransitorio as e:
+                    if tentativa == total - 1:
+                        logger.error(f"{func.__name__} falhou após {total} tentativas: {e}")
                         return None
-                    logger.warning(f"{func.__name__} tentativa {tentativa + 1} falhou, retentando...")
+                    espera = _backoff(
+                        tentativa,
+                        base or config.cliente.retry_base,
+                        maximo or config.cliente.retry_max
+                    )
+                    if e.retry_after is not None:
+                        espera = max(espera, min(e.retry_after, maximo or config.cliente.retry_max))
+                    logger.warning(
+                        f"{func.__name__} tentativa {tentativa + 1} falhou ({e}), "
+                        f"retentando em {espera:.2f}s..."
+                    )
+                    time.sleep(espera)
             return None
         return wrapper
     return decorador
@@ -37,41 +136,114 @@ def com_logging(func: Callable) -> Callable:
     return wrapper
 
 
-@com_retry(tentativas=2)
+def _nao_enviada(erro: requests.RequestException) -> bool:
+    """True se a conexão nem chegou a abrir (a requisição não saiu)"""
+    if isinstance(erro, requests.ConnectTimeout):
+        return True
+    motivo = getattr(erro.args[0], "reason", None) if erro.args else None
+    return isinstance(motivo, NewConnectionError)
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+@com_retry()
 @com_logging
-def requisicao(metodo: str, url: str, dados: Optional[Dict] = None, 
+def requisicao(metodo: str, url: str, dados: Optional[Dict] = None,
                timeout: int = 120) -> Optional[Dict]:
     """
-    Requisição HTTP centralizada (GET/POST)
-    
+    Requisição HTTP centralizada (GET/POST/DELETE)
+
+    Repete apenas quando é seguro: métodos idempotentes em falhas de rede e
+    status transitórios; POST só se a conexão nem chegou a abrir ou se o
+    servidor recusou explicitamente (429/503), evitando gerações duplicadas.
+
     Args:
-        metodo: GET ou POST
+        metodo: GET, POST ou DELETE
         url: URL do endpoint
         dados: Dados JSON (apenas para POST)
         timeout: Timeout em segundos
-        
+
     Returns:
         Resposta JSON ou None em caso de erro
     """
+    idempotente = metodo.upper() in METODOS_IDEMPOTENTES
+    kwargs = {"timeout": timeout}
+    if dados:
+        kwargs["json"] = dados
+
+    inicio = time.perf_counter()
     try:
-        kwargs = {"timeout": timeout}
-        if dados:
-            kwargs["json"] = dados
-        
-        resp = requests.request(metodo, url, **kwargs)
-        return resp.json() if resp.ok else None
+        resp = obter_sessao().request(metodo, url, **kwargs)
     except requests.RequestException as e:
+        _notificar(metodo, url, None, time.perf_counter() - inicio)
+        if idempotente or _nao_enviada(e):
+            raise ErroTransitorio(str(e)) from e
         logger.error(f"Erro na requisição {metodo} {url}: {e}")
         return None
 
+    _notificar(metodo, url, resp.status_code, time.perf_counter() - inicio)
+
+    if resp.status_code in (STATUS_TRANSITORIOS if idempotente else STATUS_REJEITADOS):
+        raise ErroTransitorio(f"HTTP {resp.status_code}", _retry_after(resp))
+    if not resp.ok:
+        return None
+    try:
+        return resp.json()
+    except ValueError as e:
+        # 2xx sem JSON (proxy, página de erro): mesmo tratamento de uma falha
+        logger.error(f"Resposta inválida de {metodo} {url}: {e}")
+        return None
+
 
 # Funções convenientes
 def get(url: str, params: Optional[Dict] = None, timeout: int = 5) -> Optional[Dict]:
     """GET request"""
-    url_com_params = f"{url}?{'&'.join(f'{k}={v}' for k,v in params.items())}" if params else url
+    url_com_params = f"{url}?{urlencode(params)}" if params else url
     return requisicao("GET", url_com_params, timeout=timeout)
 
 
 def post(url: str, dados: Dict, timeout: int = 120) -> Optional[Dict]:
     """POST request"""
     return requisicao("POST", url, dados, timeout)
+
+
+def delete(url: str, timeout: int = 5) -> Optional[Dict]:
+    """DELETE request"""
+    return requisicao("DELETE", url, timeout=timeout)
+
+
+def post_stream(url: str, dados: Dict, timeout: int = 120) -> Iterator[Tuple[str, Dict]]:
+    """
+    POST com resposta Server-Sent Events (sem retry: geração não é idempotente)
+
+    Yields:
+        (evento, dados) conforme chegam; erros HTTP viram um evento "erro"
+
+    Raises:
+        ConnectionError: falha de rede
+    """
+    try:
+        with obter_sessao().post(url, json=dados, stream=True, timeout=timeout) as resp:
+            if not resp.ok:
+                try:
+                    yield "erro", resp.json()
+                except ValueError:
+                    yield "erro", {"erro": f"HTTP {resp.status_code}"}
+                return
+
+            evento = "message"
+            for linha in resp.iter_lines(decode_unicode=True):
+                if not linha:
+                    evento = "message"
+                elif linha.startswith("event:"):
+                    evento = linha[6:].strip()
+                elif linha.startswith("data:"):
+                    yield evento, json.loads(linha[5:])
+    except requests.RequestException as e:
+        logger.error(f"Erro no stream POST {url}: {e}")
+        raise ConnectionError(str(e)) from e
@@ -26,3 +26,5 @@ class RespostaCliente(Resposta):
     """Resposta do cliente HTTP"""
     dados: Optional[str] = None
     erro: Optional[str] = None
+    # Término da geração: motivo ('parada', 'limite', 'fim', 'cache', 'erro') e tokens
+    fim: Optional[Dict[str, Any]] = None
@@ -7,7 +7,7 @@ from dataclasses import dataclass
 
 def _env(chave: str, tipo: type = str, padrao=None):
     """Obtém valor de variável de ambiente com tipo"""
-    valor = os.getenv(chave, padrao)
+    valor = os.getenv(chave)
     if valor is None:
         return padrao
     if tipo == bool:
@@ -19,6 +19,16 @@ def _env(chave: str, tipo: type = str, padrao=None):
     return valor
 
 
+def _pares(chave: str, tipo: type = str) -> dict:
+    """'nome=valor,nome=valor' -> {nome: valor}"""
+    pares = {}
+    for item in (_env(chave, str, "") or "").split(","):
+        if "=" in item:
+            nome, valor = item.split("=", 1)
+            pares[nome.strip()] = tipo(valor.strip())
+    return pares
+
+
 @dataclass
 class ConfigAPI:
     """Configuração da API"""
@@ -26,6 +36,12 @@ class ConfigAPI:
     porta: int = None
     debug: bool = None
     timeout_padrao: int = None
+    concorrencia: int = None
+    fila_max: int = None
+    fila_timeout: int = None
+    perfil_janela: int = None
+    processos: int = None
+    timeout_gracioso: int = None
     
     def __post_init__(self):
         """Carrega valores de ambiente com fallback"""
@@ -33,6 +49,12 @@ class ConfigAPI:
         self.porta = self.porta or _env("API_PORTA", int, 5000)
         self.debug = self.debug if self.debug is not None else _env("API_DEBUG", bool, False)
         self.timeout_padrao = self.timeout_padrao or _env("API_TIMEOUT", int, 120)
+        self.concorrencia = self.concorrencia or _env("API_CONCORRENCIA", int, 2)
+        self.fila_max = self.fila_max or _env("API_FILA_MAX", int, 32)
+        self.fila_timeout = self.fila_timeout or _env("API_FILA_TIMEOUT", int, 30)
+        self.perfil_janela = self.perfil_janela or _env("API_PERFIL_JANELA", int, 200)
+        self.processos = self.processos if self.processos is not None else _env("API_PROCESSOS", int, 0)
+        self.timeout_gracioso = self.timeout_gracioso or _env("API_TIMEOUT_GRACIOSO", int, 60)
     
     @property
     def url_base(self) -> str:
@@ -46,12 +68,61 @@ class ConfigLLM:
     temperatura: float = None
     tokens: int = None
     timeout: int = None
+    workers: int = None
+    max_paralelo: int = None
+    timeout_item: int = None
+    lote_janela_ms: int = None
+    lote_max: int = None
+    cache_prefixo: bool = None
+    precarregar: str = None
+    aquecer: bool = None
+    mmap: bool = None
+    mlock: bool = None
+    paradas: list = None
+    contexto: int = None
+    threads: int = None
+    batch: int = None
+    perfil: bool = None
+    modelos: dict = None
+    modelo_padrao: str = None
+    concorrencia_modelos: dict = None
+    ram_max_mb: int = None
+    coalescer: bool = None
     
     def __post_init__(self):
         """Carrega valores de ambiente com fallback"""
         self.temperatura = self.temperatura or _env("LLM_TEMPERATURA", float, 0.7)
         self.tokens = self.tokens or _env("LLM_TOKENS", int, 256)
         self.timeout = self.timeout or _env("LLM_TIMEOUT", int, 60)
+        self.workers = self.workers if self.workers is not None else _env("LLM_WORKERS", int, 0)
+        self.max_paralelo = self.max_paralelo or _env("LLM_MAX_PARALELO", int, 4)
+        self.timeout_item = self.timeout_item or _env("LLM_TIMEOUT_ITEM", int, self.timeout)
+        self.lote_janela_ms = self.lote_janela_ms if self.lote_janela_ms is not None else _env("LLM_LOTE_JANELA_MS", int, 0)
+        self.lote_max = self.lote_max or _env("LLM_LOTE_MAX", int, 4)
+        self.cache_prefixo = self.cache_prefixo if self.cache_prefixo is not None else _env("LLM_CACHE_PREFIXO", bool, True)
+        self.precarregar = self.precarregar or _env("LLM_PRECARREGAR", str, "ler")
+        self.aquecer = self.aquecer if self.aquecer is not None else _env("LLM_AQUECER", bool, True)
+        self.mmap = self.mmap if self.mmap is not None else _env("LLM_MMAP", bool, True)
+        self.mlock = self.mlock if self.mlock is not None else _env("LLM_MLOCK", bool, False)
+        # Separadas por "|"; "\n" vira quebra de linha. Vazio desliga.
+        if self.paradas is None:
+            bruto = _env("LLM_PARADAS", str, "\\n|Q:")
+            self.paradas = [p.replace("\\n", "\n") for p in bruto.split("|") if p]
+        self.contexto = self.contexto or _env("LLM_CONTEXTO", int, 2048)
+        # 0 = do perfil de ajuste (scripts/ajustar_llama.py) ou o padrão do llama.cpp
+        self.threads = self.threads if self.threads is not None else _env("LLM_THREADS", int, 0)
+        self.batch = self.batch if self.batch is not None else _env("LLM_BATCH", int, 0)
+        self.perfil = self.perfil if self.perfil is not None else _env("LLM_PERFIL", bool, True)
+        # Modelos extras: "nome=arquivo.gguf,..." (relativo a resources/models); LLM_MODELO é o "padrao"
+        self.modelos = self.modelos if self.modelos is not None else _pares("LLM_MODELOS")
+        self.modelo_padrao = self.modelo_padrao or _env("LLM_MODELO_PADRAO", str, "padrao")
+        # Gerações simultâneas por modelo ("nome=2,..."); ausente = só o limite do agendador
+        if self.concorrencia_modelos is None:
+            self.concorrencia_modelos = _pares("LLM_MODELOS_CONCORRENCIA", int)
+        # Orçamento de RAM dos workers residentes de todos os modelos (0 = sem limite)
+        self.ram_max_mb = self.ram_max_mb if self.ram_max_mb is not None else _env("LLM_RAM_MAX_MB", int, 0)
+        # Requisições determinísticas iguais simultâneas compartilham uma geração
+        self.coalescer = self.coalescer if self.coalescer is not None else _env("LLM_COALESCER", bool, True)
         self.validar()
     
     def validar(self) -> None:
@@ -60,6 +131,93 @@ class ConfigLLM:
             raise ValueError("Temperatura deve estar entre 0.0 e 2.0")
         if not 1 <= self.tokens <= 2048:
             raise ValueError("Tokens deve estar entre 1 e 2048")
+        if self.workers < 0:
+            raise ValueError("Workers deve ser >= 0")
+        if self.contexto < 64:
+            raise ValueError("Contexto deve ser >= 64 tokens")
+        if self.threads < 0 or self.batch < 0:
+            raise ValueError("Threads e batch devem ser >= 0")
+        if self.lote_max < 1:
+            raise ValueError("Lote max deve ser >= 1")
+        if self.max_paralelo < 1:
+            raise ValueError("Max paralelo deve ser >= 1")
+        if self.precarregar not in ("nao", "ler", "travar"):
+            raise ValueError("Precarregar deve ser 'nao', 'ler' ou 'travar'")
+        if self.modelo_padrao not in ("padrao", *self.modelos):
+            raise ValueError(f"Modelo padrão '{self.modelo_padrao}' não está em LLM_MODELOS")
+        if any(n < 0 for n in self.concorrencia_modelos.values()):
+            raise ValueError("Concorrência por modelo deve ser >= 0")
+        if self.ram_max_mb < 0:
+            raise ValueError("RAM max deve ser >= 0")
+
+
+@dataclass
+class ConfigCache:
+    """Configuração do cache de respostas"""
+    ativo: bool = None
+    capacidade: int = None
+    ttl: int = None
+    arquivo: str = None
+    somente_deterministico: bool = None
+    similares: bool = None
+    similaridade: float = None
+    similares_mb: int = None
+    
+    def __post_init__(self):
+        """Carrega valores de ambiente com fallback"""
+        self.ativo = self.ativo if self.ativo is not None else _env("CACHE_ATIVO", bool, True)
+        self.capacidade = self.capacidade or _env("CACHE_CAPACIDADE", int, 1024)
+        self.ttl = self.ttl or _env("CACHE_TTL", int, 86400)
+        self.arquivo = self.arquivo if self.arquivo is not None else _env(
+            "CACHE_ARQUIVO", str, str(Path(__file__).parent / "resources" / "cache" / "respostas.db")
+        )
+        self.somente_deterministico = (
+            self.somente_deterministico if self.somente_deterministico is not None
+            else _env("CACHE_SOMENTE_DETERMINISTICO", bool, True)
+        )
+        # Cache aproximado (prompts quase iguais), só em memória
+        self.similares = self.similares if self.similares is not None else _env("CACHE_SIMILARES", bool, False)
+        self.similaridade = self.similaridade or _env("CACHE_SIMILARIDADE", float, 0.85)
+        self.similares_mb = self.similares_mb or _env("CACHE_SIMILARES_MB", int, 256)
+        self.validar()
+    
+    def validar(self) -> None:
+        """Valida os parâmetros"""
+        if not 0.0 < self.similaridade <= 1.0:
+            raise ValueError("Similaridade deve estar entre 0.0 (exclusive) e 1.0")
+        if self.similares_mb < 1:
+            raise ValueError("Memória do cache aproximado deve ser >= 1 MB")
+
+
+@dataclass
+class ConfigHistorico:
+    """Configuração do histórico de gerações"""
+    capacidade: int = None
+    arquivo: str = None
+    retencao: int = None
+    
+    def __post_init__(self):
+        """Carrega valores de ambiente com fallback"""
+        self.capacidade = self.capacidade or _env("HISTORICO_CAPACIDADE", int, 1000)
+        self.arquivo = self.arquivo if self.arquivo is not None else _env("HISTORICO_ARQUIVO", str, "")
+        self.retencao = self.retencao or _env("HISTORICO_RETENCAO", int, 100000)
+
+
+@dataclass
+class ConfigSessoes:
+    """Configuração das sessões de conversa"""
+    maximo: int = None
+    ociosa: int = None
+    diretorio: str = None
+    
+    def __post_init__(self):
+        """Carrega valores de ambiente com fallback"""
+        self.maximo = self.maximo or _env("SESSOES_MAX", int, 64)
+        # Segundos sem turnos até a sessão ser descartada
+        self.ociosa = self.ociosa or _env("SESSOES_OCIOSA", int, 900)
+        self.diretorio = self.diretorio or _env(
+            "SESSOES_DIR", str, str(Path(__file__).parent / "resources" / "cache" / "sessoes")
+        )
 
 
 @dataclass
@@ -68,12 +226,18 @@ class ConfigCliente:
     url_base: str = None
     timeout: int = None
     retry_tentativas: int = None
+    retry_base: float = None
+    retry_max: float = None
+    pool_tamanho: int = None
     
     def __post_init__(self):
         """Carrega valores de ambiente com fallback"""
         self.url_base = self.url_base or _env("CLIENTE_URL_BASE", str, "http://127.0.0.1:5000")
         self.timeout = self.timeout or _env("CLIENTE_TIMEOUT", int, 120)
         self.retry_tentativas = self.retry_tentativas or _env("CLIENTE_RETRY_TENTATIVAS", int, 3)
+        self.retry_base = self.retry_base or _env("CLIENTE_RETRY_BASE", float, 0.5)
+        self.retry_max = self.retry_max or _env("CLIENTE_RETRY_MAX", float, 8.0)
+        self.pool_tamanho = self.pool_tamanho or _env("CLIENTE_POOL_TAMANHO", int, 10)
 
 
 @dataclass
@@ -81,6 +245,9 @@ class ConfigApp:
     """Configuração geral da aplicação"""
     api: ConfigAPI = None
     llm: ConfigLLM = None
+    cache: ConfigCache = None
+    historico: ConfigHistorico = None
+    sessoes: ConfigSessoes = None
     cliente: ConfigCliente = None
     
     def __post_init__(self):
@@ -88,6 +255,12 @@ class ConfigApp:
             self.api = ConfigAPI()
         if self.llm is None:
             self.llm = ConfigLLM()
+        if self.cache is None:
+            self.cache = ConfigCache()
+        if self.historico is None:
+            self.historico = ConfigHistorico()
+        if self.sessoes is None:
+            self.sessoes = ConfigSessoes()
         if self.cliente is None:
             self.cliente = ConfigCliente()
 
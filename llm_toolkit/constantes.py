@@ -14,16 +14,33 @@ TOKENS_PADRAO = 256
 HISTORICO_PADRAO = 10
 RETRY_TENTATIVAS = 3
 
+# Prioridades da fila (menor sai primeiro)
+PRIORIDADES = {"interativo": 0, "batch": 1}
+PRIORIDADE_PADRAO = "interativo"
+
 # Endpoints
 ENDPOINT_HEALTH = "/health"
+ENDPOINT_READY = "/ready"
 ENDPOINT_GERAR = "/gerar"
+ENDPOINT_GERAR_STREAM = "/gerar-stream"
 ENDPOINT_GERAR_MULTIPLO = "/gerar-multiplo"
 ENDPOINT_HISTORICO = "/historico"
+ENDPOINT_HISTORICO_EXPORTAR = "/historico/exportar"
 ENDPOINT_LIMPAR = "/limpar-historico"
+ENDPOINT_FILA = "/fila"
+ENDPOINT_METRICAS = "/metricas"
+ENDPOINT_PERFIL = "/perfil"
+ENDPOINT_MODELOS = "/modelos"
+ENDPOINT_SESSOES = "/sessoes"
+ENDPOINT_SESSAO = "/sessoes/{sessao}"
+ENDPOINT_SESSAO_TURNOS = "/sessoes/{sessao}/turnos"
+ENDPOINT_CACHE = "/cache"
+ENDPOINT_CACHE_PURGAR = "/cache/purgar"
 
 # Mensagens de erro
 ERRO_PROMPT_VAZIO = "Prompt deve ser string não-vazia"
 ERRO_PROMPT_LONGO = f"Prompt muito longo (máx: {PROMPT_MAX_LENGTH} caracteres)"
+ERRO_PROMPT_CONTEXTO = "Prompt muito longo ({tokens} tokens; contexto de {contexto})"
 ERRO_API_INDISPONIVEL = "API não está disponível"
 ERRO_REQUISICAO = "Falha na requisição"
 
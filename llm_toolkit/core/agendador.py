@@ -0,0 +1,330 @@
+"""Controle de admissão: limite de gerações simultâneas e fila com prioridade"""
+
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from ..config import config
+from ..constantes import PRIORIDADES, PRIORIDADE_PADRAO
+from .metricas import ESPERA_FILA
+from .perfil import anotar
+
+logger = logging.getLogger(__name__)
+
+
+class FilaCheia(Exception):
+    """Requisição recusada por falta de espaço na fila"""
+
+    def __init__(self, mensagem: str, retry_after: int = 1):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+class EsperaExcedida(FilaCheia):
+    """Requisição admitida na fila mas sem vaga dentro do timeout"""
+
+
+class Agendador:
+    """
+    Admite até `concorrencia` gerações; as demais esperam numa fila limitada
+
+    Menor valor de prioridade sai primeiro (interativo antes de batch);
+    empate por ordem de chegada. Threads (`adquirir`) e corrotinas
+    (`adquirir_async`) dividem a mesma fila.
+    """
+
+    def __init__(self, concorrencia: int = 2, capacidade: int = 32, timeout: float = 30):
+        self.concorrencia = concorrencia
+        self.capacidade = capacidade
+        self.timeout = timeout
+        self._fila = []
+        self._seq = itertools.count()
+        self._ativos = 0
+        self._cond = threading.Condition()
+        # Entradas de corrotinas na fila -> (loop, futuro) acordado por `_admitir_async`
+        self._futuros = {}
+        self._duracao_media = 1.0
+        self.contadores = {"admitidos": 0, "rejeitados": 0, "expirados": 0}
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+
+    @staticmethod
+    def nivel(prioridade) -> int:
+        """Converte nome ('interativo', 'batch') ou número em nível"""
+        if isinstance(prioridade, int):
+            return prioridade
+        return PRIORIDADES.get(prioridade or PRIORIDADE_PADRAO, PRIORIDADES[PRIORIDADE_PADRAO])
+
+    def estimar_espera(self, posicao: int) -> int:
+        """Segundos estimados até liberar uma vaga para `posicao`"""
+        return max(1, math.ceil(self._duracao_media * (posicao + 1) / self.concorrencia))
+
+    def cheio(self) -> bool:
+        with self._cond:
+            return len(self._fila) >= self.capacidade
+
+    def adquirir(self, prioridade=None, forcar: bool = False) -> float:
+        """
+        Reserva uma vaga, esperando na fila se necessário
+
+        Args:
+            forcar: ignora a capacidade da fila (itens de um lote já admitido)
+
+        Returns:
+            Segundos de espera na fila
+
+        Raises:
+            FilaCheia: fila lotada
+            EsperaExcedida: sem vaga dentro de `timeout`
+        """
+        inicio = time.monotonic()
+        with self._cond:
+            if self._ativos < self.concorrencia and not self._fila:
+                self._ativos += 1
+                self._registrar_admissao(0.0, prioridade)
+                return 0.0
+
+            if not forcar and len(self._fila) >= self.capacidade:
+                self.contadores["rejeitados"] += 1
+                raise FilaCheia("Fila cheia", self.estimar_espera(len(self._fila)))
+
+            entrada = (self.nivel(prioridade), next(self._seq))
+            heapq.heappush(self._fila, entrada)
+            limite = inicio + self.timeout
+
+            while not (self._fila[0] == entrada and self._ativos < self.concorrencia):
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._fila.remove(entrada)
+                    heapq.heapify(self._fila)
+                    self.contadores["expirados"] += 1
+                    self._notificar()
+                    raise EsperaExcedida(f"Espera na fila excedeu {self.timeout}s",
+                                         self.estimar_espera(len(self._fila)))
+                self._cond.wait(restante)
+
+            heapq.heappop(self._fila)
+            self._ativos += 1
+            espera = time.monotonic() - inicio
+            self._registrar_admissao(espera, prioridade)
+            # Próximo da fila pode ter vaga também
+            self._notificar()
+            return espera
+
+    async def adquirir_async(self, prioridade=None, forcar: bool = False) -> float:
+        """Como `adquirir`, mas espera a vaga sem ocupar uma thread"""
+        import asyncio
+        inicio = time.monotonic()
+        with self._cond:
+            if self._ativos < self.concorrencia and not self._fila:
+                self._ativos += 1
+                self._registrar_admissao(0.0, prioridade)
+                return 0.0
+
+            if not forcar and len(self._fila) >= self.capacidade:
+                self.contadores["rejeitados"] += 1
+                raise FilaCheia("Fila cheia", self.estimar_espera(len(self._fila)))
+
+            entrada = (self.nivel(prioridade), next(self._seq))
+            futuro = asyncio.get_running_loop().create_future()
+            self._futuros[entrada] = (futuro.get_loop(), futuro)
+            heapq.heappush(self._fila, entrada)
+            self._notificar()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(futuro), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._cond:
+                admitido = self._futuros.pop(entrada, None) is None
+                if not admitido:
+                    self._fila.remove(entrada)
+                    heapq.heapify(self._fila)
+                    self._notificar()
+            if admitido:
+                # Vaga concedida no mesmo instante: devolve
+                self.liberar()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            with self._cond:
+                self.contadores["expirados"] += 1
+                raise EsperaExcedida(f"Espera na fila excedeu {self.timeout}s",
+                                     self.estimar_espera(len(self._fila))) from None
+
+        espera = time.monotonic() - inicio
+        with self._cond:
+            self._registrar_admissao(espera, prioridade)
+        return espera
+
+    def _notificar(self) -> None:
+        """Acorda threads e admite corrotinas do topo da fila (chamar com o lock)"""
+        self._cond.notify_all()
+        while self._fila and self._ativos < self.concorrencia and self._fila[0] in self._futuros:
+            entrada = heapq.heappop(self._fila)
+            loop, futuro = self._futuros.pop(entrada)
+            self._ativos += 1
+            loop.call_soon_threadsafe(lambda f=futuro: f.done() or f.set_result(None))
+
+    def _registrar_admissao(self, espera: float, prioridade) -> None:
+        ESPERA_FILA.observar(espera, prioridade=prioridade or PRIORIDADE_PADRAO)
+        anotar("fila", espera * 1000)
+        self.contadores["admitidos"] += 1
+        self._espera_total += espera
+        self._espera_max = max(self._espera_max, espera)
+
+    def liberar(self, duracao: float = None) -> None:
+        """Devolve a vaga (e atualiza a média de duração para o Retry-After)"""
+        with self._cond:
+            self._ativos -= 1
+            if duracao is not None:
+                self._duracao_media = 0.8 * self._duracao_media + 0.2 * duracao
+            self._notificar()
+
+    @contextmanager
+    def vaga(self, prioridade=None, forcar: bool = False) -> Iterator[float]:
+        """Context manager: `with agendador.vaga("interativo") as espera:`"""
+        espera = self.adquirir(prioridade, forcar)
+        inicio = time.monotonic()
+        try:
+            yield espera
+        finally:
+            self.liberar(time.monotonic() - inicio)
+
+    @asynccontextmanager
+    async def vaga_async(self, prioridade=None, forcar: bool = False) -> AsyncIterator[float]:
+        """`async with agendador.vaga_async("interativo") as espera:`"""
+        espera = await self.adquirir_async(prioridade, forcar)
+        inicio = time.monotonic()
+        try:
+            yield espera
+        finally:
+            self.liberar(time.monotonic() - inicio)
+
+    def estatisticas(self) -> Dict:
+        """Profundidade da fila, vagas em uso e tempos de espera"""
+        with self._cond:
+            admitidos = self.contadores["admitidos"]
+            return {
+                **self.contadores,
+                "ativos": self._ativos,
+                "concorrencia": self.concorrencia,
+                "profundidade": len(self._fila),
+                "capacidade": self.capacidade,
+                "espera_media": round(self._espera_total / admitidos, 4) if admitidos else 0.0,
+                "espera_max": round(self._espera_max, 4),
+                "duracao_media": round(self._duracao_media, 4)
+            }
+
+
+class Admissao:
+    """
+    Vaga de uma requisição, reservada só se ela de fato gerar
+
+    Passada ao GeradorLLM: quem espera uma geração igual em andamento
+    (coalescida) não ocupa vaga. `espera` é a espera na fila (0 sem
+    reserva); `inicio` marca quando a requisição saiu da fila (admitida,
+    recusada ou dispensada) e fica None até lá.
+    """
+
+    def __init__(self, prioridade=None, forcar: bool = False):
+        self.prioridade = prioridade
+        self.forcar = forcar
+        self.espera = 0.0
+        self.inicio: Optional[float] = None
+        self._reservada = False
+        self._admitida = threading.Event()
+        self._lock = threading.Lock()
+        # Corrotinas em `esperar_async` -> (loop, futuro), acordadas por `_sair_da_fila`
+        self._esperas: List[tuple] = []
+
+    def adquirir(self) -> None:
+        """Reserva a vaga (FilaCheia/EsperaExcedida como `Agendador.adquirir`)"""
+        try:
+            self.espera = obter_agendador().adquirir(self.prioridade, self.forcar)
+            self._reservada = True
+        finally:
+            self._sair_da_fila()
+
+    async def adquirir_async(self) -> None:
+        try:
+            self.espera = await obter_agendador().adquirir_async(self.prioridade, self.forcar)
+            self._reservada = True
+        finally:
+            self._sair_da_fila()
+
+    def dispensar(self) -> None:
+        """Marca a saída da fila sem vaga (segue uma geração igual, ou o item terminou)"""
+        if not self._admitida.is_set():
+            self._sair_da_fila()
+
+    def _sair_da_fila(self) -> None:
+        with self._lock:
+            self.inicio = time.monotonic()
+            self._admitida.set()
+            esperas, self._esperas = self._esperas, []
+        for loop, futuro in esperas:
+            loop.call_soon_threadsafe(lambda f=futuro: f.done() or f.set_result(None))
+
+    def esperar(self, timeout: Optional[float] = None) -> bool:
+        """Espera a saída da fila; False se `timeout` passar antes"""
+        return self._admitida.wait(timeout)
+
+    async def esperar_async(self) -> None:
+        """Como `esperar`, sem ocupar uma thread (a admissão pode vir de outra)"""
+        import asyncio
+        futuro = asyncio.get_running_loop().create_future()
+        with self._lock:
+            if self._admitida.is_set():
+                return
+            self._esperas.append((futuro.get_loop(), futuro))
+        await futuro
+
+    def liberar(self, medir: bool = True) -> None:
+        """Devolve a vaga, se reservada (`medir` alimenta a duração média do Retry-After)"""
+        if self._reservada:
+            self._reservada = False
+            obter_agendador().liberar(time.monotonic() - self.inicio if medir else None)
+
+    @contextmanager
+    def vaga(self) -> Iterator[None]:
+        self.adquirir()
+        try:
+            yield
+        finally:
+            self.liberar()
+
+    @asynccontextmanager
+    async def vaga_async(self) -> AsyncIterator[None]:
+        await self.adquirir_async()
+        try:
+            yield
+        finally:
+            self.liberar()
+
+
+# Singleton
+_agendador = None
+_agendador_lock = threading.Lock()
+
+def obter_agendador() -> Agendador:
+    """Obtém agendador global configurado por config.api"""
+    global _agendador
+    with _agendador_lock:
+        if _agendador is None:
+            _agendador = Agendador(
+                concorrencia=config.api.concorrencia,
+                capacidade=config.api.fila_max,
+                timeout=config.api.fila_timeout
+            )
+        return _agendador
+
+
+def resetar_agendador() -> None:
+    """Descarta o agendador global"""
+    global _agendador
+    with _agendador_lock:
+        _agendador = None
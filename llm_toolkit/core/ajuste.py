@@ -0,0 +1,249 @@
+"""
+Ajuste automático das flags do llama.cpp (threads e tamanho do lote)
+
+Detecta a topologia da CPU, lê os metadados do GGUF e varre combinações de
+`--threads` e `--batch-size` com execuções curtas do llama-cli. O melhor
+resultado vira um perfil JSON por host e modelo, que `gerar_resposta` e os
+workers carregam sozinhos (LLM_PERFIL).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import platform
+import statistics
+import struct
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .perfil import analisar_tempos
+
+logger = logging.getLogger(__name__)
+
+# Tamanhos de lote testados (limitados pelo contexto)
+LOTES = (128, 256, 512, 1024)
+LOTE_PADRAO = 512
+
+
+def _ler(caminho: Path) -> str:
+    try:
+        return caminho.read_text().strip()
+    except OSError:
+        return ""
+
+
+def _tamanho_cache(texto: str) -> int:
+    """'32K' / '1024K' / '8M' -> bytes"""
+    multiplos = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if texto and texto[-1] in multiplos:
+        return int(texto[:-1]) * multiplos[texto[-1]]
+    return int(texto) if texto.isdigit() else 0
+
+
+def _nome_cpu() -> str:
+    for linha in _ler(Path("/proc/cpuinfo")).splitlines():
+        if linha.startswith("model name"):
+            return linha.split(":", 1)[1].strip()
+    return platform.processor() or platform.machine()
+
+
+def detectar_cpu(raiz: Path = Path("/sys/devices/system/cpu")) -> Dict:
+    """
+    Núcleos físicos e lógicos disponíveis ao processo e tamanhos de cache (bytes)
+
+    Lê a topologia do sysfs (Linux); em outros sistemas assume um núcleo
+    físico por CPU lógica e caches desconhecidos.
+    """
+    logicos = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else range(logicos)
+
+    nucleos = set()
+    for cpu in cpus:
+        topologia = raiz / f"cpu{cpu}" / "topology"
+        pacote, nucleo = _ler(topologia / "physical_package_id"), _ler(topologia / "core_id")
+        if nucleo:
+            nucleos.add((pacote, nucleo))
+
+    caches = {}
+    for indice in sorted((raiz / "cpu0" / "cache").glob("index*")):
+        nivel, tipo = _ler(indice / "level"), _ler(indice / "type")
+        if tipo == "Instruction":
+            continue
+        nome = f"l{nivel}" + ("d" if tipo == "Data" else "")
+        caches[nome] = _tamanho_cache(_ler(indice / "size"))
+
+    return {
+        "modelo": _nome_cpu(),
+        "fisicos": len(nucleos) or logicos,
+        "logicos": logicos,
+        "caches": caches,
+    }
+
+
+def info_modelo(modelo: Path) -> Dict:
+    """Metadados do GGUF relevantes para o ajuste (só o tamanho se o cabeçalho não for legível)"""
+    info = {"arquivo": modelo.name, "tamanho": modelo.stat().st_size}
+    try:
+        from .vocabulario import LeitorGGUF
+        metadados = LeitorGGUF(modelo, arrays=False).metadados
+    except (ValueError, OSError, struct.error) as e:
+        logger.warning(f"Metadados do GGUF indisponíveis ({e})")
+        return info
+    arquitetura = metadados.get("general.architecture", "")
+    info.update({
+        "arquitetura": arquitetura,
+        "tipo_arquivo": metadados.get("general.file_type"),
+        "contexto_treino": metadados.get(f"{arquitetura}.context_length"),
+        "camadas": metadados.get(f"{arquitetura}.block_count"),
+        "dimensao": metadados.get(f"{arquitetura}.embedding_length"),
+    })
+    return info
+
+
+def candidatos_threads(cpu: Dict) -> List[int]:
+    """
+    Quantidades de threads a testar
+
+    A geração é limitada pela banda de memória, então o ótimo costuma ficar
+    entre metade e o total de núcleos físicos; núcleos lógicos (SMT) só
+    entram como candidato extra.
+    """
+    fisicos = cpu["fisicos"]
+    opcoes = {fisicos, max(1, fisicos // 2), max(1, fisicos * 3 // 4), max(1, fisicos - 1)}
+    if cpu["logicos"] > fisicos:
+        opcoes.add(cpu["logicos"])
+    return sorted(opcoes)
+
+
+def candidatos_lote(contexto: int, info: Dict) -> List[int]:
+    """Tamanhos de lote que cabem no contexto (e no contexto de treino do modelo)"""
+    limite = min(contexto, info.get("contexto_treino") or contexto)
+    return [lote for lote in LOTES if lote <= limite] or [limite]
+
+
+def medir(comando: List[str], threads: int, lote: int, repeticoes: int, timeout: float = 300) -> Dict:
+    """
+    Executa o llama-cli `repeticoes` vezes e retorna a mediana em ms
+
+    Usa os tempos que o llama.cpp imprime (prompt + geração); sem eles,
+    o tempo de parede da execução.
+    """
+    amostras, tokens_seg = [], []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = subprocess.run(
+            [*comando, "--threads", str(threads), "--batch-size", str(lote)],
+            stdin=subprocess.DEVNULL, capture_output=True, text=True, errors="ignore", timeout=timeout
+        )
+        parede = (time.perf_counter() - inicio) * 1000
+        if resultado.returncode != 0:
+            ultima = resultado.stderr.strip().splitlines()[-1] if resultado.stderr.strip() else "erro"
+            raise RuntimeError(f"llama-cli falhou com {threads} threads, lote {lote}: {ultima[:100]}")
+        tempos = analisar_tempos(resultado.stderr)
+        if "prompt_ms" in tempos and "geracao_ms" in tempos:
+            amostras.append(tempos["prompt_ms"] + tempos["geracao_ms"])
+            if tempos.get("geracao_tokens") and tempos["geracao_ms"]:
+                tokens_seg.append(tempos["geracao_tokens"] / tempos["geracao_ms"] * 1000)
+        else:
+            amostras.append(parede)
+    return {
+        "threads": threads,
+        "batch": lote,
+        "ms": round(statistics.median(amostras), 1),
+        "tokens_seg": round(statistics.median(tokens_seg), 1) if tokens_seg else None,
+    }
+
+
+def ajustar(comando: List[str], cpu: Dict, info: Dict, contexto: int, repeticoes: int = 3,
+            threads: Optional[List[int]] = None, lotes: Optional[List[int]] = None,
+            progresso: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Varre threads (com o lote padrão) e depois lotes (com as melhores threads)
+
+    Args:
+        comando: linha do llama-cli sem --threads/--batch-size
+        progresso: chamado com cada medição
+
+    Returns:
+        {"threads", "batch", "ms", "medicoes": [...]}
+    """
+    threads = threads or candidatos_threads(cpu)
+    lotes = lotes or candidatos_lote(contexto, info)
+    lote_inicial = LOTE_PADRAO if LOTE_PADRAO in lotes else lotes[-1]
+    medicoes = []
+
+    def _medir(t: int, lote: int) -> Dict:
+        medicao = medir(comando, t, lote, repeticoes)
+        medicoes.append(medicao)
+        if progresso:
+            progresso(medicao)
+        return medicao
+
+    melhor = min((_medir(t, lote_inicial) for t in threads), key=lambda m: m["ms"])
+    for lote in lotes:
+        if lote != lote_inicial:
+            melhor = min(melhor, _medir(melhor["threads"], lote), key=lambda m: m["ms"])
+    return {"threads": melhor["threads"], "batch": melhor["batch"], "ms": melhor["ms"], "medicoes": medicoes}
+
+
+def chave_perfil(modelo: Path) -> str:
+    """Identifica o par (host, arquivo do modelo)"""
+    info = modelo.stat()
+    bruto = f"{platform.node()}\0{modelo.name}\0{info.st_size}\0{info.st_mtime_ns}"
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()[:16]
+
+
+def arquivo_perfil(diretorio: Path, modelo: Path) -> Path:
+    return Path(diretorio) / f"ajuste-{platform.node() or 'host'}-{chave_perfil(modelo)}.json"
+
+
+def salvar_perfil(diretorio: Path, modelo: Path, resultado: Dict, cpu: Dict, info: Dict) -> Path:
+    """Grava o perfil de forma atômica e retorna o caminho"""
+    destino = arquivo_perfil(diretorio, modelo)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    perfil = {
+        "host": platform.node(),
+        "criado": datetime.now().isoformat(timespec="seconds"),
+        "cpu": cpu,
+        "modelo": info,
+        "args": {"threads": resultado["threads"], "batch": resultado["batch"]},
+        "ms": resultado["ms"],
+        "medicoes": resultado["medicoes"],
+    }
+    temporario = destino.with_suffix(f".{os.getpid()}.tmp")
+    temporario.write_text(json.dumps(perfil, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(temporario, destino)
+    with _lock:
+        _perfis.clear()
+    return destino
+
+
+# Perfis já lidos: caminho -> (mtime, args)
+_perfis: Dict[Path, tuple] = {}
+_lock = threading.Lock()
+
+def carregar_perfil(diretorio: Path, modelo: Path) -> Dict:
+    """Flags do perfil deste host e modelo ({"threads", "batch"}); {} se não houver"""
+    try:
+        caminho = arquivo_perfil(diretorio, modelo)
+        mtime = caminho.stat().st_mtime_ns
+    except OSError:
+        return {}
+    with _lock:
+        em_cache = _perfis.get(caminho)
+        if em_cache and em_cache[0] == mtime:
+            return em_cache[1]
+        try:
+            args = json.loads(caminho.read_text(encoding="utf-8")).get("args", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Perfil de ajuste ilegível em {caminho.name}: {e}")
+            args = {}
+        _perfis[caminho] = (mtime, args)
+        if args:
+            logger.info(f"Perfil de ajuste carregado: {args}")
+        return args
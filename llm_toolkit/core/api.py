@@ -2,7 +2,7 @@
 
 import logging
 from functools import lru_cache
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 from .llm import gerar_resposta
 from ..client.models import Resposta, RespostaCliente
@@ -21,7 +21,7 @@ class GeradorLLM:
     
     @staticmethod
     @lru_cache(maxsize=128)
-    def _validar_prompt(prompt: str) -> tuple[bool, Optional[str]]:
+    def _validar_prompt(prompt: str) -> Tuple[bool, Optional[str]]:
         """Valida prompt com cache"""
         if not prompt or not isinstance(prompt, str):
             return False, "Prompt deve ser string não-vazia"
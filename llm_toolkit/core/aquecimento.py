@@ -0,0 +1,152 @@
+"""Fase de inicialização: pré-carga do modelo, aquecimento e prontidão"""
+
+import logging
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from ..config import config
+from . import llm
+
+logger = logging.getLogger(__name__)
+
+# Mapeamento travado na RAM: (endereço, tamanho), vivo enquanto o processo roda
+_travado = None
+
+
+def ler_paginas(arquivo: Path, bloco: int = 8 * 1024 * 1024) -> int:
+    """Lê o arquivo inteiro para levá-lo ao cache de páginas do SO; retorna bytes lidos"""
+    total = 0
+    with open(arquivo, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while True:
+            dados = f.read(bloco)
+            if not dados:
+                return total
+            total += len(dados)
+
+
+def travar_paginas(arquivo: Path) -> int:
+    """
+    Mapeia o arquivo (somente leitura, compartilhado) e trava as páginas na RAM
+
+    São as mesmas páginas do cache que o llama.cpp mapeia, então elas não
+    saem da memória enquanto o servidor roda. Só em POSIX; exige
+    RLIMIT_MEMLOCK suficiente (ulimit -l).
+    """
+    global _travado
+    import ctypes
+    import ctypes.util
+
+    if os.name != "posix":
+        raise OSError("mlock disponível só em POSIX")
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                          ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+
+    tamanho = arquivo.stat().st_size
+    with open(arquivo, "rb") as f:
+        endereco = libc.mmap(None, tamanho, mmap.PROT_READ, mmap.MAP_SHARED, f.fileno(), 0)
+    if endereco in (None, ctypes.c_void_p(-1).value):
+        erro = ctypes.get_errno()
+        raise OSError(erro, f"mmap: {os.strerror(erro)}")
+    if libc.mlock(endereco, tamanho) != 0:
+        erro = ctypes.get_errno()
+        libc.munmap(endereco, tamanho)
+        raise OSError(erro, f"mlock: {os.strerror(erro)}")
+    _travado = (endereco, tamanho)
+    return tamanho
+
+
+class Prontidao:
+    """Estado da inicialização, consultado por /ready"""
+
+    def __init__(self):
+        self.estado = "iniciando"
+        self.detalhe = ""
+        self.tempos: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def definir(self, estado: str, detalhe: str = "") -> None:
+        with self._lock:
+            self.estado = estado
+            self.detalhe = detalhe
+        logger.info(f"Prontidão: {estado} {detalhe}".rstrip())
+
+    @property
+    def pronto(self) -> bool:
+        return self.estado == "pronto"
+
+    def para_dict(self) -> Dict:
+        with self._lock:
+            return {"pronto": self.estado == "pronto", "estado": self.estado,
+                    "detalhe": self.detalhe, "tempos": dict(self.tempos)}
+
+
+prontidao = Prontidao()
+
+
+def preparar(precarregar: Optional[str] = None, aquecer: Optional[bool] = None) -> bool:
+    """
+    Executa a inicialização: confere arquivos, pré-carrega o modelo e aquece
+
+    Args:
+        precarregar: 'nao', 'ler' ou 'travar' (padrão: config.llm.precarregar)
+        aquecer: gera uma resposta mínima antes de ficar pronto (padrão: config.llm.aquecer)
+
+    Returns:
+        True se ficou pronto
+    """
+    precarregar = precarregar or config.llm.precarregar
+    aquecer = config.llm.aquecer if aquecer is None else aquecer
+
+    faltando = [nome for nome, ok in llm.verificar_arquivos().items() if not ok]
+    if faltando:
+        prontidao.definir("falhou", f"Falta {' e '.join(faltando)}: execute download.py")
+        return False
+
+    if precarregar != "nao":
+        # Só o modelo padrão: os demais carregam no primeiro uso
+        arquivo = llm.registro_modelos().obter().arquivo
+        prontidao.definir("pre-carregando", precarregar)
+        inicio = time.perf_counter()
+        try:
+            lidos = travar_paginas(arquivo) if precarregar == "travar" else ler_paginas(arquivo)
+        except OSError as e:
+            logger.warning(f"Não foi possível travar o modelo na RAM ({e}); lendo para o cache")
+            lidos = ler_paginas(arquivo)
+        duracao = time.perf_counter() - inicio
+        prontidao.tempos["pre_carga"] = round(duracao, 3)
+        logger.info(f"Modelo pré-carregado: {lidos / 1024 ** 2:.0f} MB em {duracao:.1f}s")
+
+    # Vocabulário do GGUF para validar prompts por tokens (só o cabeçalho do arquivo)
+    inicio = time.perf_counter()
+    if llm.tokens_prompt("") is not None:
+        prontidao.tempos["vocabulario"] = round(time.perf_counter() - inicio, 3)
+
+    if aquecer:
+        prontidao.definir("aquecendo")
+        inicio = time.perf_counter()
+        resposta = llm.aquecer()
+        prontidao.tempos["aquecimento"] = round(time.perf_counter() - inicio, 3)
+        # Resposta vazia com 1 token é normal; o que importa é o processo ter rodado
+        if resposta.startswith(("Erro:", "Falta", "Timeout")):
+            prontidao.definir("falhou", resposta)
+            return False
+
+    prontidao.definir("pronto")
+    return True
+
+
+def preparar_em_segundo_plano(**opcoes) -> threading.Thread:
+    """Roda `preparar` numa thread (o servidor já atende /health e /ready)"""
+    thread = threading.Thread(target=preparar, kwargs=opcoes, name="aquecimento", daemon=True)
+    thread.start()
+    return thread
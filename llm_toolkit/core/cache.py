@@ -0,0 +1,165 @@
+"""Cache de respostas em dois níveis: LRU em memória + SQLite em disco"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+def gerar_chave(**partes) -> str:
+    """Hash estável dos parâmetros que determinam a resposta"""
+    bruto = json.dumps(partes, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class CacheRespostas:
+    """LRU com TTL em memória, apoiado por SQLite compartilhado entre processos"""
+
+    def __init__(self, capacidade: int = 1024, ttl: float = 3600,
+                 arquivo: Optional[Path] = None):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.arquivo = Path(arquivo) if arquivo else None
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._conexao = None
+        self._pid = None
+        self._gravacoes = 0
+        self.contadores = {"acertos_memoria": 0, "acertos_disco": 0, "faltas": 0, "gravacoes": 0}
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Conexão do processo atual (reabre após fork)"""
+        if self.arquivo is None:
+            return None
+        if self._conexao is None or self._pid != os.getpid():
+            self.arquivo.parent.mkdir(parents=True, exist_ok=True)
+            self._conexao = sqlite3.connect(str(self.arquivo), timeout=5, check_same_thread=False)
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS respostas "
+                "(chave TEXT PRIMARY KEY, resposta TEXT NOT NULL, criado REAL NOT NULL)"
+            )
+            self._conexao.commit()
+            self._pid = os.getpid()
+        return self._conexao
+
+    def obter(self, chave: str) -> Optional[str]:
+        """Busca na memória e depois no disco (promovendo para a memória)"""
+        agora = time.time()
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is not None:
+                resposta, criado = item
+                if agora - criado < self.ttl:
+                    self._memoria.move_to_end(chave)
+                    self.contadores["acertos_memoria"] += 1
+                    return resposta
+                del self._memoria[chave]
+
+            try:
+                db = self._db()
+                linha = db.execute(
+                    "SELECT resposta, criado FROM respostas WHERE chave = ?", (chave,)
+                ).fetchone() if db else None
+            except sqlite3.Error as e:
+                logger.warning(f"Cache em disco indisponível: {e}")
+                linha = None
+
+            if linha and agora - linha[1] < self.ttl:
+                self._guardar_memoria(chave, linha[0], linha[1])
+                self.contadores["acertos_disco"] += 1
+                return linha[0]
+
+            self.contadores["faltas"] += 1
+            return None
+
+    def gravar(self, chave: str, resposta: str) -> None:
+        """Grava nos dois níveis"""
+        agora = time.time()
+        with self._lock:
+            self._guardar_memoria(chave, resposta, agora)
+            self.contadores["gravacoes"] += 1
+            try:
+                db = self._db()
+                if db is None:
+                    return
+                db.execute(
+                    "INSERT OR REPLACE INTO respostas (chave, resposta, criado) VALUES (?, ?, ?)",
+                    (chave, resposta, agora)
+                )
+                # Limpeza ocasional de expirados
+                self._gravacoes += 1
+                if self._gravacoes % 100 == 0:
+                    db.execute("DELETE FROM respostas WHERE criado < ?", (agora - self.ttl,))
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao gravar cache em disco: {e}")
+
+    def _guardar_memoria(self, chave: str, resposta: str, criado: float) -> None:
+        self._memoria[chave] = (resposta, criado)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.capacidade:
+            self._memoria.popitem(last=False)
+
+    def purgar(self) -> int:
+        """Remove tudo dos dois níveis; retorna quantas entradas saíram"""
+        with self._lock:
+            removidas = len(self._memoria)
+            self._memoria.clear()
+            try:
+                db = self._db()
+                if db is not None:
+                    removidas = max(removidas, db.execute("DELETE FROM respostas").rowcount)
+                    db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao purgar cache em disco: {e}")
+        logger.info(f"Cache purgado ({removidas} entradas)")
+        return removidas
+
+    def estatisticas(self) -> Dict:
+        """Contadores de acerto/falta e ocupação"""
+        with self._lock:
+            acertos = self.contadores["acertos_memoria"] + self.contadores["acertos_disco"]
+            total = acertos + self.contadores["faltas"]
+            return {
+                **self.contadores,
+                "taxa_acerto": round(acertos / total, 4) if total else 0.0,
+                "entradas_memoria": len(self._memoria),
+                "capacidade": self.capacidade,
+                "ttl": self.ttl,
+                "arquivo": str(self.arquivo) if self.arquivo else None
+            }
+
+
+# Singleton
+_cache = None
+_cache_lock = threading.Lock()
+
+def obter_cache() -> CacheRespostas:
+    """Obtém cache global configurado por config.cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheRespostas(
+                capacidade=config.cache.capacidade,
+                ttl=config.cache.ttl,
+                arquivo=config.cache.arquivo or None
+            )
+        return _cache
+
+
+def resetar_cache() -> None:
+    """Descarta o cache global (não apaga o disco)"""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,398 @@
+"""
+Coalescência de gerações idênticas em andamento (single-flight)
+
+Requisições determinísticas iguais que chegam enquanto a primeira ainda
+gera não disparam outro llama.cpp: esperam a geração dela e recebem o
+mesmo resultado. Streams iguais compartilham os blocos: quem chega depois
+recebe os já produzidos e segue junto. Quem chega depois que a geração
+terminou fica com o cache de respostas.
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional
+
+from .metricas import COALESCIDAS
+from .parada import anotar_fim, coletar_fim
+
+
+class Transmissao:
+    """
+    Blocos de um stream repassados a vários assinantes
+
+    Sem threads extras: o assinante que precisa de um bloco ainda não
+    produzido o puxa da fonte enquanto os outros esperam. Se todos saem
+    antes do fim, a fonte é fechada (encerra o processo ou libera o worker).
+    """
+
+    def __init__(self, fonte: Iterator[str], ao_terminar: Callable[[], None]):
+        self.fonte = fonte
+        self.blocos: List[str] = []
+        self.terminou = False
+        self.erro: Optional[BaseException] = None
+        # Detalhes do término, recolhidos uma vez e repassados a cada assinante
+        self.fim: Dict = {}
+        self.assinantes = 0
+        self.abandonada = False
+        self._ao_terminar = ao_terminar
+        self._puxando = False
+        self._cond = threading.Condition()
+
+    def assinar(self, coalescida: bool = False) -> Optional[Iterator[str]]:
+        """Novo assinante; None se todos já saíram e a fonte foi fechada"""
+        with self._cond:
+            if self.abandonada:
+                return None
+            self.assinantes += 1
+        return _Assinatura(self, coalescida)
+
+    def bloco(self, indice: int) -> str:
+        """Bloco `indice`, esperando ou puxando da fonte; StopIteration ao fim"""
+        while True:
+            with self._cond:
+                while indice >= len(self.blocos) and not self.terminou and self._puxando:
+                    self._cond.wait()
+                if indice < len(self.blocos):
+                    return self.blocos[indice]
+                if self.terminou:
+                    if self.erro is not None:
+                        raise self.erro
+                    raise StopIteration
+                self._puxando = True
+            self._puxar()
+
+    def _puxar(self) -> None:
+        bloco, terminou, erro = None, False, None
+        try:
+            with coletar_fim(self.fim):
+                bloco = next(self.fonte)
+        except StopIteration:
+            terminou = True
+        except Exception as e:
+            terminou, erro = True, e
+        with self._cond:
+            if bloco is not None:
+                self.blocos.append(bloco)
+            self.terminou, self.erro = terminou, erro
+            self._puxando = False
+            self._cond.notify_all()
+        if terminou:
+            self._ao_terminar()
+
+    def sair(self) -> None:
+        with self._cond:
+            self.assinantes -= 1
+            self.abandonada = self.assinantes == 0 and not self.terminou
+            if self.abandonada:
+                self.terminou = True
+        if self.abandonada:
+            self._ao_terminar()
+            fechar = getattr(self.fonte, "close", None)
+            if fechar:
+                fechar()
+
+
+class _Assinatura:
+    """Iterador de um assinante (fechar ou descartar conta como saída)"""
+
+    def __init__(self, transmissao: Transmissao, coalescida: bool):
+        self.transmissao = transmissao
+        self.coalescida = coalescida
+        self.indice = 0
+        self.ativa = True
+
+    def __iter__(self) -> "_Assinatura":
+        return self
+
+    def __next__(self) -> str:
+        if not self.ativa:
+            raise StopIteration
+        try:
+            bloco = self.transmissao.bloco(self.indice)
+        except StopIteration:
+            anotar_fim(**self.transmissao.fim, **({"coalescida": True} if self.coalescida else {}))
+            self.close()
+            raise
+        except BaseException:
+            self.close()
+            raise
+        self.indice += 1
+        return bloco
+
+    def close(self) -> None:
+        if self.ativa:
+            self.ativa = False
+            self.transmissao.sair()
+
+    def __del__(self):
+        self.close()
+
+
+class TransmissaoAsync:
+    """Como `Transmissao`, com uma tarefa asyncio puxando a fonte para todos"""
+
+    def __init__(self, fonte: AsyncIterator[str], ao_terminar: Callable[[], None]):
+        import asyncio
+        self.blocos: List[str] = []
+        self.terminou = False
+        self.erro: Optional[BaseException] = None
+        self.fim: Dict = {}
+        self.assinantes = 0
+        self.abandonada = False
+        self._ao_terminar = ao_terminar
+        self._novo = asyncio.Event()
+        self._tarefa = asyncio.ensure_future(self._puxar(fonte))
+
+    async def _puxar(self, fonte: AsyncIterator[str]) -> None:
+        import asyncio
+        try:
+            with coletar_fim(self.fim):
+                async for bloco in fonte:
+                    self.blocos.append(bloco)
+                    self._sinalizar()
+        except asyncio.CancelledError:
+            # Quem ainda assina não recebe um fim vazio como se fosse sucesso
+            self.erro = RuntimeError("Geração interrompida")
+            raise
+        except Exception as e:
+            self.erro = e
+        finally:
+            await fonte.aclose()
+            self.terminou = True
+            self._sinalizar()
+            self._ao_terminar()
+
+    def _sinalizar(self) -> None:
+        # Acorda os assinantes e rearma para o próximo bloco
+        self._novo.set()
+        self._novo.clear()
+
+    def assinar(self, coalescida: bool = False) -> Optional[AsyncIterator[str]]:
+        if self.abandonada:
+            return None
+        self.assinantes += 1
+        return _AssinaturaAsync(self, coalescida)
+
+    async def bloco(self, indice: int) -> str:
+        while indice >= len(self.blocos) and not self.terminou:
+            await self._novo.wait()
+        if indice < len(self.blocos):
+            return self.blocos[indice]
+        if self.erro is not None:
+            raise self.erro
+        raise StopAsyncIteration
+
+    def sair(self) -> None:
+        self.assinantes -= 1
+        if self.assinantes == 0 and not self.terminou:
+            self.abandonada = True
+            self._tarefa.cancel()
+
+
+class _AssinaturaAsync:
+    """Iterador assíncrono de um assinante"""
+
+    def __init__(self, transmissao: TransmissaoAsync, coalescida: bool):
+        self.transmissao = transmissao
+        self.coalescida = coalescida
+        self.indice = 0
+        self.ativa = True
+
+    def __aiter__(self) -> "_AssinaturaAsync":
+        return self
+
+    async def __anext__(self) -> str:
+        if not self.ativa:
+            raise StopAsyncIteration
+        try:
+            bloco = await self.transmissao.bloco(self.indice)
+        except StopAsyncIteration:
+            anotar_fim(**self.transmissao.fim, **({"coalescida": True} if self.coalescida else {}))
+            self.close()
+            raise
+        except BaseException:
+            self.close()
+            raise
+        self.indice += 1
+        return bloco
+
+    def close(self) -> None:
+        if self.ativa:
+            self.ativa = False
+            self.transmissao.sair()
+
+    async def aclose(self) -> None:
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class Coalescencia:
+    """Gerações em andamento por chave; chamadas iguais esperam a primeira"""
+
+    def __init__(self):
+        self._voos: Dict[Hashable, Future] = {}
+        self._voos_async: Dict[Hashable, Any] = {}
+        self._esperando: Dict[Hashable, int] = {}
+        self._transmissoes: Dict[Hashable, Transmissao] = {}
+        self._transmissoes_async: Dict[Hashable, TransmissaoAsync] = {}
+        self._lock = threading.Lock()
+
+    def executar(self, chave: Hashable, funcao: Callable[[], Any],
+                 ao_seguir: Optional[Callable[[], None]] = None) -> tuple:
+        """
+        Resultado de `funcao()` e se veio de uma chamada igual já em andamento
+
+        `ao_seguir` é chamado antes de esperar a chamada em andamento.
+        """
+        with self._lock:
+            futuro = self._voos.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = self._voos[chave] = Future()
+        if not lider:
+            COALESCIDAS.inc(tipo="completa")
+            if ao_seguir:
+                ao_seguir()
+            return futuro.result(), True
+
+        try:
+            resultado = funcao()
+        except BaseException as e:
+            self._pousar(self._voos, chave)
+            futuro.set_exception(e)
+            raise
+        self._pousar(self._voos, chave)
+        futuro.set_result(resultado)
+        return resultado, False
+
+    async def executar_async(self, chave: Hashable, fabrica: Callable[[], Any],
+                             ao_seguir: Optional[Callable[[], None]] = None) -> tuple:
+        """
+        Como `executar`, para corrotinas
+
+        A geração roda numa tarefa própria: quem desiste (cancelado) não a
+        interrompe para os demais; o último a desistir a cancela.
+        """
+        import asyncio
+        with self._lock:
+            tarefa = self._voos_async.get(chave)
+            lider = tarefa is None
+            if lider:
+                tarefa = self._voos_async[chave] = asyncio.ensure_future(fabrica())
+                tarefa.add_done_callback(lambda t: self._pousar(self._voos_async, chave, t))
+            self._esperando[chave] = self._esperando.get(chave, 0) + 1
+        if not lider:
+            COALESCIDAS.inc(tipo="completa")
+            if ao_seguir:
+                ao_seguir()
+        try:
+            resultado = await asyncio.shield(tarefa)
+        except asyncio.CancelledError:
+            if self._sair(chave) == 0:
+                self._pousar(self._voos_async, chave, tarefa)
+                tarefa.cancel()
+            raise
+        except BaseException:
+            self._sair(chave)
+            raise
+        self._sair(chave)
+        return resultado, not lider
+
+    def _sair(self, chave: Hashable) -> int:
+        with self._lock:
+            restantes = self._esperando.get(chave, 1) - 1
+            if restantes > 0:
+                self._esperando[chave] = restantes
+            else:
+                self._esperando.pop(chave, None)
+            return restantes
+
+    def transmitir(self, chave: Hashable, criar: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        Blocos do stream da chave: assina o que está em andamento ou inicia um com `criar()`
+
+        `criar` valida e devolve o gerador ainda não iniciado (a geração só
+        começa na primeira leitura); exceções dele chegam ao chamador.
+        """
+        with self._lock:
+            assinatura = self._assinar(self._transmissoes, chave)
+        if assinatura is not None:
+            return assinatura
+        fonte = criar()
+        with self._lock:
+            assinatura = self._assinar(self._transmissoes, chave)
+            if assinatura is None:
+                transmissao = self._transmissoes[chave] = Transmissao(
+                    fonte, lambda: self._pousar(self._transmissoes, chave, transmissao))
+                return transmissao.assinar()
+        # Outra igual começou enquanto validávamos: a nossa nem chegou a gerar
+        fechar = getattr(fonte, "close", None)
+        if fechar:
+            fechar()
+        return assinatura
+
+    async def transmitir_async(self, chave: Hashable,
+                               criar: Callable[[], Awaitable[AsyncIterator[str]]]) -> AsyncIterator[str]:
+        """
+        Como `transmitir`, para streams assíncronos
+
+        `criar` é uma corrotina: a transmissão só é publicada depois que ela
+        retorna (ex.: com a vaga já reservada), então quem assina nunca
+        depende de uma geração que ainda pode ser recusada.
+        """
+        with self._lock:
+            assinatura = self._assinar(self._transmissoes_async, chave)
+        if assinatura is not None:
+            return assinatura
+        fonte = await criar()
+        with self._lock:
+            assinatura = self._assinar(self._transmissoes_async, chave)
+            if assinatura is None:
+                transmissao = self._transmissoes_async[chave] = TransmissaoAsync(
+                    fonte, lambda: self._pousar(self._transmissoes_async, chave, transmissao))
+                return transmissao.assinar()
+        # Outra igual começou enquanto esperávamos: a nossa nem chegou a gerar
+        await fonte.aclose()
+        return assinatura
+
+    def _assinar(self, transmissoes: Dict, chave: Hashable):
+        """Assina a transmissão em andamento da chave, se houver (chamar com o lock)"""
+        transmissao = transmissoes.get(chave)
+        assinatura = transmissao.assinar(coalescida=True) if transmissao is not None else None
+        if assinatura is not None:
+            COALESCIDAS.inc(tipo="stream")
+        return assinatura
+
+    def _pousar(self, voos: Dict, chave: Hashable, valor: Any = None) -> None:
+        """Tira a chave dos voos em andamento (só se ainda for `valor`, quando dado)"""
+        with self._lock:
+            if valor is None or voos.get(chave) is valor:
+                voos.pop(chave, None)
+
+    def em_andamento(self) -> int:
+        """Gerações e streams compartilháveis em andamento"""
+        with self._lock:
+            return (len(self._voos) + len(self._voos_async)
+                    + len(self._transmissoes) + len(self._transmissoes_async))
+
+
+# Singleton
+_coalescencia = None
+_coalescencia_lock = threading.Lock()
+
+def obter_coalescencia() -> Coalescencia:
+    """Obtém instância global"""
+    global _coalescencia
+    with _coalescencia_lock:
+        if _coalescencia is None:
+            _coalescencia = Coalescencia()
+        return _coalescencia
+
+
+def resetar_coalescencia() -> None:
+    """Descarta a instância (útil para testes)"""
+    global _coalescencia
+    with _coalescencia_lock:
+        _coalescencia = None
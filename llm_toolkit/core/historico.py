@@ -0,0 +1,174 @@
+"""Histórico de gerações: buffer circular em memória + SQLite opcional"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Historico:
+    """
+    Histórico limitado, thread-safe e paginável por cursor
+
+    Cada entrada recebe um `id` crescente. Em memória ficam só as últimas
+    `capacidade`; com `arquivo` as entradas também vão para um SQLite
+    append-only que guarda até `retencao` registros (os mais antigos saem).
+    """
+
+    def __init__(self, capacidade: int = 1000, arquivo: Optional[Path] = None,
+                 retencao: int = 100000):
+        self.capacidade = capacidade
+        self.retencao = retencao
+        self.arquivo = Path(arquivo) if arquivo else None
+        self._memoria = deque(maxlen=capacidade)
+        self._lock = threading.Lock()
+        self._conexao = None
+        self._pid = None
+        self._proximo_id = 1
+        self._gravacoes = 0
+        if self.arquivo:
+            with self._lock:
+                ultimo = self._db().execute("SELECT MAX(id) FROM historico").fetchone()[0]
+                self._proximo_id = (ultimo or 0) + 1
+
+    def _db(self) -> sqlite3.Connection:
+        """Conexão do processo atual (reabre após fork)"""
+        if self._conexao is None or self._pid != os.getpid():
+            self.arquivo.parent.mkdir(parents=True, exist_ok=True)
+            self._conexao = sqlite3.connect(str(self.arquivo), timeout=5, check_same_thread=False)
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS historico "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, prompt TEXT, dados TEXT NOT NULL)"
+            )
+            self._conexao.commit()
+            self._pid = os.getpid()
+        return self._conexao
+
+    def registrar(self, entrada: Dict) -> Dict:
+        """Adiciona entrada (recebe `id` e `timestamp`)"""
+        with self._lock:
+            registro = {"id": self._proximo_id, "timestamp": datetime.now().isoformat(), **entrada}
+            if self.arquivo:
+                try:
+                    db = self._db()
+                    cursor = db.execute(
+                        "INSERT INTO historico (prompt, dados) VALUES (?, ?)",
+                        (registro.get("prompt"), json.dumps(registro, ensure_ascii=False))
+                    )
+                    # Id do disco manda (vários processos escrevem no mesmo arquivo)
+                    registro["id"] = cursor.lastrowid
+                    self._gravacoes += 1
+                    if self._gravacoes % 100 == 0:
+                        db.execute("DELETE FROM historico WHERE id <= ?", (registro["id"] - self.retencao,))
+                    db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Falha ao gravar histórico em disco: {e}")
+            self._proximo_id = registro["id"] + 1
+            self._memoria.append(registro)
+            return registro
+
+    def listar(self, limite: int = 10, cursor: Optional[int] = None,
+               busca: Optional[str] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        Página de até `limite` entradas com id < `cursor`, em ordem cronológica
+
+        Returns:
+            (entradas, próximo cursor ou None quando não há mais)
+        """
+        limite = max(1, limite)
+        if self.arquivo:
+            return self._listar_disco(limite, cursor, busca)
+
+        busca = busca.lower() if busca else None
+        pagina = []
+        with self._lock:
+            for registro in reversed(self._memoria):
+                if cursor is not None and registro["id"] >= cursor:
+                    continue
+                if busca and busca not in (registro.get("prompt") or "").lower():
+                    continue
+                pagina.append(registro)
+                if len(pagina) > limite:
+                    break
+        mais = len(pagina) > limite
+        pagina = pagina[:limite][::-1]
+        return pagina, (pagina[0]["id"] if mais and pagina else None)
+
+    def _listar_disco(self, limite: int, cursor: Optional[int],
+                      busca: Optional[str]) -> Tuple[List[Dict], Optional[int]]:
+        sql = "SELECT id, dados FROM historico WHERE 1=1"
+        params = []
+        if cursor is not None:
+            sql += " AND id < ?"
+            params.append(cursor)
+        if busca:
+            sql += " AND prompt LIKE ?"
+            params.append(f"%{busca}%")
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limite + 1)
+        with self._lock:
+            try:
+                linhas = self._db().execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao ler histórico em disco: {e}")
+                linhas = []
+        mais = len(linhas) > limite
+        pagina = [self._carregar(id_, dados) for id_, dados in linhas[:limite]][::-1]
+        return pagina, (pagina[0]["id"] if mais and pagina else None)
+
+    @staticmethod
+    def _carregar(id_: int, dados: str) -> Dict:
+        return {**json.loads(dados), "id": id_}
+
+    def ultimos(self, n: int = 10) -> List[Dict]:
+        """Últimas `n` entradas (ordem cronológica)"""
+        return self.listar(limite=n)[0]
+
+    def exportar(self, bloco: int = 500) -> Iterator[Dict]:
+        """Percorre todo o histórico em blocos, sem copiar tudo de uma vez"""
+        ultimo_id = 0
+        while True:
+            if self.arquivo:
+                with self._lock:
+                    linhas = self._db().execute(
+                        "SELECT id, dados FROM historico WHERE id > ? ORDER BY id LIMIT ?",
+                        (ultimo_id, bloco)
+                    ).fetchall()
+                registros = [self._carregar(id_, dados) for id_, dados in linhas]
+            else:
+                with self._lock:
+                    registros = []
+                    for registro in self._memoria:
+                        if registro["id"] > ultimo_id:
+                            registros.append(registro)
+                            if len(registros) == bloco:
+                                break
+            if not registros:
+                return
+            yield from registros
+            ultimo_id = registros[-1]["id"]
+
+    def limpar(self) -> None:
+        """Apaga memória e disco"""
+        with self._lock:
+            self._memoria.clear()
+            if self.arquivo:
+                try:
+                    self._db().execute("DELETE FROM historico")
+                    self._db().commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Falha ao limpar histórico em disco: {e}")
+
+    def __len__(self) -> int:
+        if self.arquivo:
+            with self._lock:
+                return self._db().execute("SELECT COUNT(*) FROM historico").fetchone()[0]
+        return len(self._memoria)
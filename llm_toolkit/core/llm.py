@@ -1,51 +1,856 @@
 """Biblioteca LLM local - llama.cpp"""
 
+import codecs
+import hashlib
+import os
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import TimeoutError as FuturoTimeout
 from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from ..config import config
+from .cache import gerar_chave, obter_cache
+from .metricas import (ERROS, GERACOES, INICIO_PROCESSO, PRIMEIRO_BLOCO, TOKENS, TOKENS_AVALIADOS, TOKENS_SEG,
+                       tipo_erro)
+from .modelos import Modelo, RegistroModelos, obter_registro
+from .parada import DetectorParada, anotar_fim, coletar_fim, concluir, consumir, consumir_async, estimar_tokens
+from .perfil import analisar_tempos, anotar, anotar_llama, em_thread, fase, rastrear
+from .prefixo import CachePrefixo
+from .sessoes import GerenciadorSessoes, Sessao, obter_sessoes
+from .similares import obter_similares
 
 BASE_DIR = Path(__file__).parent.parent
-LLAMA_EXE = BASE_DIR / "bin" / "llama-cli.exe"
-MODEL_FILE = BASE_DIR / "resources" / "models" / "gemma-2-2b-it-Q4_K_M.gguf"
+LLAMA_EXE = Path(os.getenv("LLM_BINARIO") or BASE_DIR / "bin" / "llama-cli.exe")
+LLAMA_SERVER_EXE = Path(os.getenv("LLM_BINARIO_SERVIDOR") or BASE_DIR / "bin" / "llama-server.exe")
+MODELS_DIR = BASE_DIR / "resources" / "models"
+MODEL_FILE = Path(os.getenv("LLM_MODELO") or MODELS_DIR / "gemma-2-2b-it-Q4_K_M.gguf")
 PROMPT_FILE = BASE_DIR / "resources" / "prompts" / "system.txt"
+CACHE_DIR = BASE_DIR / "resources" / "cache"
+PERFIS_DIR = CACHE_DIR / "perfis"
+
+_prefixo = CachePrefixo(CACHE_DIR)
+
+# Respostas que indicam falha (nunca vão para o cache)
+RESPOSTAS_ERRO = ("Erro:", "Falta", "Timeout", "Prompt vazio", "Resposta vazia")
+
+
+def _ler_system() -> str:
+    return PROMPT_FILE.read_text("utf-8").strip() if PROMPT_FILE.exists() else ""
+
+
+def _montar_prompt(prompt: str) -> str:
+    """Sistema + prompt"""
+    return f"{_ler_system()}\n\nQ: {prompt.strip()}\nA:"
+
+
+def _montar_conversa(turnos: list, prompt: str) -> str:
+    """Sistema + turnos anteriores + prompt: cada turno estende o prompt montado do anterior"""
+    anteriores = "".join(f"Q: {pergunta}\nA: {resposta}\n" for pergunta, resposta in turnos)
+    return f"{_ler_system()}\n\n{anteriores}Q: {prompt.strip()}\nA:"
+
+
+def _args_memoria() -> list:
+    """Como o llama.cpp mapeia o modelo (LLM_MMAP / LLM_MLOCK)"""
+    args = []
+    if not config.llm.mmap:
+        args.append("--no-mmap")
+    if config.llm.mlock:
+        args.append("--mlock")
+    return args
+
+
+def registro_modelos() -> RegistroModelos:
+    """Modelos configurados: LLM_MODELO ('padrao') mais os de LLM_MODELOS"""
+    return obter_registro(MODEL_FILE, MODELS_DIR)
+
+
+def _modelo(nome: Optional[str] = None) -> Modelo:
+    """Modelo do registro (o padrão se None); ValueError se desconhecido"""
+    return registro_modelos().obter(nome)
+
+
+def perfil_ajuste(arquivo: Path = MODEL_FILE) -> Dict:
+    """Threads e lote do perfil de ajuste deste host e modelo ({} se não houver ou LLM_PERFIL=false)"""
+    if not config.llm.perfil or not arquivo.exists():
+        return {}
+    from .ajuste import carregar_perfil
+    return carregar_perfil(PERFIS_DIR, arquivo)
+
+
+def _args_execucao(arquivo: Path = MODEL_FILE) -> list:
+    """Memória e desempenho: LLM_THREADS / LLM_BATCH têm precedência sobre o perfil de ajuste"""
+    args = _args_memoria()
+    perfil = perfil_ajuste(arquivo)
+    threads = config.llm.threads or perfil.get("threads")
+    batch = config.llm.batch or perfil.get("batch")
+    if threads:
+        args += ["--threads", str(threads)]
+    if batch:
+        args += ["--batch-size", str(batch)]
+    return args
+
+
+def _args_llama(full_prompt: str, temp: float, tokens: int, arquivo: Path = MODEL_FILE,
+                cache_sessao: Optional[Path] = None) -> list:
+    """
+    Linha de comando do llama-cli (reaproveita o KV do prefixo do sistema)
+
+    Com `cache_sessao` o llama-cli lê o estado da conversa desse arquivo e o
+    regrava com o prompt novo (o arquivo nasce como cópia do prefixo).
+    """
+    # Sem --log-disable: o stderr traz os tempos de carga/prompt/geração
+    args = [
+        str(LLAMA_EXE), "-m", str(arquivo), "-p", full_prompt,
+        "--temp", str(temp), "-n", str(tokens), "--repeat-penalty", "1.1",
+        "--ctx-size", str(config.llm.contexto), "--simple-io", *_args_execucao(arquivo)
+    ]
+    if cache_sessao is not None:
+        if not cache_sessao.exists() and config.llm.cache_prefixo:
+            prefixo = _prefixo.arquivo(LLAMA_EXE, arquivo, _ler_system())
+            if prefixo:
+                cache_sessao.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(prefixo, cache_sessao)
+        args += ["--prompt-cache", str(cache_sessao)]
+    elif config.llm.cache_prefixo:
+        prefixo = _prefixo.arquivo(LLAMA_EXE, arquivo, _ler_system())
+        if prefixo:
+            args += ["--prompt-cache", str(prefixo), "--prompt-cache-ro"]
+    return args
+
+
+def comando_medicao(prompt: str, tokens: int, arquivo: Path = MODEL_FILE) -> list:
+    """llama-cli determinístico para medições, sem --threads/--batch-size (quem mede escolhe)"""
+    return [
+        str(LLAMA_EXE), "-m", str(arquivo), "-p", _montar_prompt(prompt),
+        "--temp", "0", "-n", str(tokens), "--ignore-eos", "--ctx-size", str(config.llm.contexto),
+        "--simple-io", "--no-display-prompt", *_args_memoria()
+    ]
+
+
+def _slots() -> int:
+    """Slots por worker residente: com lotes ativos, `lote_max`"""
+    return config.llm.lote_max if config.llm.lote_janela_ms > 0 else 1
+
+
+def _obter_pool(modelo: Modelo):
+    """
+    Pool de workers residentes do modelo (`_slots()` slots por worker)
+
+    Passa pelo registro: carregar um modelo pode despejar outros (LLM_RAM_MAX_MB).
+    """
+    # Importado só no modo residente (urllib/ssl pesam no import do pacote)
+    from .pool import obter_pool
+    slots = _slots()
+    return registro_modelos().residir(
+        modelo,
+        lambda: obter_pool(config.llm.workers, LLAMA_SERVER_EXE, modelo.arquivo, slots=slots,
+                           args_extra=_args_execucao(modelo.arquivo), contexto=config.llm.contexto,
+                           nome=modelo.nome),
+        contexto=config.llm.contexto * slots,
+        timeout=config.llm.timeout
+    )
+
+
+def _tokenizador(arquivo: Path = MODEL_FILE):
+    """Vocabulário do GGUF (None se o modelo não existe ou o tokenizador não é suportado)"""
+    from .vocabulario import obter_tokenizador
+    return obter_tokenizador(arquivo)
+
+
+def contar_tokens(texto: str, modelo: Optional[str] = None) -> int:
+    """Tokens de `texto` no vocabulário do modelo (estimativa sem ele); resultado em cache"""
+    tokenizador = _tokenizador(_modelo(modelo).arquivo)
+    return tokenizador.contar(texto) if tokenizador else estimar_tokens(texto)
+
+
+def tokens_prompt(prompt: str, modelo: Optional[str] = None) -> Optional[int]:
+    """Tokens do prompt montado (sistema + pergunta); None sem vocabulário"""
+    tokenizador = _tokenizador(_modelo(modelo).arquivo)
+    if tokenizador is None:
+        return None
+    completo = _montar_prompt(prompt)
+    # Nem com a maior peça em cada posição caberia: limite inferior, sem tokenizar
+    if len(completo) > config.llm.contexto * tokenizador.maior_peca:
+        return len(completo) // tokenizador.maior_peca
+    return tokenizador.contar(completo)
+
+
+def orcar_tokens(prompt: str, tokens: int, modelo: Optional[str] = None) -> Tuple[int, Optional[str]]:
+    """
+    Limita `tokens` ao espaço que o prompt deixa livre no contexto
+
+    Returns:
+        (tokens ajustado, erro se o prompt não cabe no contexto)
+    """
+    usados = tokens_prompt(prompt, modelo)
+    if usados is None:
+        return tokens, None
+    livre = config.llm.contexto - usados
+    if livre < 1:
+        return tokens, f"Prompt excede o contexto ({usados} de {config.llm.contexto} tokens)"
+    return min(tokens, livre), None
+
+
+def _obter_loteador(modelo: Modelo):
+    """Loteador do modelo: despacha lotes multi-sequência no pool dele"""
+    from .lote import obter_loteador
+    return obter_loteador(
+        lambda prompts, t, n: _obter_pool(modelo).executar_lote(prompts, t, n, config.llm.timeout,
+                                                                config.llm.paradas),
+        janela=config.llm.lote_janela_ms / 1000,
+        max_lote=config.llm.lote_max,
+        paralelo=config.llm.workers,
+        nome=modelo.nome
+    )
+
+
+def _executar_pool(full_prompt: str, temp: float, tokens: int, modelo: Modelo) -> str:
+    """Executa direto no pool ou via loteador (requisições concorrentes viram um lote)"""
+    if config.llm.lote_janela_ms <= 0:
+        pool = _obter_pool(modelo)
+        with fase("execucao"):
+            return pool.executar(full_prompt, temp, tokens, config.llm.timeout, config.llm.paradas)
+
+    with fase("lote"):
+        futuro = _obter_loteador(modelo).submeter(full_prompt, temp, tokens)
+        return _concluir_lote(futuro.result(timeout=config.llm.timeout), tokens)
+
+
+def _executar_sessao(full_prompt: str, temp: float, tokens: int, modelo: Modelo, sessao: Sessao) -> str:
+    """No worker e slot da sessão, fora do loteador: o KV da conversa está lá"""
+    pool = _obter_pool(modelo)
+    with fase("execucao"):
+        return pool.executar(full_prompt, temp, tokens, config.llm.timeout, config.llm.paradas,
+                             posicao=(sessao.trabalhador, sessao.slot))
+
+
+async def _executar_pool_async(full_prompt: str, temp: float, tokens: int, modelo: Modelo) -> str:
+    """Como `_executar_pool`; no modo lote espera o Future sem ocupar uma thread"""
+    # asyncio só no caminho assíncrono (pesa no import do pacote)
+    import asyncio
+    if config.llm.lote_janela_ms <= 0:
+        # Carregar o modelo pode esperar RAM ou despejar outro: fora do event loop
+        pool = await em_thread(_obter_pool, modelo)
+        with fase("execucao"):
+            return await pool.executar_async(full_prompt, temp, tokens, config.llm.timeout,
+                                             config.llm.paradas)
+
+    with fase("lote"):
+        futuro = _obter_loteador(modelo).submeter(full_prompt, temp, tokens)
+        return _concluir_lote(await asyncio.wait_for(asyncio.wrap_future(futuro), config.llm.timeout),
+                              tokens)
+
+
+def _concluir_lote(resultado: tuple, tokens: int) -> str:
+    """Registra o término de um item do lote no contexto de quem o pediu"""
+    texto, motivo, gerados = resultado
+    if gerados:
+        anotar_fim(tokens_gerados=gerados)
+    concluir(motivo, texto, tokens)
+    return texto
+
+
+def _contexto_cache(temp: float, tokens: int, arquivo: Path = MODEL_FILE) -> Optional[Dict]:
+    """Parâmetros além do prompt que determinam a resposta, ou None quando a chamada não é cacheável"""
+    if not config.cache.ativo:
+        return None
+    if config.cache.somente_deterministico and temp > 0:
+        return None
+    modelo = arquivo.stat()
+    return {
+        "temp": float(temp),
+        "tokens": int(tokens),
+        "paradas": config.llm.paradas,
+        "system": hashlib.sha256(_ler_system().encode("utf-8")).hexdigest(),
+        "modelo": [arquivo.name, modelo.st_size, modelo.st_mtime_ns],
+    }
+
+
+def _consultar_cache(prompt: str, temp: float, tokens: int,
+                     arquivo: Path = MODEL_FILE) -> Tuple[Optional[Tuple], Optional[str]]:
+    """
+    Retorna (chaves, resposta em cache); chaves None quando a chamada não é cacheável
+
+    Depois do cache exato consulta o aproximado (CACHE_SIMILARES), que
+    anota `aproximada` e `similaridade` nos detalhes do término.
+    """
+    with fase("cache"):
+        contexto = _contexto_cache(temp, tokens, arquivo)
+        if contexto is None:
+            return None, None
+        chaves = (gerar_chave(prompt=prompt.strip(), **contexto), gerar_chave(**contexto))
+        resposta = obter_cache().obter(chaves[0])
+        if resposta is None and config.cache.similares:
+            achada = obter_similares().obter(prompt, chaves[1])
+            if achada is not None:
+                resposta, similaridade = achada
+                anotar_fim(motivo="cache", aproximada=True, similaridade=round(similaridade, 3))
+        return chaves, resposta
+
+
+def _gravar_cache(chaves: Optional[Tuple], prompt: str, resp: str) -> None:
+    if chaves and not resp.startswith(RESPOSTAS_ERRO):
+        obter_cache().gravar(chaves[0], resp)
+        if config.cache.similares:
+            obter_similares().gravar(prompt, chaves[1], resp)
+
+
+def verificar_arquivos() -> Dict[str, bool]:
+    """Binário do modo atual (llama-cli ou llama-server) e todos os modelos do registro presentes?"""
+    binario = LLAMA_SERVER_EXE if config.llm.workers > 0 else LLAMA_EXE
+    modelos = registro_modelos().modelos.values()
+    return {"binario": binario.exists(), "modelo": all(m.arquivo.exists() for m in modelos)}
+
+
+def aquecer() -> str:
+    """
+    Geração mínima que sobe os workers do modelo padrão (ou o llama-cli e o cache de prefixo)
+
+    Não passa pelo cache de respostas. Retorna a resposta (ou o erro) obtida.
+    """
+    return _gerar("Olá", 0.0, 1, _modelo())
+
+
+def _limpar_resposta(resp: str) -> str:
+    """Remove marcadores e mantém só a primeira linha"""
+    resp = (resp or "").strip()
+
+    # Remover marcadores comuns
+    for mark in ["A:", "Resposta:", "Assistant:", "Q:"]:
+        if mark in resp:
+            resp = resp.split(mark)[-1].strip()
+
+    # Só primeira linha
+    return resp.split('\n')[0].strip()
+
+
+def gerar_resposta(prompt: str, temp: float = 0.7, tokens: int = 256, modelo: Optional[str] = None) -> str:
+    """Gera resposta com LLM local - Gemma 2B (ou `modelo`, um nome do registro)"""
+    return gerar_resposta_detalhada(prompt, temp, tokens, modelo)[0]
+
+
+def gerar_resposta_detalhada(prompt: str, temp: float = 0.7, tokens: int = 256,
+                             modelo: Optional[str] = None) -> Tuple[str, Dict]:
+    """
+    Como `gerar_resposta`, mais os detalhes do término
+
+    Returns:
+        (resposta, {"motivo", "tokens_gerados", "tokens_economizados"}); motivo
+        é 'parada', 'limite', 'fim', 'cache' ou 'erro'
+    """
+    try:
+        m = _modelo(modelo)
+    except ValueError as e:
+        return f"Erro: {e}", {"motivo": "erro"}
+    inicio = time.perf_counter()
+    with rastrear("gerar_resposta") as rastreio, coletar_fim() as fim:
+        modo, resp = _gerar_com_cache(prompt, temp, tokens, m)
+    return resp, _fechar(m, modo, resp, time.perf_counter() - inicio, rastreio.llama, fim)
+
+
+async def gerar_resposta_async(prompt: str, temp: float = 0.7, tokens: int = 256,
+                               modelo: Optional[str] = None) -> str:
+    """
+    Como `gerar_resposta`, sem bloquear o event loop
+
+    O llama-cli roda como subprocesso asyncio e os workers residentes são
+    chamados via HTTP assíncrono: gerações pendentes não ocupam threads.
+    """
+    return (await gerar_resposta_detalhada_async(prompt, temp, tokens, modelo))[0]
+
+
+async def gerar_resposta_detalhada_async(prompt: str, temp: float = 0.7, tokens: int = 256,
+                                         modelo: Optional[str] = None) -> Tuple[str, Dict]:
+    """Versão assíncrona de `gerar_resposta_detalhada`"""
+    try:
+        m = _modelo(modelo)
+    except ValueError as e:
+        return f"Erro: {e}", {"motivo": "erro"}
+    inicio = time.perf_counter()
+    with rastrear("gerar_resposta") as rastreio, coletar_fim() as fim:
+        modo, resp = await _gerar_com_cache_async(prompt, temp, tokens, m)
+    return resp, _fechar(m, modo, resp, time.perf_counter() - inicio, rastreio.llama, fim)
+
+
+def sessoes() -> GerenciadorSessoes:
+    """Sessões de conversa abertas (SESSOES_MAX / SESSOES_OCIOSA)"""
+    return obter_sessoes(config.llm.workers, _slots())
+
+
+def gerar_turno(sessao: Sessao, prompt: str, temp: float = 0.7, tokens: int = 256) -> Tuple[str, Dict]:
+    """
+    Acrescenta um turno à sessão e gera a resposta
+
+    Só os tokens do turno novo são avaliados: o estado da conversa fica no
+    slot da sessão (workers residentes) ou no cache de prompt dela em disco
+    (llama-cli). Não passa pelo cache de respostas. Turnos com erro não
+    entram na conversa.
 
+    Returns:
+        (resposta, detalhes de `gerar_resposta_detalhada` + "tokens_avaliados"
+        quando o llama.cpp informa)
+    """
+    try:
+        m = _modelo(sessao.modelo)
+    except ValueError as e:
+        return f"Erro: {e}", {"motivo": "erro"}
+    inicio = time.perf_counter()
+    with rastrear("gerar_turno") as rastreio, coletar_fim() as fim:
+        modo, resp = _gerar_turno(sessao, prompt, temp, tokens, m)
+    detalhes = _fechar(m, modo, resp, time.perf_counter() - inicio, rastreio.llama, fim)
+    # Exato quando o llama.cpp termina sozinho; senão, estimado pela conversa
+    avaliados = rastreio.llama.get("prompt_tokens", fim.get("tokens_avaliados"))
+    if avaliados is not None and detalhes.get("motivo") != "erro":
+        detalhes["tokens_avaliados"] = int(avaliados)
+        TOKENS_AVALIADOS.inc(avaliados)
+    return resp, detalhes
+
+
+def _gerar_turno(sessao: Sessao, prompt: str, temp: float, tokens: int, modelo: Modelo) -> Tuple[str, str]:
+    """Retorna (modo, resposta); um turno por vez na sessão"""
+    modo = "pool" if config.llm.workers > 0 else "processo"
+
+    if not prompt.strip(): return modo, "Prompt vazio"
+    if not modelo.arquivo.exists(): return modo, "Falta modelo: execute download.py"
+
+    try:
+        with sessao.uso(config.llm.timeout):
+            tokens, usados, erro = _orcar_conversa(sessao, prompt, tokens, modelo)
+            if erro: return modo, f"Erro: {erro}"
+            resp = _gerar(prompt, temp, tokens, modelo, sessao)
+            if not resp.startswith(RESPOSTAS_ERRO):
+                sessao.turnos.append((prompt.strip(), resp))
+                anotar_fim(tokens_avaliados=max(0, usados - sessao.tokens_estado))
+                sessao.tokens_estado = usados
+            return modo, resp
+    except TimeoutError as e:
+        return modo, str(e)
+
+
+def _orcar_conversa(sessao: Sessao, prompt: str, tokens: int,
+                    modelo: Modelo) -> Tuple[int, int, Optional[str]]:
+    """
+    Como `orcar_tokens`, para a conversa inteira: (tokens ajustado, tokens do prompt, erro)
+
+    Sem espaço para `tokens`, os turnos mais antigos saem da conversa (o
+    prefixo muda e este turno reavalia o que restou, uma única vez).
+    """
+    tokenizador = _tokenizador(modelo.arquivo)
+    contar = tokenizador.contar if tokenizador else estimar_tokens
+    usados = contar(_montar_conversa(sessao.turnos, prompt))
+    while sessao.turnos and usados + tokens > config.llm.contexto:
+        sessao.turnos.pop(0)
+        sessao.tokens_estado = 0
+        usados = contar(_montar_conversa(sessao.turnos, prompt))
+    livre = config.llm.contexto - usados
+    if livre < 1:
+        return tokens, usados, f"Prompt excede o contexto ({usados} de {config.llm.contexto} tokens)"
+    return min(tokens, livre), usados, None
+
+
+def _fechar(modelo: Modelo, modo: str, resp: str, duracao: float, llama: Dict, fim: Dict) -> Dict:
+    """Métricas globais e do modelo; retorna os detalhes do término"""
+    _medir(modo, resp, duracao, llama)
+    detalhes = _detalhes_fim(modo, resp, fim)
+    registro_modelos().registrar(modelo, duracao, erro=detalhes.get("motivo") == "erro",
+                                 cache=modo == "cache", tokens=detalhes.get("tokens_gerados", 0))
+    return detalhes
+
+
+def _detalhes_fim(modo: str, resp: str, fim: Dict) -> Dict:
+    if resp.startswith(RESPOSTAS_ERRO):
+        return {"motivo": "erro"}
+    if modo == "cache":
+        return {"motivo": "cache", **{k: fim[k] for k in ("aproximada", "similaridade") if k in fim}}
+    return {k: fim[k] for k in ("motivo", "tokens_gerados", "tokens_economizados") if k in fim}
+
+
+def _medir(modo: str, resp: str, duracao: float, llama: Dict) -> None:
+    """Registra duração, erros por tipo e vazão (tempos do llama.cpp ou palavras)"""
+    GERACOES.observar(duracao, modo=modo)
+    tipo = tipo_erro(resp)
+    if tipo:
+        ERROS.inc(tipo=tipo)
+    elif modo != "cache":
+        if llama.get("geracao_tokens") and llama.get("geracao_ms"):
+            TOKENS.inc(llama["geracao_tokens"])
+            TOKENS_SEG.observar(llama["geracao_tokens"] / llama["geracao_ms"] * 1000)
+            return
+        palavras = len(resp.split())
+        TOKENS.inc(palavras)
+        if duracao > 0:
+            TOKENS_SEG.observar(palavras / duracao)
+
+
+def _gerar_com_cache(prompt: str, temp: float, tokens: int, modelo: Modelo) -> Tuple[str, str]:
+    """Retorna (modo, resposta); modo é 'cache', 'pool' ou 'processo'"""
+    modo = "pool" if config.llm.workers > 0 else "processo"
 
-def gerar_resposta(prompt: str, temp: float = 0.7, tokens: int = 256) -> str:
-    """Gera resposta com LLM local - Gemma 2B"""
-    
     # Validações rápidas
-    if not prompt.strip(): return "Prompt vazio"
-    if not LLAMA_EXE.exists(): return "Falta binário: execute download.py"
-    if not MODEL_FILE.exists(): return "Falta modelo: execute download.py"
-    
-    try:
-        # Sistema + prompt
-        system = PROMPT_FILE.read_text("utf-8").strip() if PROMPT_FILE.exists() else ""
-        full_prompt = f"{system}\n\nQ: {prompt.strip()}\nA:"
-        
-        # Executar llama.cpp
-        result = subprocess.run([
-            str(LLAMA_EXE), "-m", str(MODEL_FILE), "-p", full_prompt,
-            "--temp", str(temp), "-n", str(tokens), "--repeat-penalty", "1.1",
-            "--ctx-size", "2048", "--log-disable", "--simple-io"
-        ], capture_output=True, text=True, timeout=60, errors='ignore')
-        
-        if result.returncode != 0:
-            return f"Erro: {result.stderr[:100] if result.stderr else 'Erro exec'}"
-        
-        # Limpar resposta
-        resp = (result.stdout or "").strip()
-        
-        # Remover marcadores comuns
-        for mark in ["A:", "Resposta:", "Assistant:", "Q:"]:
-            if mark in resp:
-                resp = resp.split(mark)[-1].strip()
-        
-        # Só primeira linha
-        resp = resp.split('\n')[0].strip()
-        
-        return resp or "Resposta vazia"
-        
-    except subprocess.TimeoutExpired:
-        return "Timeout (60s)"
+    if not prompt.strip(): return modo, "Prompt vazio"
+    if not modelo.arquivo.exists(): return modo, "Falta modelo: execute download.py"
+    tokens, erro = orcar_tokens(prompt, tokens, modelo.nome)
+    if erro: return modo, f"Erro: {erro}"
+
+    chaves, em_cache = _consultar_cache(prompt, temp, tokens, modelo.arquivo)
+    if em_cache is not None:
+        return "cache", em_cache
+
+    resp = _gerar(prompt, temp, tokens, modelo)
+    _gravar_cache(chaves, prompt, resp)
+    return modo, resp
+
+
+async def _gerar_com_cache_async(prompt: str, temp: float, tokens: int, modelo: Modelo) -> Tuple[str, str]:
+    """Versão assíncrona de `_gerar_com_cache`"""
+    modo = "pool" if config.llm.workers > 0 else "processo"
+
+    if not prompt.strip(): return modo, "Prompt vazio"
+    if not modelo.arquivo.exists(): return modo, "Falta modelo: execute download.py"
+    tokens, erro = orcar_tokens(prompt, tokens, modelo.nome)
+    if erro: return modo, f"Erro: {erro}"
+
+    chaves, em_cache = _consultar_cache(prompt, temp, tokens, modelo.arquivo)
+    if em_cache is not None:
+        return "cache", em_cache
+
+    resp = await _gerar_async(prompt, temp, tokens, modelo)
+    _gravar_cache(chaves, prompt, resp)
+    return modo, resp
+
+
+def _gerar(prompt: str, temp: float, tokens: int, modelo: Modelo, sessao: Optional[Sessao] = None) -> str:
+    """Executa o llama.cpp no modelo (sem cache), dentro do limite de gerações dele"""
+    registro = registro_modelos()
+    try:
+        full_prompt = _montar_prompt(prompt) if sessao is None else _montar_conversa(sessao.turnos, prompt)
+
+        # Workers residentes: sem recarregar o modelo a cada chamada
+        if config.llm.workers > 0:
+            if not LLAMA_SERVER_EXE.exists(): return "Falta binário llama-server: execute download.py"
+            with registro.vaga(modelo, config.llm.timeout):
+                if sessao is None:
+                    resp = _executar_pool(full_prompt, temp, tokens, modelo)
+                else:
+                    resp = _executar_sessao(full_prompt, temp, tokens, modelo, sessao)
+            with fase("pos"):
+                return _limpar_resposta(resp) or "Resposta vazia"
+
+        if not LLAMA_EXE.exists(): return "Falta binário: execute download.py"
+
+        # Executar llama.cpp; numa sequência de parada o processo é encerrado
+        with registro.vaga(modelo, config.llm.timeout):
+            blocos = _iniciar_processo(full_prompt, temp, tokens, config.llm.timeout, arquivo=modelo.arquivo,
+                                       cache_sessao=sessao.arquivo if sessao else None)
+            with fase("execucao"):
+                saida = consumir(blocos, config.llm.paradas, tokens)
+        with fase("pos"):
+            return _limpar_resposta(saida) or "Resposta vazia"
+
+    except (TimeoutError, FuturoTimeout) as e:
+        return str(e) if str(e).startswith("Timeout") else f"Timeout ({config.llm.timeout}s)"
     except Exception as e:
         return f"Erro: {str(e)[:100]}"
+
+
+async def _gerar_async(prompt: str, temp: float, tokens: int, modelo: Modelo) -> str:
+    """Versão assíncrona de `_gerar` (mesmas mensagens de erro)"""
+    import asyncio
+    registro = registro_modelos()
+    try:
+        full_prompt = _montar_prompt(prompt)
+
+        if config.llm.workers > 0:
+            if not LLAMA_SERVER_EXE.exists(): return "Falta binário llama-server: execute download.py"
+            async with registro.vaga_async(modelo, config.llm.timeout):
+                resp = await _executar_pool_async(full_prompt, temp, tokens, modelo)
+            with fase("pos"):
+                return _limpar_resposta(resp) or "Resposta vazia"
+
+        if not LLAMA_EXE.exists(): return "Falta binário: execute download.py"
+
+        async with registro.vaga_async(modelo, config.llm.timeout):
+            blocos = await _iniciar_processo_async(full_prompt, temp, tokens, config.llm.timeout,
+                                                   arquivo=modelo.arquivo)
+            with fase("execucao"):
+                saida = await consumir_async(blocos, config.llm.paradas, tokens)
+        with fase("pos"):
+            return _limpar_resposta(saida) or "Resposta vazia"
+
+    except (TimeoutError, asyncio.TimeoutError, FuturoTimeout) as e:
+        return str(e) if str(e).startswith("Timeout") else f"Timeout ({config.llm.timeout}s)"
+    except Exception as e:
+        return f"Erro: {str(e)[:100]}"
+
+
+def _iniciar_processo(full_prompt: str, temp: float, tokens: int, timeout: int,
+                      arquivo: Path = MODEL_FILE, cache_sessao: Optional[Path] = None) -> Iterator[str]:
+    """Inicia o llama-cli e retorna os blocos do stdout conforme são produzidos"""
+    with fase("prefixo"):
+        args = _args_llama(full_prompt, temp, tokens, arquivo, cache_sessao)
+    # stderr num arquivo: sem risco de o pipe encher enquanto lemos o stdout
+    logs = tempfile.TemporaryFile()
+    inicio = time.perf_counter()
+    with fase("processo"):
+        proc = subprocess.Popen([*args, "--no-display-prompt"], stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=logs)
+    INICIO_PROCESSO.observar(time.perf_counter() - inicio, modo="processo")
+    return _ler_processo(proc, logs, timeout)
+
+
+def _stream_modelo(full_prompt: str, temp: float, tokens: int, modelo: Modelo) -> Iterator[str]:
+    """Blocos do modelo para o stream (vaga, worker ou processo só na primeira leitura)"""
+    with registro_modelos().vaga(modelo, config.llm.timeout):
+        if config.llm.workers > 0:
+            yield from _obter_pool(modelo).executar_stream(full_prompt, temp, tokens, config.llm.timeout)
+        else:
+            yield from _iniciar_processo(full_prompt, temp, tokens, config.llm.timeout, arquivo=modelo.arquivo)
+
+
+def _ler_processo(proc: subprocess.Popen, logs, timeout: int) -> Iterator[str]:
+    """
+    Lê o stdout em pequenos blocos; fechar o gerador encerra o processo
+
+    Ao terminar sozinho com erro levanta TimeoutError (morto pelo vigia) ou
+    RuntimeError com a última linha do stderr.
+    """
+    vigia = threading.Timer(timeout, proc.kill)
+    vigia.start()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    try:
+        while True:
+            bloco = proc.stdout.read1(64)
+            if not bloco:
+                break
+            texto = decoder.decode(bloco)
+            if texto:
+                yield texto
+        expirou = not vigia.is_alive()
+    finally:
+        vigia.cancel()
+        if proc.poll() is None:
+            proc.kill()
+        codigo = proc.wait()
+        proc.stdout.close()
+        logs.seek(0)
+        stderr = logs.read().decode("utf-8", errors="ignore")
+        logs.close()
+
+    # Daqui em diante o llama-cli terminou sozinho (interrompido não chega aqui)
+    _concluir_processo(codigo, stderr, expirou, timeout)
+
+
+def _concluir_processo(codigo: int, stderr: str, expirou: bool, timeout: int) -> None:
+    """Erro do llama-cli ou, em caso de sucesso, seus tempos e tokens gerados"""
+    if codigo != 0:
+        if expirou:
+            raise TimeoutError(f"Timeout ({timeout}s)")
+        # Com os logs ligados a causa costuma estar no fim do stderr
+        ultima = stderr.strip().splitlines()[-1] if stderr.strip() else 'Erro exec'
+        raise RuntimeError(ultima[:100])
+    tempos = analisar_tempos(stderr)
+    anotar_llama(tempos)
+    if tempos.get("geracao_tokens"):
+        anotar_fim(tokens_gerados=tempos["geracao_tokens"])
+
+
+async def _iniciar_processo_async(full_prompt: str, temp: float, tokens: int, timeout: int,
+                                  arquivo: Path = MODEL_FILE) -> AsyncIterator[str]:
+    """Como `_iniciar_processo`, com subprocesso asyncio"""
+    import asyncio
+    # Na primeira chamada o cache de prefixo roda o llama-cli: fora do event loop
+    with fase("prefixo"):
+        args = await em_thread(_args_llama, full_prompt, temp, tokens, arquivo)
+    inicio = time.perf_counter()
+    with fase("processo"):
+        proc = await asyncio.create_subprocess_exec(
+            *args, "--no-display-prompt", stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    INICIO_PROCESSO.observar(time.perf_counter() - inicio, modo="processo")
+    return _ler_processo_async(proc, timeout)
+
+
+async def _stream_modelo_async(full_prompt: str, temp: float, tokens: int,
+                              modelo: Modelo) -> AsyncIterator[str]:
+    """Como `_stream_modelo`, para o stream assíncrono"""
+    import asyncio
+    async with registro_modelos().vaga_async(modelo, config.llm.timeout):
+        if config.llm.workers > 0:
+            pool = await em_thread(_obter_pool, modelo)
+            blocos = pool.executar_stream_async(full_prompt, temp, tokens, config.llm.timeout)
+        else:
+            blocos = await _iniciar_processo_async(full_prompt, temp, tokens, config.llm.timeout,
+                                                   arquivo=modelo.arquivo)
+        try:
+            async for bloco in blocos:
+                yield bloco
+        finally:
+            await blocos.aclose()
+
+
+async def _ler_processo_async(proc, timeout: int) -> AsyncIterator[str]:
+    """Como `_ler_processo`, lendo o stdout do subprocesso asyncio"""
+    import asyncio
+    # stderr drenado em paralelo: sem risco de o pipe encher enquanto lemos o stdout
+    logs = asyncio.ensure_future(proc.stderr.read())
+    limite = time.monotonic() + timeout
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    try:
+        while True:
+            try:
+                bloco = await asyncio.wait_for(proc.stdout.read(64), limite - time.monotonic())
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Timeout ({timeout}s)") from None
+            if not bloco:
+                break
+            texto = decoder.decode(bloco)
+            if texto:
+                yield texto
+    finally:
+        # Timeout, parada ou tarefa cancelada: o llama-cli não fica órfão
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        codigo = await proc.wait()
+        stderr = (await logs).decode("utf-8", errors="ignore")
+
+    _concluir_processo(codigo, stderr, False, timeout)
+
+
+class _PrimeiraLinha:
+    """Corte do stream na primeira quebra de linha ou sequência de parada"""
+
+    def __init__(self, modo: str, tokens: int, modelo: Optional[Modelo] = None):
+        self.detector = DetectorParada(["\n", *config.llm.paradas])
+        self.modo = modo
+        self.tokens = tokens
+        self.modelo = modelo
+        self.comeco = time.perf_counter()
+        self.primeiro = True
+
+    def trecho(self, bloco: str) -> str:
+        """Parte de `bloco` que pode ser repassada ao cliente"""
+        trecho = self.detector.alimentar(bloco)
+        if trecho and self.primeiro:
+            self.primeiro = False
+            PRIMEIRO_BLOCO.observar(time.perf_counter() - self.comeco, modo=self.modo)
+            anotar("primeiro_bloco", (time.perf_counter() - self.comeco) * 1000)
+        return trecho
+
+    def final(self) -> str:
+        """Resto retido ao fim da saída (registra o término da geração)"""
+        resto = self.detector.finalizar().rstrip()
+        detalhes = concluir("parada" if self.detector.parou else None, self.detector.texto, self.tokens)
+        self._registrar(tokens=detalhes["tokens_gerados"])
+        return resto
+
+    def _registrar(self, erro: bool = False, tokens: int = 0) -> None:
+        if self.modelo is not None:
+            registro_modelos().registrar(self.modelo, time.perf_counter() - self.comeco, erro=erro, tokens=tokens)
+
+
+def _primeira_linha(blocos: Iterator[str], modo: str = "processo", tokens: int = 256,
+                    modelo: Optional[Modelo] = None) -> Iterator[str]:
+    """Repassa blocos até a primeira quebra de linha com conteúdo (ou sequência de parada)"""
+    corte = _PrimeiraLinha(modo, tokens, modelo)
+    try:
+        for bloco in blocos:
+            trecho = corte.trecho(bloco)
+            if trecho:
+                yield trecho
+            if corte.detector.parou:
+                break
+    except Exception:
+        corte._registrar(erro=True)
+        raise
+    finally:
+        # Encerra o processo/worker assim que a linha termina
+        blocos.close()
+    resto = corte.final()
+    if resto:
+        yield resto
+
+
+async def _primeira_linha_async(blocos: AsyncIterator[str], modo: str = "processo",
+                                tokens: int = 256, modelo: Optional[Modelo] = None) -> AsyncIterator[str]:
+    """Versão assíncrona de `_primeira_linha`"""
+    corte = _PrimeiraLinha(modo, tokens, modelo)
+    try:
+        async for bloco in blocos:
+            trecho = corte.trecho(bloco)
+            if trecho:
+                yield trecho
+            if corte.detector.parou:
+                break
+    except Exception:
+        corte._registrar(erro=True)
+        raise
+    finally:
+        await blocos.aclose()
+    resto = corte.final()
+    if resto:
+        yield resto
+
+
+def gerar_resposta_stream(prompt: str, temp: float = 0.7, tokens: int = 256,
+                          modelo: Optional[str] = None) -> Iterator[str]:
+    """
+    Gera resposta em blocos, conforme o llama.cpp produz
+
+    Mesmo pós-processamento de `gerar_resposta` (só a primeira linha), mas
+    falhas são levantadas: ValueError para prompt vazio, maior que o
+    contexto ou modelo desconhecido, RuntimeError quando
+    falta binário/modelo e TimeoutError/OSError durante a geração.
+    """
+    m = _modelo(modelo)
+    full_prompt, tokens, em_cache = _preparar_stream(prompt, temp, tokens, m)
+    if em_cache is not None:
+        return iter([em_cache])
+    modo = "pool" if config.llm.workers > 0 else "processo"
+    return _primeira_linha(_stream_modelo(full_prompt, temp, tokens, m), modo, tokens, m)
+
+
+def gerar_resposta_stream_async(prompt: str, temp: float = 0.7, tokens: int = 256,
+                                modelo: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Como `gerar_resposta_stream`, mas os blocos chegam por `async for`
+
+    Validação (ValueError/RuntimeError) acontece já na chamada.
+    """
+    m = _modelo(modelo)
+    full_prompt, tokens, em_cache = _preparar_stream(prompt, temp, tokens, m)
+    if em_cache is not None:
+        return _repassar(em_cache)
+    modo = "pool" if config.llm.workers > 0 else "processo"
+    return _primeira_linha_async(_stream_modelo_async(full_prompt, temp, tokens, m), modo, tokens, m)
+
+
+def _preparar_stream(prompt: str, temp: float, tokens: int,
+                     modelo: Modelo) -> Tuple[str, int, Optional[str]]:
+    """Validações do stream; retorna (prompt montado, tokens ajustado, resposta em cache)"""
+    if not prompt.strip(): raise ValueError("Prompt vazio")
+    if not modelo.arquivo.exists(): raise RuntimeError("Falta modelo: execute download.py")
+    tokens, erro = orcar_tokens(prompt, tokens, modelo.nome)
+    if erro: raise ValueError(erro)
+
+    _, em_cache = _consultar_cache(prompt, temp, tokens, modelo.arquivo)
+    if em_cache is not None:
+        registro_modelos().registrar(modelo, 0.0, cache=True)
+        return "", tokens, em_cache
+
+    if config.llm.workers > 0:
+        if not LLAMA_SERVER_EXE.exists(): raise RuntimeError("Falta binário llama-server: execute download.py")
+    elif not LLAMA_EXE.exists():
+        raise RuntimeError("Falta binário: execute download.py")
+    return _montar_prompt(prompt), tokens, None
+
+
+async def _repassar(texto: str) -> AsyncIterator[str]:
+    yield texto
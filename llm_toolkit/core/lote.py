@@ -0,0 +1,153 @@
+"""Agrupamento dinâmico de requisições em lotes multi-sequência"""
+
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Pedido:
+    prompt: str
+    temp: float
+    tokens: int
+    futuro: Future = field(default_factory=Future)
+
+
+class Loteador:
+    """
+    Junta requisições concorrentes numa janela curta e despacha como um lote
+
+    `executar_lote(prompts, temp, tokens)` recebe prompts com os mesmos
+    parâmetros de amostragem e devolve uma resposta por prompt, na ordem;
+    cada chamador recebe a sua pelo Future retornado em `submeter`.
+    """
+
+    def __init__(self, executar_lote: Callable[[List[str], float, int], List[str]],
+                 janela: float = 0.01, max_lote: int = 8, paralelo: int = 1):
+        self.executar_lote = executar_lote
+        self.janela = janela
+        self.max_lote = max_lote
+        self._fila = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=paralelo, thread_name_prefix="lote")
+        # Só coleta quando há quem despache: sob carga os lotes crescem sozinhos
+        self._vagas = threading.Semaphore(paralelo)
+        self._ativo = True
+        self._lock = threading.Lock()
+        self.contadores = {"lotes": 0, "itens": 0, "maior_lote": 0}
+        self._thread = threading.Thread(target=self._laco, name="loteador", daemon=True)
+        self._thread.start()
+
+    def submeter(self, prompt: str, temp: float, tokens: int) -> Future:
+        """Enfileira um prompt; o resultado chega pelo Future"""
+        if not self._ativo:
+            raise RuntimeError("Loteador encerrado")
+        pedido = _Pedido(prompt, temp, tokens)
+        self._fila.put(pedido)
+        return pedido.futuro
+
+    def _laco(self) -> None:
+        """Coleta até `max_lote` pedidos ou até a janela fechar"""
+        while True:
+            self._vagas.acquire()
+            primeiro = self._fila.get()
+            if primeiro is None:
+                return
+            lote = [primeiro]
+            limite = time.monotonic() + self.janela
+            encerrar = False
+
+            while len(lote) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self._fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if pedido is None:
+                    encerrar = True
+                    break
+                lote.append(pedido)
+
+            # Um lote do llama-server compartilha os parâmetros de amostragem
+            grupos = defaultdict(list)
+            for pedido in lote:
+                grupos[(pedido.temp, pedido.tokens)].append(pedido)
+            for i, grupo in enumerate(grupos.values()):
+                if i > 0:
+                    self._vagas.acquire()
+                self._executor.submit(self._despachar, grupo)
+
+            if encerrar:
+                return
+
+    def _despachar(self, grupo: List[_Pedido]) -> None:
+        with self._lock:
+            self.contadores["lotes"] += 1
+            self.contadores["itens"] += len(grupo)
+            self.contadores["maior_lote"] = max(self.contadores["maior_lote"], len(grupo))
+        try:
+            respostas = self.executar_lote([p.prompt for p in grupo], grupo[0].temp, grupo[0].tokens)
+            if len(respostas) != len(grupo):
+                raise RuntimeError(f"Lote retornou {len(respostas)} respostas para {len(grupo)} prompts")
+            for pedido, resposta in zip(grupo, respostas):
+                pedido.futuro.set_result(resposta)
+        except Exception as e:
+            logger.error(f"Falha no lote de {len(grupo)}: {e}")
+            for pedido in grupo:
+                if not pedido.futuro.done():
+                    pedido.futuro.set_exception(e)
+        finally:
+            self._vagas.release()
+
+    def estatisticas(self) -> Dict:
+        """Lotes despachados e tamanho médio"""
+        with self._lock:
+            contadores = dict(self.contadores)
+        lotes = contadores["lotes"]
+        return {
+            **contadores,
+            "tamanho_medio": round(contadores["itens"] / lotes, 2) if lotes else 0.0,
+            "pendentes": self._fila.qsize(),
+            "janela_ms": self.janela * 1000,
+            "max_lote": self.max_lote
+        }
+
+    def encerrar(self) -> None:
+        """Despacha o que já chegou e para a coleta"""
+        if not self._ativo:
+            return
+        self._ativo = False
+        self._fila.put(None)
+        self._vagas.release()
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=True)
+
+
+# Um loteador por modelo (nome do registro)
+_loteadores: Dict[str, Loteador] = {}
+_loteador_lock = threading.Lock()
+
+def obter_loteador(executar_lote: Callable, janela: float, max_lote: int,
+                   paralelo: int, nome: str = "padrao") -> Loteador:
+    """Obtém o loteador do modelo `nome` (criado no primeiro uso)"""
+    with _loteador_lock:
+        if nome not in _loteadores:
+            _loteadores[nome] = Loteador(executar_lote, janela, max_lote, paralelo)
+        return _loteadores[nome]
+
+
+def encerrar_loteador(nome: Optional[str] = None) -> None:
+    """Encerra e descarta o loteador de `nome` (todos se None)"""
+    with _loteador_lock:
+        for chave in [nome] if nome is not None else list(_loteadores):
+            loteador = _loteadores.pop(chave, None)
+            if loteador is not None:
+                loteador.encerrar()
@@ -0,0 +1,204 @@
+"""Métricas no formato texto do Prometheus (contadores, histogramas, medidores)"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Buckets de latência em segundos (geração local vai de ms a minutos)
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BUCKETS_TOKENS_SEG = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500)
+
+
+def _rotulos(nomes: Tuple[str, ...], valores: Tuple[str, ...], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class Contador:
+    """Contador monotônico com rótulos"""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor: float = 1, **rotulos) -> None:
+        chave = tuple(str(rotulos.get(n, "")) for n in self.rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos) -> float:
+        chave = tuple(str(rotulos.get(n, "")) for n in self.rotulos)
+        return self._valores.get(chave, 0)
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, k)} {_numero(v)}" for k, v in itens]
+
+
+class Histograma:
+    """Histograma de buckets fixos (cumulativos na exportação)"""
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = BUCKETS_LATENCIA):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **rotulos) -> None:
+        chave = tuple(str(rotulos.get(n, "")) for n in self.rotulos)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                # [contagens por bucket..., +Inf], soma, total
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def cronometrar(self, **rotulos) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            series = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items())
+        linhas = []
+        for chave, (contagens, soma, total) in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += contagem
+                le = f'le="{_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {total}")
+        return linhas
+
+
+class Medidor:
+    """Valor instantâneo lido no momento da coleta"""
+
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, leitor: Callable[[], Optional[float]]):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.leitor = leitor
+
+    def exportar(self) -> List[str]:
+        try:
+            valor = self.leitor()
+        except Exception:
+            return []
+        return [] if valor is None else [f"{self.nome} {_numero(valor)}"]
+
+
+class Registro:
+    """Conjunto de métricas exportadas juntas"""
+
+    def __init__(self):
+        self._metricas: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()) -> Contador:
+        return self.registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+                   buckets: Tuple[float, ...] = BUCKETS_LATENCIA) -> Histograma:
+        return self.registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def medidor(self, nome: str, ajuda: str, leitor: Callable[[], Optional[float]]) -> Medidor:
+        with self._lock:
+            # Leitor mais recente vence (singletons podem ser recriados)
+            self._metricas[nome] = Medidor(nome, ajuda, leitor)
+            return self._metricas[nome]
+
+    def exportar(self) -> str:
+        """Texto no formato de exposição do Prometheus (0.0.4)"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas = []
+        for m in metricas:
+            linhas.append(f"# HELP {m.nome} {m.ajuda}")
+            linhas.append(f"# TYPE {m.nome} {m.tipo}")
+            linhas.extend(m.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+# Métricas do toolkit
+REQUISICOES = registro.contador(
+    "llm_http_requisicoes_total", "Requisições HTTP atendidas", ("endpoint", "metodo", "status"))
+LATENCIA_HTTP = registro.histograma(
+    "llm_http_latencia_segundos", "Latência das requisições HTTP", ("endpoint",))
+GERACOES = registro.histograma(
+    "llm_geracao_segundos", "Duração de gerar_resposta", ("modo",))
+ERROS = registro.contador(
+    "llm_geracao_erros_total", "Gerações com falha por tipo", ("tipo",))
+INICIO_PROCESSO = registro.histograma(
+    "llm_processo_inicio_segundos", "Tempo até o llama.cpp ficar pronto/produzir saída", ("modo",))
+PRIMEIRO_BLOCO = registro.histograma(
+    "llm_primeiro_bloco_segundos", "Tempo até o primeiro bloco em gerar_resposta_stream", ("modo",))
+ESPERA_FILA = registro.histograma(
+    "llm_fila_espera_segundos", "Espera no controle de admissão", ("prioridade",))
+TOKENS = registro.contador(
+    "llm_tokens_gerados_total", "Tokens gerados (aproximado por palavras quando o backend não informa)")
+TOKENS_SEG = registro.histograma(
+    "llm_tokens_por_segundo", "Vazão de geração por requisição", buckets=BUCKETS_TOKENS_SEG)
+FIM_GERACAO = registro.contador(
+    "llm_geracao_fim_total", "Gerações por motivo de término (parada, limite, fim)", ("motivo",))
+TOKENS_ECONOMIZADOS = registro.contador(
+    "llm_tokens_economizados_total", "Tokens não gerados graças às sequências de parada")
+GERACOES_MODELO = registro.contador(
+    "llm_modelo_geracoes_total", "Gerações por modelo e resultado (ok, erro, cache)", ("modelo", "resultado"))
+DESPEJOS_MODELO = registro.contador(
+    "llm_modelo_despejos_total", "Workers residentes encerrados para liberar RAM", ("modelo",))
+SESSOES_DESCARTADAS = registro.contador(
+    "llm_sessoes_descartadas_total", "Sessões de conversa descartadas (ociosa, limite, encerrada)", ("motivo",))
+TOKENS_AVALIADOS = registro.contador(
+    "llm_sessao_tokens_avaliados_total", "Tokens de prompt avaliados nos turnos de sessão (o resto veio do KV)")
+COALESCIDAS = registro.contador(
+    "llm_geracoes_coalescidas_total", "Requisições atendidas por uma geração igual já em andamento", ("tipo",))
+
+
+def tipo_erro(resposta: str) -> Optional[str]:
+    """Classifica respostas de erro de gerar_resposta ('Timeout', 'Erro', 'Falta', ...)"""
+    for prefixo, tipo in (("Timeout", "timeout"), ("Erro:", "erro"), ("Falta", "falta"),
+                          ("Prompt vazio", "prompt_vazio"), ("Resposta vazia", "resposta_vazia")):
+        if resposta.startswith(prefixo):
+            return tipo
+    return None
@@ -0,0 +1,283 @@
+"""
+Registro de modelos: vários GGUF no mesmo host, com orçamento de RAM
+
+Cada modelo tem nome, arquivo, limite próprio de gerações simultâneas e
+estatísticas. No modo residente (LLM_WORKERS > 0) cada modelo ganha seu
+pool de llama-server; quando carregar mais um estouraria LLM_RAM_MAX_MB,
+os pools ociosos usados há mais tempo são encerrados (LRU). Um modelo
+com gerações em andamento nunca é despejado: quem precisa da RAM espera.
+"""
+
+import logging
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+
+from ..config import config
+from .metricas import DESPEJOS_MODELO, GERACOES_MODELO
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 ** 2
+
+
+def estimar_memoria(arquivo: Path, contexto: int, workers: int, mmap: bool = True) -> int:
+    """
+    Bytes de RAM de `workers` llama-server com o modelo (pesos + cache KV em f16)
+
+    Com mmap os pesos ficam no cache de páginas, compartilhados entre os
+    workers; sem mmap cada worker carrega sua cópia. `contexto` é o total
+    de cada worker (todos os slots).
+    """
+    pesos = arquivo.stat().st_size
+    pesos *= 1 if mmap else workers
+    try:
+        from .vocabulario import LeitorGGUF
+        metadados = LeitorGGUF(arquivo, arrays=False).metadados
+    except (ValueError, OSError, struct.error) as e:
+        logger.warning(f"Metadados de {arquivo.name} indisponíveis ({e}); estimando só pelos pesos")
+        return pesos
+    arquitetura = metadados.get("general.architecture", "")
+    camadas = metadados.get(f"{arquitetura}.block_count") or 0
+    dimensao = metadados.get(f"{arquitetura}.embedding_length") or 0
+    # Por camada em alguns modelos (array): vale a maior
+    cabecas = metadados.get(f"{arquitetura}.attention.head_count") or 1
+    cabecas_kv = metadados.get(f"{arquitetura}.attention.head_count_kv") or cabecas
+    cabecas = max(cabecas) if not isinstance(cabecas, int) else cabecas
+    cabecas_kv = max(cabecas_kv) if not isinstance(cabecas_kv, int) else cabecas_kv
+    # K e V, 2 bytes por valor; GQA reduz a dimensão do KV
+    kv = 2 * camadas * contexto * dimensao * cabecas_kv // max(1, cabecas) * 2
+    return pesos + workers * kv
+
+
+@dataclass
+class Modelo:
+    """Entrada do registro"""
+    nome: str
+    arquivo: Path
+    concorrencia: int = 0      # 0 = só o limite do agendador
+    memoria: Optional[int] = None
+    _vagas: Optional[threading.BoundedSemaphore] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.concorrencia:
+            self._vagas = threading.BoundedSemaphore(self.concorrencia)
+
+
+class RegistroModelos:
+    """Modelos por nome, vagas por modelo e residência dos pools sob o orçamento de RAM"""
+
+    def __init__(self, modelos: Dict[str, Modelo], padrao: str, ram_max: int = 0):
+        self.modelos = modelos
+        self.padrao = padrao
+        self.ram_max = ram_max
+        # Residentes em ordem de uso (o primeiro é o despejado) -> bytes estimados
+        self._residentes: "OrderedDict[str, int]" = OrderedDict()
+        self._cond = threading.Condition()
+        # Corrotinas esperando vaga num modelo -> [(loop, futuro)], acordadas por `_sair`
+        self._esperas: Dict[str, list] = {nome: [] for nome in modelos}
+        self._stats = {nome: {"requisicoes": 0, "erros": 0, "cache": 0, "tokens": 0, "segundos": 0.0,
+                              "ativos": 0, "carregamentos": 0, "despejos": 0}
+                       for nome in modelos}
+
+    def obter(self, nome: Optional[str] = None) -> Modelo:
+        """Modelo pelo nome (o padrão se None); ValueError se desconhecido"""
+        modelo = self.modelos.get(nome or self.padrao)
+        if modelo is None:
+            raise ValueError(f"Modelo desconhecido: '{nome}' (disponíveis: {', '.join(self.modelos)})")
+        return modelo
+
+    def _entrar(self, modelo: Modelo) -> None:
+        with self._cond:
+            self._stats[modelo.nome]["ativos"] += 1
+
+    def _sair(self, modelo: Modelo) -> None:
+        with self._cond:
+            self._stats[modelo.nome]["ativos"] -= 1
+            self._cond.notify_all()
+        if modelo._vagas:
+            modelo._vagas.release()
+            with self._cond:
+                esperas, self._esperas[modelo.nome] = self._esperas[modelo.nome], []
+            for loop, futuro in esperas:
+                loop.call_soon_threadsafe(lambda f=futuro: f.done() or f.set_result(None))
+
+    @contextmanager
+    def vaga(self, modelo: Modelo, timeout: float) -> Iterator[None]:
+        """Reserva uma geração no modelo (TimeoutError se o limite dele não liberar)"""
+        if modelo._vagas and not modelo._vagas.acquire(timeout=timeout):
+            raise TimeoutError(f"Timeout ({timeout}s): modelo '{modelo.nome}' sem vaga")
+        self._entrar(modelo)
+        try:
+            yield
+        finally:
+            self._sair(modelo)
+
+    @asynccontextmanager
+    async def vaga_async(self, modelo: Modelo, timeout: float) -> AsyncIterator[None]:
+        """Como `vaga`, esperando sem ocupar uma thread"""
+        import asyncio
+        if modelo._vagas:
+            limite = time.monotonic() + timeout
+            while not modelo._vagas.acquire(blocking=False):
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise TimeoutError(f"Timeout ({timeout}s): modelo '{modelo.nome}' sem vaga")
+                futuro = asyncio.get_running_loop().create_future()
+                espera = (futuro.get_loop(), futuro)
+                with self._cond:
+                    self._esperas[modelo.nome].append(espera)
+                try:
+                    # Reconfere após registrar: uma vaga liberada antes disso não acordaria ninguém
+                    if modelo._vagas.acquire(blocking=False):
+                        break
+                    await asyncio.wait_for(futuro, restante)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._cond:
+                        if espera in self._esperas[modelo.nome]:
+                            self._esperas[modelo.nome].remove(espera)
+        self._entrar(modelo)
+        try:
+            yield
+        finally:
+            self._sair(modelo)
+
+    def residir(self, modelo: Modelo, carregar: Callable[[], object], contexto: int, timeout: float):
+        """
+        Pool residente de `modelo` (criado por `carregar`), abrindo espaço no orçamento
+
+        Despeja residentes ociosos do menos para o mais recente; se todos
+        estão em uso, espera um liberar (TimeoutError após `timeout`). Um
+        modelo que sozinho não cabe no orçamento carrega assim mesmo.
+        """
+        with self._cond:
+            if modelo.nome in self._residentes:
+                self._residentes.move_to_end(modelo.nome)
+                return carregar()
+
+            # Sem orçamento não há o que estimar (nem cabeçalho a ler)
+            if modelo.memoria is None and self.ram_max:
+                modelo.memoria = estimar_memoria(modelo.arquivo, contexto, config.llm.workers, config.llm.mmap)
+            memoria = modelo.memoria or 0
+            limite = time.monotonic() + timeout
+            while self._falta_ram(memoria):
+                ocioso = next((n for n in self._residentes if self._stats[n]["ativos"] == 0), None)
+                if ocioso is not None:
+                    self._despejar(ocioso)
+                    continue
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise TimeoutError(f"Timeout ({timeout}s): sem RAM para carregar '{modelo.nome}'")
+                self._cond.wait(restante)
+
+            if self.ram_max and memoria > self.ram_max:
+                logger.warning(f"Modelo '{modelo.nome}' ({memoria / _MB:.0f} MB) "
+                               f"excede sozinho o orçamento de {self.ram_max / _MB:.0f} MB")
+            self._residentes[modelo.nome] = memoria
+            self._stats[modelo.nome]["carregamentos"] += 1
+            logger.info(f"Modelo '{modelo.nome}' residente" + (f" (~{memoria / _MB:.0f} MB)" if memoria else ""))
+            return carregar()
+
+    def _falta_ram(self, memoria: int) -> bool:
+        """Carregar `memoria` bytes estouraria o orçamento (e há residentes a despejar)?"""
+        return bool(self.ram_max and self._residentes
+                    and sum(self._residentes.values()) + memoria > self.ram_max)
+
+    def _despejar(self, nome: str) -> None:
+        """Encerra os workers de um modelo residente (chamar com o lock)"""
+        from .lote import encerrar_loteador
+        from .pool import encerrar_pool
+
+        memoria = self._residentes.pop(nome)
+        encerrar_loteador(nome)
+        encerrar_pool(nome)
+        self._stats[nome]["despejos"] += 1
+        DESPEJOS_MODELO.inc(modelo=nome)
+        logger.info(f"Modelo '{nome}' despejado: {memoria / _MB:.0f} MB liberados")
+
+    def registrar(self, modelo: Modelo, duracao: float, erro: bool = False,
+                  cache: bool = False, tokens: int = 0) -> None:
+        """Contabiliza uma geração concluída no modelo"""
+        GERACOES_MODELO.inc(modelo=modelo.nome, resultado="erro" if erro else "cache" if cache else "ok")
+        with self._cond:
+            stats = self._stats[modelo.nome]
+            stats["requisicoes"] += 1
+            stats["erros"] += erro
+            stats["cache"] += cache
+            stats["tokens"] += tokens
+            stats["segundos"] += duracao
+
+    def ram_residente(self) -> int:
+        """Bytes estimados dos modelos residentes"""
+        with self._cond:
+            return sum(self._residentes.values())
+
+    def estatisticas(self) -> Dict:
+        """Modelos, residência e contadores por modelo"""
+        with self._cond:
+            modelos = {}
+            for nome, modelo in self.modelos.items():
+                stats = dict(self._stats[nome])
+                segundos = stats.pop("segundos")
+                modelos[nome] = {
+                    "arquivo": modelo.arquivo.name,
+                    "disponivel": modelo.arquivo.exists(),
+                    "concorrencia": modelo.concorrencia or None,
+                    "residente": nome in self._residentes,
+                    "memoria_mb": round(modelo.memoria / _MB) if modelo.memoria else None,
+                    **stats,
+                    "latencia_media_ms": (round(segundos / stats["requisicoes"] * 1000, 1)
+                                          if stats["requisicoes"] else 0.0),
+                }
+            return {
+                "padrao": self.padrao,
+                "ram_max_mb": self.ram_max // _MB or None,
+                "ram_residente_mb": round(sum(self._residentes.values()) / _MB),
+                "modelos": modelos,
+            }
+
+    def encerrar(self) -> None:
+        """Despeja todos os residentes"""
+        with self._cond:
+            for nome in list(self._residentes):
+                self._despejar(nome)
+
+
+def carregar_registro(arquivo_padrao: Path, diretorio: Path) -> RegistroModelos:
+    """Registro a partir de LLM_MODELOS (arquivos relativos a `diretorio`) mais o modelo padrão"""
+    arquivos = {"padrao": arquivo_padrao}
+    for nome, arquivo in config.llm.modelos.items():
+        caminho = Path(arquivo)
+        arquivos[nome] = caminho if caminho.is_absolute() else diretorio / caminho
+    modelos = {nome: Modelo(nome, caminho, config.llm.concorrencia_modelos.get(nome, 0))
+               for nome, caminho in arquivos.items()}
+    return RegistroModelos(modelos, config.llm.modelo_padrao, config.llm.ram_max_mb * _MB)
+
+
+# Singleton
+_registro = None
+_registro_lock = threading.Lock()
+
+def obter_registro(arquivo_padrao: Path, diretorio: Path) -> RegistroModelos:
+    """Obtém registro global (criado no primeiro uso)"""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = carregar_registro(arquivo_padrao, diretorio)
+        return _registro
+
+
+def resetar_registro() -> None:
+    """Despeja os residentes e descarta o registro (útil para testes)"""
+    global _registro
+    with _registro_lock:
+        if _registro is not None:
+            _registro.encerrar()
+        _registro = None
@@ -0,0 +1,149 @@
+"""Sequências de parada: corte incremental da saída e motivo de término"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Optional
+
+from .metricas import FIM_GERACAO, TOKENS_ECONOMIZADOS
+
+# Detalhes do término da geração em curso (preenchido por produtores e consumidores)
+_fim: ContextVar[Optional[Dict]] = ContextVar("fim_geracao", default=None)
+
+
+def estimar_tokens(texto: str) -> int:
+    """Tokens de `texto`: pelo vocabulário do modelo se já carregado, senão ~4 caracteres por token"""
+    if not texto:
+        return 0
+    # Importado aqui: o vocabulário só entra em cena quando há geração
+    from .vocabulario import tokenizador_carregado
+    tokenizador = tokenizador_carregado()
+    if tokenizador is not None:
+        return len(tokenizador.tokenizar(texto, bos=False))
+    return max(1, round(len(texto) / 4))
+
+
+class DetectorParada:
+    """
+    Procura as sequências de parada no texto conforme ele chega
+
+    Brancos iniciais não contam (a resposta só começa no primeiro caractere
+    visível). Sequências que atravessam blocos são encontradas: o fim do
+    texto que ainda pode virar o começo de uma sequência fica retido.
+    """
+
+    def __init__(self, paradas: Iterable[str]):
+        self.paradas = [p for p in paradas if p]
+        self._maior = max(map(len, self.paradas), default=0)
+        self.texto = ""
+        self._repassado = 0
+        self.sequencia: Optional[str] = None
+
+    @property
+    def parou(self) -> bool:
+        return self.sequencia is not None
+
+    def alimentar(self, bloco: str) -> str:
+        """Acrescenta `bloco`; retorna o trecho novo que já pode ser repassado"""
+        if self.parou:
+            return ""
+        if not self.texto:
+            bloco = bloco.lstrip()
+            if not bloco:
+                return ""
+        busca = max(0, len(self.texto) - self._maior + 1)
+        self.texto += bloco
+
+        achado = None
+        for parada in self.paradas:
+            posicao = self.texto.find(parada, busca)
+            if posicao != -1 and (achado is None or posicao < achado[0]):
+                achado = (posicao, parada)
+        if achado:
+            self.texto = self.texto[:achado[0]]
+            self.sequencia = achado[1]
+            return self.finalizar()
+
+        seguro = len(self.texto) - self._retido()
+        trecho = self.texto[self._repassado:seguro]
+        self._repassado = max(self._repassado, seguro)
+        return trecho
+
+    def _retido(self) -> int:
+        """Maior sufixo do texto que é prefixo de alguma sequência"""
+        for tamanho in range(min(self._maior - 1, len(self.texto)), 0, -1):
+            sufixo = self.texto[-tamanho:]
+            if any(p.startswith(sufixo) for p in self.paradas):
+                return tamanho
+        return 0
+
+    def finalizar(self) -> str:
+        """Trecho ainda retido (chamar ao fim da saída)"""
+        trecho = self.texto[self._repassado:]
+        self._repassado = len(self.texto)
+        return trecho
+
+
+@contextmanager
+def coletar_fim(dados: Optional[Dict] = None) -> Iterator[Dict]:
+    """Recolhe os detalhes de término das gerações feitas dentro do bloco (em `dados`, se dado)"""
+    dados = {} if dados is None else dados
+    anterior = _fim.get()
+    _fim.set(dados)
+    try:
+        yield dados
+    finally:
+        _fim.set(anterior)
+
+
+def anotar_fim(**valores) -> None:
+    """Registra detalhes (ex.: tokens_gerados exatos do llama.cpp) no coletor ativo"""
+    dados = _fim.get()
+    if dados is not None:
+        dados.update(valores)
+
+
+def concluir(motivo: Optional[str], texto: str, limite: int) -> Dict:
+    """
+    Fecha a geração: motivo ('parada', 'limite' ou 'fim'), tokens gerados e economizados
+
+    Sem contagem exata do llama.cpp (processo interrompido), estima pelo texto.
+    """
+    dados = _fim.get()
+    gerados = (dados or {}).get("tokens_gerados") or estimar_tokens(texto)
+    if motivo is None:
+        motivo = "limite" if gerados >= limite else "fim"
+    economizados = max(0, limite - gerados) if motivo == "parada" else 0
+    FIM_GERACAO.inc(motivo=motivo)
+    if economizados:
+        TOKENS_ECONOMIZADOS.inc(economizados)
+    detalhes = {"motivo": motivo, "tokens_gerados": gerados, "tokens_economizados": economizados}
+    anotar_fim(**detalhes)
+    return detalhes
+
+
+def consumir(blocos: Iterator[str], paradas: Iterable[str], limite: int) -> str:
+    """Lê os blocos até uma parada e fecha o gerador (encerra o processo ou libera o worker)"""
+    detector = DetectorParada(paradas)
+    try:
+        for bloco in blocos:
+            detector.alimentar(bloco)
+            if detector.parou:
+                break
+    finally:
+        blocos.close()
+    concluir("parada" if detector.parou else None, detector.texto, limite)
+    return detector.texto
+
+
+async def consumir_async(blocos, paradas: Iterable[str], limite: int) -> str:
+    """Versão assíncrona de `consumir`"""
+    detector = DetectorParada(paradas)
+    try:
+        async for bloco in blocos:
+            detector.alimentar(bloco)
+            if detector.parou:
+                break
+    finally:
+        await blocos.aclose()
+    concluir("parada" if detector.parou else None, detector.texto, limite)
+    return detector.texto
@@ -0,0 +1,225 @@
+"""Rastreio de fases por requisição (Server-Timing) e perfil das mais lentas"""
+
+import functools
+import re
+import threading
+import time
+from contextvars import ContextVar, copy_context
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from ..config import config
+
+# Linhas de tempo do llama.cpp (llama_perf_context_print / llama_print_timings)
+_TEMPO_LLAMA = re.compile(
+    r"(load|prompt eval|eval|total) time\s*=\s*([\d.]+) ms(?:\s*/\s*(\d+) (?:tokens|runs))?"
+)
+_CHAVES_LLAMA = {
+    "load": ("carga_ms", None),
+    "prompt eval": ("prompt_ms", "prompt_tokens"),
+    "eval": ("geracao_ms", "geracao_tokens"),
+    "total": ("total_ms", None),
+}
+
+
+def analisar_tempos(saida: str) -> Dict[str, float]:
+    """Extrai os tempos que o llama-cli imprime no stderr ao terminar"""
+    tempos = {}
+    for linha in saida.splitlines():
+        achado = _TEMPO_LLAMA.search(linha)
+        if not achado:
+            continue
+        chave_ms, chave_n = _CHAVES_LLAMA[achado.group(1)]
+        tempos[chave_ms] = float(achado.group(2))
+        if chave_n and achado.group(3):
+            tempos[chave_n] = int(achado.group(3))
+    return tempos
+
+
+def tempos_servidor(timings: Optional[Dict]) -> Dict[str, float]:
+    """Converte o campo `timings` do llama-server para as chaves de `analisar_tempos`"""
+    if not timings:
+        return {}
+    tempos = {
+        "prompt_ms": timings.get("prompt_ms"),
+        "prompt_tokens": timings.get("prompt_n"),
+        "geracao_ms": timings.get("predicted_ms"),
+        "geracao_tokens": timings.get("predicted_n"),
+    }
+    return {k: v for k, v in tempos.items() if v is not None}
+
+
+class Rastreio:
+    """Fases de uma requisição (ms), na ordem em que terminaram"""
+
+    def __init__(self, nome: str = ""):
+        self.nome = nome
+        self.inicio = time.perf_counter()
+        self.timestamp = datetime.now().isoformat()
+        self.fases: List[tuple] = []
+        self.llama: Dict[str, float] = {}
+
+    @contextmanager
+    def fase(self, nome: str) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, (time.perf_counter() - inicio) * 1000)
+
+    def registrar(self, nome: str, ms: float) -> None:
+        self.fases.append((nome, ms))
+
+    def anotar_llama(self, tempos: Dict[str, float]) -> None:
+        """Guarda os tempos do llama.cpp e os expõe como fases"""
+        self.llama.update(tempos)
+        for nome, chave in (("carga", "carga_ms"), ("prompt", "prompt_ms"), ("geracao", "geracao_ms")):
+            if chave in tempos:
+                self.registrar(nome, tempos[chave])
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.inicio) * 1000
+
+    def somar_fases(self) -> Dict[str, float]:
+        """Ms por fase, somando as repetidas (ex.: itens de /gerar-multiplo), na ordem da primeira"""
+        fases = {}
+        for nome, ms in self.fases:
+            fases[nome] = fases.get(nome, 0) + ms
+        return fases
+
+    def server_timing(self) -> str:
+        """Valor do cabeçalho Server-Timing (uma entrada por fase)"""
+        partes = [f"{nome};dur={ms:.2f}" for nome, ms in self.somar_fases().items()]
+        partes.append(f"total;dur={self.total_ms:.2f}")
+        return ", ".join(partes)
+
+    def para_dict(self) -> Dict:
+        return {
+            "endpoint": self.nome,
+            "timestamp": self.timestamp,
+            "total_ms": round(self.total_ms, 2),
+            "fases": {nome: round(ms, 2) for nome, ms in self.somar_fases().items()},
+            "llama": self.llama,
+        }
+
+
+# Rastreio ativo no contexto atual: cada thread e cada tarefa asyncio tem o seu
+# (None fora de uma requisição rastreada)
+_rastreio: ContextVar[Optional[Rastreio]] = ContextVar("rastreio", default=None)
+
+
+def rastreio_atual() -> Optional[Rastreio]:
+    return _rastreio.get()
+
+
+def definir_rastreio(rastreio: Optional[Rastreio]) -> None:
+    """Define (ou limpa, com None) o rastreio ativo do contexto"""
+    _rastreio.set(rastreio)
+
+
+@contextmanager
+def ativar(rastreio: Optional[Rastreio]) -> Iterator[Optional[Rastreio]]:
+    """Torna `rastreio` o ativo do contexto (ex.: dentro de um gerador de stream)"""
+    anterior = _rastreio.get()
+    # set em vez de reset(token): o bloco pode começar e terminar em contextos diferentes
+    _rastreio.set(rastreio)
+    try:
+        yield rastreio
+    finally:
+        _rastreio.set(anterior)
+
+
+async def em_thread(funcao: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    `asyncio.to_thread` (só existe a partir do Python 3.9)
+
+    Roda `funcao` no executor padrão do loop levando o contexto, e com
+    ele o rastreio ativo.
+    """
+    import asyncio
+    contexto = copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(contexto.run, funcao, *args, **kwargs))
+
+
+@contextmanager
+def rastrear(nome: str = "") -> Iterator[Rastreio]:
+    """Reusa o rastreio ativo ou cria um para o bloco"""
+    atual = rastreio_atual()
+    if atual is not None:
+        yield atual
+        return
+    with ativar(Rastreio(nome)) as novo:
+        yield novo
+
+
+@contextmanager
+def fase(nome: str) -> Iterator[None]:
+    """Mede um trecho no rastreio ativo (sem rastreio, não faz nada)"""
+    rastreio = rastreio_atual()
+    if rastreio is None:
+        yield
+        return
+    with rastreio.fase(nome):
+        yield
+
+
+def anotar(nome: str, ms: float) -> None:
+    """Registra fase já medida no rastreio ativo"""
+    rastreio = rastreio_atual()
+    if rastreio is not None:
+        rastreio.registrar(nome, ms)
+
+
+def anotar_llama(tempos: Dict[str, float]) -> None:
+    """Registra tempos do llama.cpp no rastreio ativo"""
+    rastreio = rastreio_atual()
+    if rastreio is not None and tempos:
+        rastreio.anotar_llama(tempos)
+
+
+class PerfilLento:
+    """Buffer circular das últimas requisições; consulta as mais lentas"""
+
+    def __init__(self, janela: int = 200):
+        self._recentes = deque(maxlen=janela)
+        self._lock = threading.Lock()
+
+    def registrar(self, rastreio: Rastreio) -> None:
+        with self._lock:
+            self._recentes.append(rastreio.para_dict())
+
+    def mais_lentas(self, limite: int = 10) -> List[Dict]:
+        with self._lock:
+            recentes = list(self._recentes)
+        return sorted(recentes, key=lambda r: r["total_ms"], reverse=True)[:max(1, limite)]
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._recentes.clear()
+
+    def __len__(self) -> int:
+        return len(self._recentes)
+
+
+# Singleton
+_perfil = None
+_perfil_lock = threading.Lock()
+
+def obter_perfil() -> PerfilLento:
+    """Obtém buffer global configurado por config.api.perfil_janela"""
+    global _perfil
+    with _perfil_lock:
+        if _perfil is None:
+            _perfil = PerfilLento(config.api.perfil_janela)
+        return _perfil
+
+
+def resetar_perfil() -> None:
+    """Descarta o buffer global"""
+    global _perfil
+    with _perfil_lock:
+        _perfil = None
@@ -0,0 +1,533 @@
+"""Pool de processos llama.cpp residentes (llama-server)"""
+
+import asyncio
+import atexit
+import json
+import logging
+import queue
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from .metricas import INICIO_PROCESSO
+from .parada import anotar_fim, concluir, consumir, consumir_async
+from .perfil import anotar_llama, em_thread, fase, tempos_servidor
+
+logger = logging.getLogger(__name__)
+
+
+def _aiohttp():
+    """aiohttp, importado só no caminho assíncrono (None se não instalado)"""
+    try:
+        import aiohttp
+    except ImportError:  # dependência opcional: pip install llm-toolkit[async]
+        return None
+    return aiohttp
+
+
+def _porta_livre() -> int:
+    """Reserva porta TCP livre no loopback"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _erros_conexao_aiohttp() -> tuple:
+    aiohttp = _aiohttp()
+    return (aiohttp.ClientConnectionError,) if aiohttp else ()
+
+
+class TrabalhadorLLM:
+    """Processo llama-server residente com o modelo carregado"""
+
+    def __init__(self, indice: int, executavel: Path, modelo: Path,
+                 args_extra: Optional[List[str]] = None, timeout_inicio: float = 120,
+                 slots: int = 1, contexto: int = 2048):
+        self.indice = indice
+        self.executavel = executavel
+        self.modelo = modelo
+        self.args_extra = args_extra or []
+        self.slots = slots
+        self.contexto = contexto
+        self.timeout_inicio = timeout_inicio
+        self.porta = None
+        self.processo = None
+        self.reinicios = 0
+        # Sessão aiohttp por event loop (conexões keep-alive reaproveitadas)
+        self._sessoes: Dict[asyncio.AbstractEventLoop, object] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.porta}"
+
+    @property
+    def vivo(self) -> bool:
+        return self.processo is not None and self.processo.poll() is None
+
+    def morreu(self, espera: float = 1.0) -> bool:
+        """Confirma se o processo caiu (aguarda o encerramento em curso)"""
+        if self.processo is None:
+            return True
+        try:
+            self.processo.wait(timeout=espera)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+
+    def iniciar(self) -> None:
+        """Sobe o processo e aguarda o modelo carregar"""
+        inicio = time.perf_counter()
+        self.porta = _porta_livre()
+        # Cada slot paralelo recebe sua fatia de `contexto` tokens
+        slots = ["--parallel", str(self.slots), "--cont-batching"] if self.slots > 1 else []
+        self.processo = subprocess.Popen([
+            str(self.executavel), "-m", str(self.modelo),
+            "--host", "127.0.0.1", "--port", str(self.porta),
+            "--ctx-size", str(self.contexto * self.slots), "--log-disable", *slots, *self.args_extra
+        ], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        limite = time.monotonic() + self.timeout_inicio
+        while time.monotonic() < limite:
+            if not self.vivo:
+                raise RuntimeError(f"Worker {self.indice} encerrou ao iniciar")
+            try:
+                with urllib.request.urlopen(f"{self.url}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        INICIO_PROCESSO.observar(time.perf_counter() - inicio, modo="worker")
+                        logger.info(f"Worker {self.indice} pronto na porta {self.porta}")
+                        return
+            except (urllib.error.URLError, OSError):
+                pass
+            time.sleep(0.05)
+
+        self.parar()
+        raise TimeoutError(f"Worker {self.indice} não ficou pronto em {self.timeout_inicio}s")
+
+    def reiniciar(self) -> None:
+        """Substitui processo morto ou travado"""
+        logger.warning(f"Reiniciando worker {self.indice}")
+        self.parar()
+        self.reinicios += 1
+        self.iniciar()
+
+    def parar(self) -> None:
+        """Encerra o processo"""
+        if self.processo is None:
+            return
+        if self.vivo:
+            self.processo.terminate()
+            try:
+                self.processo.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.processo.kill()
+                self.processo.wait()
+        self.processo = None
+        self._fechar_sessoes()
+
+    def _sessao(self):
+        """Sessão aiohttp deste worker no event loop atual (criada no primeiro uso)"""
+        loop = asyncio.get_running_loop()
+        sessao = self._sessoes.get(loop)
+        if sessao is None or sessao.closed:
+            # Descarta as de loops já encerrados (ex.: asyncio.run repetido)
+            for antigo in [l for l in self._sessoes if l.is_closed()]:
+                del self._sessoes[antigo]
+            sessao = self._sessoes[loop] = _aiohttp().ClientSession()
+        return sessao
+
+    def _fechar_sessoes(self) -> None:
+        """Fecha as sessões aiohttp, cada uma no seu loop (a porta muda ao reiniciar)"""
+        sessoes, self._sessoes = self._sessoes, {}
+        for loop, sessao in sessoes.items():
+            if loop.is_running() and not sessao.closed:
+                asyncio.run_coroutine_threadsafe(sessao.close(), loop)
+
+    async def fechar_sessao(self) -> None:
+        """Fecha a sessão aiohttp do loop atual"""
+        sessao = self._sessoes.pop(asyncio.get_running_loop(), None)
+        if sessao is not None:
+            await sessao.close()
+
+    @staticmethod
+    def _corpo(prompt, temp: float, tokens: int, stream: bool = False,
+               paradas: Sequence[str] = (), slot: Optional[int] = None) -> Dict:
+        """Parâmetros do /completion do llama-server (`slot` fixa o slot e seu KV)"""
+        corpo = {
+            "prompt": prompt,
+            "temperature": temp,
+            "n_predict": tokens,
+            "repeat_penalty": 1.1,
+            "cache_prompt": True,
+            "stream": stream
+        }
+        if paradas:
+            corpo["stop"] = list(paradas)
+        if slot is not None:
+            corpo["id_slot"] = slot
+        return corpo
+
+    def _requisicao(self, prompt, temp: float, tokens: int, stream: bool = False,
+                    paradas: Sequence[str] = (), slot: Optional[int] = None) -> urllib.request.Request:
+        """Monta POST para o /completion do llama-server"""
+        return urllib.request.Request(
+            f"{self.url}/completion",
+            data=json.dumps(self._corpo(prompt, temp, tokens, stream, paradas, slot)).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+
+    @staticmethod
+    def _termino(resultado: Dict) -> tuple:
+        """(motivo, tokens gerados) informados pelo llama-server; motivo None se não parou numa sequência"""
+        gerados = resultado.get("tokens_predicted") or (resultado.get("timings") or {}).get("predicted_n")
+        return ("parada" if resultado.get("stopped_word") else None), gerados
+
+    def _anotar_termino(self, resultado: Dict) -> None:
+        anotar_llama(tempos_servidor(resultado.get("timings")))
+        _, gerados = self._termino(resultado)
+        if gerados:
+            anotar_fim(tokens_gerados=gerados)
+
+    def completar(self, prompt: str, temp: float, tokens: int, timeout: float,
+                  slot: Optional[int] = None) -> str:
+        """Gera a resposta completa"""
+        req = self._requisicao(prompt, temp, tokens, slot=slot)
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resultado = json.loads(resp.read().decode("utf-8", errors="ignore"))
+        self._anotar_termino(resultado)
+        return resultado.get("content", "")
+
+    def completar_lote(self, prompts: List[str], temp: float, tokens: int, timeout: float,
+                       paradas: Sequence[str] = ()) -> List[tuple]:
+        """
+        Gera vários prompts numa só requisição (decodificados em slots paralelos)
+
+        As sequências de parada são verificadas pelo próprio llama-server, que
+        libera o slot assim que uma aparece. Retorna (texto, motivo, tokens
+        gerados) por prompt, na ordem de `prompts`.
+        """
+        req = self._requisicao(prompts if len(prompts) > 1 else prompts[0], temp, tokens,
+                               paradas=paradas)
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resultado = json.loads(resp.read().decode("utf-8", errors="ignore"))
+        if len(prompts) == 1:
+            resultado = [resultado]
+        elif not isinstance(resultado, list):
+            raise RuntimeError("llama-server não suporta lote de prompts")
+        # Resultados podem vir fora de ordem; `index` identifica o prompt
+        resultado.sort(key=lambda r: r.get("index", 0))
+        return [(r.get("content", ""), *self._termino(r)) for r in resultado]
+
+    def completar_stream(self, prompt: str, temp: float, tokens: int,
+                         timeout: float, slot: Optional[int] = None) -> Iterator[str]:
+        """Gera a resposta em blocos (eventos SSE do llama-server)"""
+        req = self._requisicao(prompt, temp, tokens, stream=True, slot=slot)
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            for linha in resp:
+                linha = linha.decode("utf-8", errors="ignore").strip()
+                if not linha.startswith("data:"):
+                    continue
+                evento = json.loads(linha[5:])
+                if evento.get("content"):
+                    yield evento["content"]
+                if evento.get("stop"):
+                    self._anotar_termino(evento)
+                    return
+
+    async def completar_async(self, prompt: str, temp: float, tokens: int, timeout: float) -> str:
+        """Como `completar`, sem bloquear o event loop (aiohttp; sem ele, numa thread)"""
+        aiohttp = _aiohttp()
+        if aiohttp is None:
+            return await em_thread(self.completar, prompt, temp, tokens, timeout)
+        async with self._sessao().post(f"{self.url}/completion", json=self._corpo(prompt, temp, tokens),
+                                       timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            resp.raise_for_status()
+            resultado = await resp.json(content_type=None)
+        self._anotar_termino(resultado)
+        return resultado.get("content", "")
+
+    async def completar_stream_async(self, prompt: str, temp: float, tokens: int,
+                                     timeout: float) -> AsyncIterator[str]:
+        """Como `completar_stream`, lendo os eventos SSE com aiohttp"""
+        aiohttp = _aiohttp()
+        if aiohttp is None:
+            raise ImportError("Stream assíncrono nos workers requer aiohttp: pip install aiohttp")
+        async with self._sessao().post(f"{self.url}/completion",
+                                       json=self._corpo(prompt, temp, tokens, stream=True),
+                                       timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            resp.raise_for_status()
+            async for linha in resp.content:
+                linha = linha.decode("utf-8", errors="ignore").strip()
+                if not linha.startswith("data:"):
+                    continue
+                evento = json.loads(linha[5:])
+                if evento.get("content"):
+                    yield evento["content"]
+                if evento.get("stop"):
+                    self._anotar_termino(evento)
+                    return
+
+
+class PoolLLM:
+    """Mantém N workers residentes e distribui requisições aos ociosos"""
+
+    def __init__(self, tamanho: int, executavel: Path, modelo: Path,
+                 args_extra: Optional[List[str]] = None, slots: int = 1, contexto: int = 2048):
+        self.slots = slots
+        self.trabalhadores = [
+            TrabalhadorLLM(i, executavel, modelo, args_extra, slots=slots, contexto=contexto)
+            for i in range(tamanho)
+        ]
+        self._livres = queue.Queue()
+        # Corrotinas esperando um worker livre -> (loop, futuro), acordadas por `_devolver`
+        self._esperas: List[tuple] = []
+        self._esperas_lock = threading.Lock()
+        self._iniciado = False
+        self._lock = threading.Lock()
+
+    def iniciar(self) -> None:
+        """Sobe todos os workers em paralelo"""
+        with self._lock:
+            if self._iniciado:
+                return
+            erros = []
+
+            def _subir(t: TrabalhadorLLM):
+                try:
+                    t.iniciar()
+                except Exception as e:
+                    erros.append(e)
+
+            threads = [threading.Thread(target=_subir, args=(t,)) for t in self.trabalhadores]
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+
+            if erros:
+                for t in self.trabalhadores:
+                    t.parar()
+                raise erros[0]
+
+            for t in self.trabalhadores:
+                self._devolver(t)
+            self._iniciado = True
+            logger.info(f"Pool iniciado com {len(self.trabalhadores)} workers")
+
+    def _adquirir(self, timeout: float, preferido: Optional[int] = None) -> TrabalhadorLLM:
+        """Retira um worker ocioso, o `preferido` se estiver livre (bloqueia até `timeout`)"""
+        self.iniciar()
+        trabalhador = self._retirar(preferido) if preferido is not None else None
+        try:
+            trabalhador = trabalhador or self._livres.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Nenhum worker livre")
+        if not trabalhador.vivo:
+            try:
+                trabalhador.reiniciar()
+            except Exception:
+                self._devolver(trabalhador)
+                raise
+        return trabalhador
+
+    def _devolver(self, trabalhador: TrabalhadorLLM) -> None:
+        """Põe o worker na fila de ociosos e acorda as corrotinas (threads acordam pela fila)"""
+        self._livres.put(trabalhador)
+        with self._esperas_lock:
+            esperas, self._esperas = self._esperas, []
+        for loop, futuro in esperas:
+            loop.call_soon_threadsafe(lambda f=futuro: f.done() or f.set_result(None))
+
+    def _retirar(self, indice: int) -> Optional[TrabalhadorLLM]:
+        """Retira o worker `indice` da fila de ociosos, se ele estiver lá"""
+        with self._livres.mutex:
+            for trabalhador in self._livres.queue:
+                if trabalhador.indice == indice:
+                    self._livres.queue.remove(trabalhador)
+                    return trabalhador
+        return None
+
+    @staticmethod
+    def _gerar(trabalhador: TrabalhadorLLM, prompt: str, temp: float, tokens: int,
+               timeout: float, paradas: Sequence[str], slot: Optional[int] = None) -> str:
+        """Com paradas, lê em stream e fecha a conexão na primeira (o llama-server libera o slot)"""
+        if not paradas:
+            texto = trabalhador.completar(prompt, temp, tokens, timeout, slot)
+            concluir(None, texto, tokens)
+            return texto
+        return consumir(trabalhador.completar_stream(prompt, temp, tokens, timeout, slot), paradas, tokens)
+
+    def executar(self, prompt: str, temp: float, tokens: int, timeout: float,
+                 paradas: Sequence[str] = (), posicao: Optional[tuple] = None) -> str:
+        """
+        Executa no primeiro worker ocioso
+
+        `posicao` (worker, slot) é onde está o KV de uma conversa: o worker é
+        usado se estiver ocioso (senão outro avalia a conversa inteira) e o
+        slot é fixado na requisição.
+        """
+        preferido, slot = posicao or (None, None)
+        with fase("worker"):
+            trabalhador = self._adquirir(timeout, preferido)
+        try:
+            try:
+                return self._gerar(trabalhador, prompt, temp, tokens, timeout, paradas, slot)
+            except (ConnectionError, urllib.error.URLError):
+                if not trabalhador.morreu():
+                    raise
+                # Worker caiu durante a geração: repõe e tenta uma vez
+                trabalhador.reiniciar()
+                return self._gerar(trabalhador, prompt, temp, tokens, timeout, paradas, slot)
+        finally:
+            self._devolver(trabalhador)
+
+    def executar_lote(self, prompts: List[str], temp: float, tokens: int, timeout: float,
+                      paradas: Sequence[str] = ()) -> List[tuple]:
+        """Executa um lote multi-sequência no primeiro worker ocioso"""
+        trabalhador = self._adquirir(timeout)
+        try:
+            return trabalhador.completar_lote(prompts, temp, tokens, timeout, paradas)
+        finally:
+            self._devolver(trabalhador)
+
+    def executar_stream(self, prompt: str, temp: float, tokens: int,
+                        timeout: float) -> Iterator[str]:
+        """Como `executar`, mas repassa blocos; o worker fica reservado até o fim"""
+        with fase("worker"):
+            trabalhador = self._adquirir(timeout)
+        try:
+            yield from trabalhador.completar_stream(prompt, temp, tokens, timeout)
+        finally:
+            self._devolver(trabalhador)
+
+    async def _adquirir_async(self, timeout: float) -> TrabalhadorLLM:
+        """Como `_adquirir`, mas espera sem ocupar uma thread"""
+        if not self._iniciado:
+            await em_thread(self.iniciar)
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                trabalhador = self._livres.get_nowait()
+                break
+            except queue.Empty:
+                pass
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise TimeoutError("Nenhum worker livre")
+            futuro = asyncio.get_running_loop().create_future()
+            espera = (futuro.get_loop(), futuro)
+            with self._esperas_lock:
+                self._esperas.append(espera)
+            try:
+                # Reconfere após registrar: uma devolução antes disso não acordaria ninguém
+                if self._livres.empty():
+                    await asyncio.wait_for(futuro, restante)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._esperas_lock:
+                    if espera in self._esperas:
+                        self._esperas.remove(espera)
+        if not trabalhador.vivo:
+            try:
+                await em_thread(trabalhador.reiniciar)
+            except Exception:
+                self._devolver(trabalhador)
+                raise
+        return trabalhador
+
+    @staticmethod
+    async def _gerar_async(trabalhador: TrabalhadorLLM, prompt: str, temp: float, tokens: int,
+                           timeout: float, paradas: Sequence[str]) -> str:
+        """Versão assíncrona de `_gerar` (sem aiohttp, paradas conferidas no texto completo)"""
+        if not paradas or _aiohttp() is None:
+            texto = await trabalhador.completar_async(prompt, temp, tokens, timeout)
+            return await consumir_async(_repassar(texto), paradas, tokens)
+        return await consumir_async(trabalhador.completar_stream_async(prompt, temp, tokens, timeout),
+                                    paradas, tokens)
+
+    async def executar_async(self, prompt: str, temp: float, tokens: int, timeout: float,
+                             paradas: Sequence[str] = ()) -> str:
+        """Como `executar`, sem bloquear o event loop"""
+        with fase("worker"):
+            trabalhador = await self._adquirir_async(timeout)
+        try:
+            try:
+                return await self._gerar_async(trabalhador, prompt, temp, tokens, timeout, paradas)
+            except (ConnectionError, urllib.error.URLError, *_erros_conexao_aiohttp()):
+                if not await em_thread(trabalhador.morreu):
+                    raise
+                await em_thread(trabalhador.reiniciar)
+                return await self._gerar_async(trabalhador, prompt, temp, tokens, timeout, paradas)
+        finally:
+            self._devolver(trabalhador)
+
+    async def executar_stream_async(self, prompt: str, temp: float, tokens: int,
+                                    timeout: float) -> AsyncIterator[str]:
+        """Como `executar_stream`, sem bloquear o event loop"""
+        with fase("worker"):
+            trabalhador = await self._adquirir_async(timeout)
+        try:
+            async for bloco in trabalhador.completar_stream_async(prompt, temp, tokens, timeout):
+                yield bloco
+        finally:
+            self._devolver(trabalhador)
+
+    def estatisticas(self) -> Dict:
+        """Estado atual do pool"""
+        return {
+            "workers": len(self.trabalhadores),
+            "slots": self.slots,
+            "livres": self._livres.qsize(),
+            "reinicios": sum(t.reinicios for t in self.trabalhadores)
+        }
+
+    def encerrar(self) -> None:
+        """Encerra todos os workers"""
+        with self._lock:
+            for t in self.trabalhadores:
+                t.parar()
+            self._livres = queue.Queue()
+            self._iniciado = False
+
+
+async def _repassar(texto: str) -> AsyncIterator[str]:
+    yield texto
+
+
+# Um pool por modelo (nome do registro)
+_pools: Dict[str, "PoolLLM"] = {}
+_pool_lock = threading.Lock()
+
+def obter_pool(tamanho: int, executavel: Path, modelo: Path, slots: int = 1,
+               args_extra: Optional[List[str]] = None, contexto: int = 2048,
+               nome: str = "padrao") -> PoolLLM:
+    """Obtém o pool do modelo `nome` (criado no primeiro uso)"""
+    with _pool_lock:
+        if nome not in _pools:
+            _pools[nome] = PoolLLM(tamanho, executavel, modelo, args_extra, slots=slots, contexto=contexto)
+        return _pools[nome]
+
+
+def encerrar_pool(nome: Optional[str] = None) -> None:
+    """Encerra e descarta o pool de `nome` (todos se None)"""
+    with _pool_lock:
+        for chave in [nome] if nome is not None else list(_pools):
+            pool = _pools.pop(chave, None)
+            if pool is not None:
+                pool.encerrar()
+
+
+async def fechar_sessoes() -> None:
+    """Fecha as sessões aiohttp dos workers no loop atual (antes de o loop terminar)"""
+    with _pool_lock:
+        trabalhadores = [t for pool in _pools.values() for t in pool.trabalhadores]
+    for trabalhador in trabalhadores:
+        await trabalhador.fechar_sessao()
+
+
+atexit.register(encerrar_pool)
@@ -0,0 +1,88 @@
+"""Cache do prefixo do sistema (--prompt-cache do llama.cpp)"""
+
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Parte fixa de todo prompt: "{system}\n\nQ:" (ver llm._montar_prompt)
+SUFIXO_PREFIXO = "\n\nQ:"
+
+
+def chave_prefixo(system: str, modelo: Path) -> str:
+    """Identifica o par (texto do sistema, arquivo do modelo)"""
+    info = modelo.stat()
+    bruto = f"{system}\0{modelo.name}\0{info.st_size}\0{info.st_mtime_ns}"
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()[:16]
+
+
+class CachePrefixo:
+    """
+    Gera uma vez o estado KV do prefixo do sistema e o reutiliza
+
+    O arquivo é nomeado pela chave (hash do system.txt + identidade do modelo),
+    então qualquer mudança em um dos dois gera um arquivo novo; os antigos
+    são apagados. Gerações leem o arquivo em modo somente-leitura.
+    """
+
+    def __init__(self, diretorio: Path, timeout: float = 120):
+        self.diretorio = Path(diretorio)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._falhas = set()
+
+    def arquivo(self, executavel: Path, modelo: Path, system: str) -> Optional[Path]:
+        """Caminho do cache pronto para uso (gera se necessário); None se indisponível"""
+        if not system:
+            return None
+        chave = chave_prefixo(system, modelo)
+        destino = self.diretorio / f"prefixo-{chave}.bin"
+        if destino.exists():
+            return destino
+        if chave in self._falhas:
+            return None
+
+        with self._lock:
+            if destino.exists():
+                return destino
+            try:
+                self._gerar(executavel, modelo, system + SUFIXO_PREFIXO, destino)
+            except Exception as e:
+                logger.warning(f"Cache de prefixo indisponível: {e}")
+                self._falhas.add(chave)
+                return None
+            self._limpar_antigos(destino)
+            return destino
+
+    def _gerar(self, executavel: Path, modelo: Path, prefixo: str, destino: Path) -> None:
+        """Avalia só o prefixo e salva o estado em `destino`"""
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        temporario = destino.with_suffix(f".{os.getpid()}.tmp")
+        logger.info(f"Gerando cache de prefixo: {destino.name}")
+        resultado = subprocess.run([
+            str(executavel), "-m", str(modelo), "-p", prefixo,
+            "-n", "1", "--ctx-size", "2048", "--log-disable", "--simple-io",
+            "--prompt-cache", str(temporario)
+        ], capture_output=True, timeout=self.timeout)
+        if resultado.returncode != 0 or not temporario.exists():
+            temporario.unlink(missing_ok=True)
+            raise RuntimeError(f"llama.cpp retornou {resultado.returncode}")
+        # Troca atômica: outros processos nunca veem arquivo pela metade
+        os.replace(temporario, destino)
+
+    def _limpar_antigos(self, atual: Path) -> None:
+        for antigo in self.diretorio.glob("prefixo-*.bin"):
+            if antigo != atual:
+                antigo.unlink(missing_ok=True)
+
+    def invalidar(self) -> None:
+        """Apaga todos os arquivos de prefixo"""
+        with self._lock:
+            self._falhas.clear()
+            for antigo in self.diretorio.glob("prefixo-*.bin"):
+                antigo.unlink(missing_ok=True)
@@ -0,0 +1,265 @@
+"""
+Modo de produção: processos pré-criados (pre-fork) num socket compartilhado
+
+O processo mestre abre a porta e cria N filhos; cada filho importa o
+toolkit do zero (gerador, agendador, pool e métricas próprios) e atende
+com o servidor WSGI do Werkzeug em threads (ou com o aiohttp, em
+`assincrono`). O mestre não atende requisições: só reinicia filhos que
+caem e repassa os sinais.
+
+- SIGTERM / SIGINT: desligamento gracioso (filhos terminam as gerações em andamento)
+- SIGHUP: recarga sem queda (novos filhos sobem com o código atual, os antigos saem)
+
+Só em POSIX; no Windows atende num único processo.
+"""
+
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Filho que morre antes disso é considerado falha de inicialização
+_VIDA_MINIMA = 1.0
+
+
+class _Andamento:
+    """Middleware WSGI que conta as requisições em andamento (inclusive streams)"""
+
+    def __init__(self, app):
+        self.app = app
+        self.ativas = 0
+        self._cond = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+
+        with self._cond:
+            self.ativas += 1
+        try:
+            corpo = self.app(environ, start_response)
+        except BaseException:
+            self._terminou()
+            raise
+        # O servidor chama close() ao fim da resposta, inclusive se o cliente cair
+        return ClosingIterator(corpo, [self._terminou])
+
+    def _terminou(self) -> None:
+        with self._cond:
+            self.ativas -= 1
+            self._cond.notify_all()
+
+    def aguardar(self, timeout: float) -> bool:
+        """Espera até não haver requisições em andamento; False se estourar o timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.ativas <= 0, timeout)
+
+
+def _recarregar_modulos() -> None:
+    """Descarta o toolkit herdado do mestre para o filho importar código e config atuais"""
+    for nome in [n for n in sys.modules if n == "llm_toolkit" or n.startswith("llm_toolkit.")]:
+        del sys.modules[nome]
+
+
+def _executar_filho(ouvinte: socket.socket, opcoes: Dict) -> None:
+    """Corpo do processo filho; nunca retorna"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # Ctrl+C chega ao grupo; quem decide é o mestre
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    _recarregar_modulos()
+    if opcoes["assincrono"]:
+        # aiohttp trata SIGTERM: para de aceitar e espera as requisições em andamento
+        from llm_toolkit.core.servidor_async import iniciar_servidor_async
+        iniciar_servidor_async(aquecer=opcoes["aquecer"], precarregar=opcoes["precarregar"],
+                               sock=ouvinte)
+        _encerrar_recursos()
+        os._exit(0)
+
+    from werkzeug.serving import make_server
+    from llm_toolkit.core.aquecimento import preparar_em_segundo_plano
+    from llm_toolkit.core.servidor import app
+
+    andamento = _Andamento(app)
+    servidor = make_server(opcoes["host"], opcoes["porta"], andamento,
+                           threaded=True, fd=ouvinte.fileno())
+
+    def _parar(*_):
+        # shutdown() espera o serve_forever, que roda nesta mesma thread
+        threading.Thread(target=servidor.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _parar)
+    preparar_em_segundo_plano(aquecer=opcoes["aquecer"], precarregar=opcoes["precarregar"])
+    logger.info(f"Processo {os.getpid()} atendendo")
+
+    servidor.serve_forever()
+    servidor.server_close()
+    if not andamento.aguardar(opcoes["timeout_gracioso"]):
+        logger.warning(f"Processo {os.getpid()}: {andamento.ativas} requisições interrompidas")
+    _encerrar_recursos()
+    logger.info(f"Processo {os.getpid()} encerrado")
+    os._exit(0)
+
+
+def _encerrar_recursos() -> None:
+    """Derruba workers residentes e lotes deste processo"""
+    from llm_toolkit.core.lote import encerrar_loteador
+    from llm_toolkit.core.pool import encerrar_pool
+
+    for encerrar in (encerrar_loteador, encerrar_pool):
+        try:
+            encerrar()
+        except Exception as e:
+            logger.warning(f"Erro ao encerrar recursos: {e}")
+
+
+class Supervisor:
+    """Processo mestre: abre o socket, cria os filhos e trata sinais"""
+
+    def __init__(self, host: str, porta: int, processos: int, timeout_gracioso: float,
+                 aquecer: Optional[bool] = None, precarregar: Optional[str] = None,
+                 assincrono: bool = False):
+        self.processos = processos
+        self.timeout_gracioso = timeout_gracioso
+        self.opcoes = {"host": host, "porta": porta, "aquecer": aquecer, "precarregar": precarregar,
+                       "timeout_gracioso": timeout_gracioso, "assincrono": assincrono}
+        self._filhos: Dict[int, tuple] = {}   # pid -> (geração, início)
+        self._geracao = 0
+        self._parar = False
+        self._recarregar = False
+        self._ouvinte = None
+
+    def _criar_filho(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _executar_filho(self._ouvinte, self.opcoes)
+            except BaseException:
+                logger.exception("Falha no processo filho")
+            finally:
+                os._exit(1)
+        self._filhos[pid] = (self._geracao, time.monotonic())
+
+    def _sinalizar(self, pids, sinal) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, sinal)
+            except ProcessLookupError:
+                pass
+
+    def _recolher(self) -> None:
+        """Recolhe filhos que saíram e repõe os da geração atual"""
+        while self._filhos:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            geracao, inicio = self._filhos.pop(pid, (None, 0))
+            if geracao != self._geracao or self._parar:
+                continue
+            # Negativo quando morto por sinal (como Popen.returncode)
+            codigo = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            logger.warning(f"Processo {pid} saiu (código {codigo}); reiniciando")
+            if time.monotonic() - inicio < _VIDA_MINIMA:
+                time.sleep(_VIDA_MINIMA)   # evita laço de reinício se o filho falha ao subir
+            self._criar_filho()
+
+    def _recarga(self) -> None:
+        """Sobe a nova geração antes de dispensar a anterior: o socket nunca fica sem quem aceite"""
+        antigos = list(self._filhos)
+        self._geracao += 1
+        logger.info(f"Recarregando: geração {self._geracao}")
+        for _ in range(self.processos):
+            self._criar_filho()
+        self._sinalizar(antigos, signal.SIGTERM)
+
+    def _desligar(self) -> None:
+        logger.info(f"Desligando {len(self._filhos)} processos")
+        self._sinalizar(list(self._filhos), signal.SIGTERM)
+        # Margem além do timeout dos filhos para encerrarem pools e lotes
+        limite = time.monotonic() + self.timeout_gracioso + 5
+        while self._filhos and time.monotonic() < limite:
+            self._recolher()
+            time.sleep(0.1)
+        if self._filhos:
+            logger.warning(f"Forçando saída de {len(self._filhos)} processos")
+            self._sinalizar(list(self._filhos), signal.SIGKILL)
+            for pid in list(self._filhos):
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            self._filhos.clear()
+
+    def executar(self) -> None:
+        """Laço do mestre; retorna depois do desligamento"""
+        self._ouvinte = socket.create_server((self.opcoes["host"], self.opcoes["porta"]),
+                                             backlog=socket.SOMAXCONN)
+        self._ouvinte.set_inheritable(True)
+
+        def _sinal_parar(*_):
+            self._parar = True
+
+        def _sinal_recarregar(*_):
+            self._recarregar = True
+
+        signal.signal(signal.SIGTERM, _sinal_parar)
+        signal.signal(signal.SIGINT, _sinal_parar)
+        signal.signal(signal.SIGHUP, _sinal_recarregar)
+
+        logger.info(f"Mestre {os.getpid()}: {self.processos} processos em "
+                    f"{self.opcoes['host']}:{self.opcoes['porta']}")
+        try:
+            for _ in range(self.processos):
+                self._criar_filho()
+            while not self._parar:
+                if self._recarregar:
+                    self._recarregar = False
+                    self._recarga()
+                self._recolher()
+                time.sleep(0.2)
+            self._desligar()
+        finally:
+            self._ouvinte.close()
+
+
+def _servir_um_processo(host: str, porta: int, aquecer: Optional[bool],
+                        precarregar: Optional[str], assincrono: bool) -> None:
+    """Alternativa sem fork: um processo com o servidor WSGI em threads"""
+    if assincrono:
+        from .servidor_async import iniciar_servidor_async
+        iniciar_servidor_async(host, porta, aquecer=aquecer, precarregar=precarregar)
+        _encerrar_recursos()
+        return
+
+    from werkzeug.serving import make_server
+    from .aquecimento import preparar_em_segundo_plano
+    from .servidor import app
+
+    servidor = make_server(host, porta, app, threaded=True)
+    preparar_em_segundo_plano(aquecer=aquecer, precarregar=precarregar)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        _encerrar_recursos()
+
+
+def servir(host: str, porta: int, processos: int, timeout_gracioso: float,
+           aquecer: Optional[bool] = None, precarregar: Optional[str] = None,
+           assincrono: bool = False) -> None:
+    """Serve a API com `processos` filhos pré-criados (um processo sem fork)"""
+    if not hasattr(os, "fork"):
+        logger.warning("Pre-fork indisponível nesta plataforma; atendendo num único processo")
+        _servir_um_processo(host, porta, aquecer, precarregar, assincrono)
+        return
+    Supervisor(host, porta, processos, timeout_gracioso, aquecer, precarregar, assincrono).executar()
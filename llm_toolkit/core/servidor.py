@@ -1,21 +1,103 @@
 """Servidor Flask compacto com blueprints"""
 
+import json
 import logging
-from flask import Flask, request, jsonify, Blueprint
+import os
+import time
+from flask import Flask, Response, request, jsonify, Blueprint, g, stream_with_context
 
 from ..api import obter_gerador
 from ..config import config
+from .agendador import Admissao, EsperaExcedida, FilaCheia, obter_agendador
+from .aquecimento import preparar_em_segundo_plano, prontidao
+from .cache import obter_cache
+from .llm import registro_modelos, sessoes, verificar_arquivos
+from .metricas import LATENCIA_HTTP, REQUISICOES, registro
+from .parada import coletar_fim
+from .perfil import Rastreio, ativar, definir_rastreio, obter_perfil
+from .sessoes import LimiteSessoes
+from .similares import obter_similares
 
 logger = logging.getLogger(__name__)
 
 # Blueprint para endpoints
 bp = Blueprint('llm', __name__)
 
+# Medidores lidos na coleta
+registro.medidor("llm_fila_profundidade", "Requisições esperando vaga",
+                 lambda: obter_agendador().estatisticas()["profundidade"])
+registro.medidor("llm_fila_ativos", "Gerações em andamento",
+                 lambda: obter_agendador().estatisticas()["ativos"])
+registro.medidor("llm_cache_taxa_acerto", "Taxa de acerto do cache de respostas",
+                 lambda: obter_cache().estatisticas()["taxa_acerto"])
+registro.medidor("llm_modelos_ram_residente_bytes", "RAM estimada dos modelos residentes",
+                 lambda: registro_modelos().ram_residente())
+registro.medidor("llm_sessoes_abertas", "Sessões de conversa abertas", lambda: len(sessoes()))
+
+
+@bp.before_request
+def _iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+    # Rotas de geração são rastreadas por fase (Server-Timing + /perfil)
+    if request.url_rule and request.url_rule.rule.startswith(("/gerar", "/sessoes/<sessao>/turnos")):
+        g.rastreio = Rastreio(request.url_rule.rule)
+        definir_rastreio(g.rastreio)
+
+
+@bp.after_request
+def _registrar_requisicao(resposta):
+    """Latência até a resposta (para streams: até os cabeçalhos)"""
+    endpoint = request.url_rule.rule if request.url_rule else "desconhecido"
+    inicio = g.get("inicio_requisicao")
+    if inicio is not None:
+        LATENCIA_HTTP.observar(time.perf_counter() - inicio, endpoint=endpoint)
+    REQUISICOES.inc(endpoint=endpoint, metodo=request.method, status=resposta.status_code)
+
+    rastreio = g.pop("rastreio", None)
+    definir_rastreio(None)
+    if rastreio is not None:
+        resposta.headers["Server-Timing"] = rastreio.server_timing()
+        if resposta.is_streamed:
+            # Fases do stream terminam depois dos cabeçalhos
+            resposta.call_on_close(lambda: obter_perfil().registrar(rastreio))
+        else:
+            obter_perfil().registrar(rastreio)
+    return resposta
+
 
 @bp.route('/health', methods=['GET'])
 def health():
-    """Verificação de saúde"""
-    return jsonify({"status": "ok", "versao": "1.0.0"}), 200
+    """Verificação de saúde (503 se faltar binário ou modelo)"""
+    arquivos = verificar_arquivos()
+    ok = all(arquivos.values())
+    return jsonify({
+        "sucesso": ok,
+        "status": "ok" if ok else "degradado",
+        "versao": "1.0.0",
+        **arquivos
+    }), 200 if ok else 503
+
+
+@bp.route('/ready', methods=['GET'])
+def ready():
+    """Prontidão: 200 só depois da pré-carga e do aquecimento"""
+    estado = prontidao.para_dict()
+    return jsonify({"sucesso": estado["pronto"], "dados": estado}), 200 if estado["pronto"] else 503
+
+
+def _recusar(erro: FilaCheia):
+    """429 (fila cheia) ou 503 (espera excedida) com Retry-After"""
+    status = 503 if isinstance(erro, EsperaExcedida) else 429
+    resposta = jsonify({"sucesso": False, "erro": str(erro)})
+    resposta.headers["Retry-After"] = str(erro.retry_after)
+    return resposta, status
+
+
+def _cabecalhos_fila(resposta, espera: float):
+    """Expõe espera e profundidade da fila ao chamador"""
+    resposta.headers["X-Fila-Espera"] = f"{espera:.3f}"
+    resposta.headers["X-Fila-Profundidade"] = str(obter_agendador().estatisticas()["profundidade"])
+    return resposta
 
 
 @bp.route('/gerar', methods=['POST'])
@@ -27,15 +109,79 @@ def gerar():
     if not prompt:
         return jsonify({"sucesso": False, "erro": "Campo 'prompt' obrigatório"}), 400
     
-    gerador = obter_gerador()
-    resposta = gerador.gerar(
-        prompt,
-        temp=dados.get("temperatura"),
-        tokens=dados.get("tokens")
-    )
+    # Só ocupa vaga se for gerar: iguais em andamento são esperadas sem vaga
+    admissao = Admissao(dados.get("prioridade"))
+    try:
+        resposta = obter_gerador().gerar(
+            prompt,
+            temp=dados.get("temperatura"),
+            tokens=dados.get("tokens"),
+            modelo=dados.get("modelo"),
+            admissao=admissao
+        )
+    except FilaCheia as e:
+        return _recusar(e)
     
     status = 200 if resposta.sucesso else 400
-    return jsonify(resposta.para_dict()), status
+    return _cabecalhos_fila(jsonify(resposta.para_dict()), admissao.espera), status
+
+
+def _evento_sse(dados: dict, evento: str = None) -> str:
+    """Formata um evento Server-Sent Events"""
+    cabecalho = f"event: {evento}\n" if evento else ""
+    return f"{cabecalho}data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+@bp.route('/gerar-stream', methods=['POST'])
+def gerar_stream():
+    """Gera resposta via Server-Sent Events (um evento por bloco)"""
+    dados = request.get_json() or {}
+    prompt = dados.get("prompt")
+    
+    if not prompt:
+        return jsonify({"sucesso": False, "erro": "Campo 'prompt' obrigatório"}), 400
+    
+    # A vaga (só de quem inicia a geração) fica reservada até o stream ser fechado
+    admissao = Admissao(dados.get("prioridade"))
+    try:
+        blocos = obter_gerador().gerar_stream(
+            prompt,
+            temp=dados.get("temperatura"),
+            tokens=dados.get("tokens"),
+            modelo=dados.get("modelo"),
+            admissao=admissao
+        )
+    except ValueError as e:
+        return jsonify({"sucesso": False, "erro": str(e)}), 400
+    except FilaCheia as e:
+        return _recusar(e)
+    
+    rastreio = g.get("rastreio")
+    
+    def eventos():
+        partes = []
+        with ativar(rastreio), coletar_fim() as termino:
+            try:
+                for bloco in blocos:
+                    partes.append(bloco)
+                    yield _evento_sse({"token": bloco})
+            except Exception as e:
+                logger.error(f"Erro no stream: {e}")
+                yield _evento_sse({"sucesso": False, "erro": str(e)[:100]}, "erro")
+                return
+        # Sem detalhes de término: a resposta veio do cache
+        fim = {"sucesso": True, "dados": "".join(partes).strip(), "fim": termino or {"motivo": "cache"}}
+        if rastreio is not None:
+            fim["tempos"] = rastreio.para_dict()["fases"]
+        yield _evento_sse(fim, "fim")
+    
+    resposta = Response(
+        stream_with_context(eventos()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    resposta.call_on_close(lambda: admissao.liberar(medir=False))
+    return _cabecalhos_fila(resposta, admissao.espera)
 
 
 @bp.route('/gerar-multiplo', methods=['POST'])
@@ -47,18 +193,53 @@ def gerar_multiplo():
     if not prompts or not isinstance(prompts, list):
         return jsonify({"sucesso": False, "erro": "'prompts' deve ser lista"}), 400
     
-    gerador = obter_gerador()
-    resultados = [gerador.gerar(p, dados.get("temperatura"), dados.get("tokens")).para_dict() for p in prompts]
+    agendador = obter_agendador()
+    if agendador.cheio():
+        return _recusar(FilaCheia("Fila cheia", agendador.estimar_espera(agendador.capacidade)))
+    
+    respostas = obter_gerador().gerar_multiplo(
+        prompts,
+        temp=dados.get("temperatura"),
+        tokens=dados.get("tokens"),
+        max_paralelo=dados.get("max_paralelo"),
+        timeout_item=dados.get("timeout_item"),
+        prioridade=dados.get("prioridade", "batch"),
+        modelo=dados.get("modelo")
+    )
+    resultados = [r.para_dict() for r in respostas]
+    falhas = sum(1 for r in respostas if not r.sucesso)
     
-    return jsonify({"sucesso": True, "dados": resultados, "total": len(resultados)}), 200
+    return jsonify({
+        "sucesso": True,
+        "dados": resultados,
+        "total": len(resultados),
+        "falhas": falhas
+    }), 200
 
 
 @bp.route('/historico', methods=['GET'])
 def historico():
-    """Obtém histórico"""
-    ultimos = request.args.get('ultimos', 10, type=int)
-    hist = obter_gerador().obter_historico(ultimos)
-    return jsonify({"sucesso": True, "dados": hist, "total": len(hist)}), 200
+    """Obtém histórico paginado (`limite`/`ultimos`, `cursor`, `busca`)"""
+    limite = request.args.get('limite', type=int) or request.args.get('ultimos', 10, type=int)
+    hist, proximo = obter_gerador().listar_historico(
+        limite,
+        cursor=request.args.get('cursor', type=int),
+        busca=request.args.get('busca') or None
+    )
+    return jsonify({
+        "sucesso": True,
+        "dados": hist,
+        "total": len(hist),
+        "proximo_cursor": proximo
+    }), 200
+
+
+@bp.route('/historico/exportar', methods=['GET'])
+def historico_exportar():
+    """Exporta o histórico completo em NDJSON (transmitido em blocos)"""
+    registros = obter_gerador().historico.exportar()
+    linhas = (json.dumps(r, ensure_ascii=False) + "\n" for r in registros)
+    return Response(linhas, mimetype="application/x-ndjson")
 
 
 @bp.route('/limpar-historico', methods=['POST'])
@@ -68,6 +249,115 @@ def limpar_historico():
     return jsonify({"sucesso": True, "mensagem": "Histórico limpo"}), 200
 
 
+@bp.route('/metricas', methods=['GET'])
+def metricas():
+    """Métricas no formato texto do Prometheus"""
+    return Response(registro.exportar(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+@bp.route('/perfil', methods=['GET'])
+def perfil():
+    """Requisições de geração mais lentas entre as recentes, com tempo por fase"""
+    limite = request.args.get('limite', 10, type=int)
+    lentas = obter_perfil().mais_lentas(limite)
+    return jsonify({"sucesso": True, "dados": lentas, "total": len(lentas)}), 200
+
+
+@bp.route('/fila', methods=['GET'])
+def fila():
+    """Estado do controle de admissão"""
+    return jsonify({"sucesso": True, "dados": obter_agendador().estatisticas()}), 200
+
+
+@bp.route('/modelos', methods=['GET'])
+def modelos():
+    """Modelos do registro: residência, RAM estimada e contadores por modelo"""
+    return jsonify({"sucesso": True, "dados": registro_modelos().estatisticas()}), 200
+
+
+@bp.route('/sessoes', methods=['POST'])
+def criar_sessao():
+    """Abre uma sessão de conversa (`modelo` opcional)"""
+    dados = request.get_json(silent=True) or {}
+    modelo = dados.get("modelo")
+    try:
+        registro_modelos().obter(modelo)
+        sessao = sessoes().criar(modelo)
+    except ValueError as e:
+        return jsonify({"sucesso": False, "erro": str(e)}), 400
+    except LimiteSessoes as e:
+        return jsonify({"sucesso": False, "erro": str(e)}), 429
+    return jsonify({"sucesso": True, "dados": sessao.para_dict()}), 201
+
+
+@bp.route('/sessoes', methods=['GET'])
+def listar_sessoes():
+    """Sessões abertas e limites"""
+    gerenciador = sessoes()
+    return jsonify({"sucesso": True, "dados": gerenciador.listar(), **gerenciador.estatisticas()}), 200
+
+
+@bp.route('/sessoes/<sessao>', methods=['GET'])
+def obter_sessao(sessao):
+    """Sessão com a conversa até aqui"""
+    try:
+        dados = sessoes().obter(sessao).para_dict(turnos=True)
+    except KeyError as e:
+        return jsonify({"sucesso": False, "erro": e.args[0]}), 404
+    return jsonify({"sucesso": True, "dados": dados}), 200
+
+
+@bp.route('/sessoes/<sessao>', methods=['DELETE'])
+def encerrar_sessao(sessao):
+    """Encerra a sessão e descarta seu estado"""
+    if not sessoes().encerrar(sessao):
+        return jsonify({"sucesso": False, "erro": f"Sessão '{sessao}' não encontrada"}), 404
+    return jsonify({"sucesso": True, "mensagem": "Sessão encerrada"}), 200
+
+
+@bp.route('/sessoes/<sessao>/turnos', methods=['POST'])
+def gerar_turno(sessao):
+    """Acrescenta um turno à sessão e gera a resposta"""
+    dados = request.get_json() or {}
+    prompt = dados.get("prompt")
+    
+    if not prompt:
+        return jsonify({"sucesso": False, "erro": "Campo 'prompt' obrigatório"}), 400
+    
+    try:
+        with obter_agendador().vaga(dados.get("prioridade")) as espera:
+            resposta = obter_gerador().gerar_turno(
+                sessao,
+                prompt,
+                temp=dados.get("temperatura"),
+                tokens=dados.get("tokens")
+            )
+    except FilaCheia as e:
+        return _recusar(e)
+    except KeyError as e:
+        return jsonify({"sucesso": False, "erro": e.args[0]}), 404
+    
+    status = 200 if resposta.sucesso else 400
+    return _cabecalhos_fila(jsonify(resposta.para_dict()), espera), status
+
+
+@bp.route('/cache', methods=['GET'])
+def cache_estatisticas():
+    """Contadores do cache de respostas (e do aproximado, se ativo)"""
+    dados = obter_cache().estatisticas()
+    if config.cache.similares:
+        dados["similares"] = obter_similares().estatisticas()
+    return jsonify({"sucesso": True, "dados": dados}), 200
+
+
+@bp.route('/cache/purgar', methods=['POST'])
+def cache_purgar():
+    """Esvazia o cache de respostas (memória e disco) e o aproximado"""
+    removidas = obter_cache().purgar()
+    extras = {"removidas_similares": obter_similares().purgar()} if config.cache.similares else {}
+    return jsonify({"sucesso": True, "mensagem": "Cache purgado", "removidas": removidas, **extras}), 200
+
+
 @bp.errorhandler(404)
 def nao_encontrado(e):
     return jsonify({"sucesso": False, "erro": "Endpoint não encontrado"}), 404
@@ -90,11 +380,35 @@ def criar_app():
 app = criar_app()
 
 
-def iniciar_servidor(host: str = None, porta: int = None, debug: bool = False):
-    """Inicia servidor com config"""
+def iniciar_servidor(host: str = None, porta: int = None, debug: bool = False,
+                     aquecer: bool = None, precarregar: str = None, processos: int = None,
+                     assincrono: bool = False):
+    """
+    Inicia servidor com config; pré-carga e aquecimento rodam em segundo plano (/ready)
+    
+    Com `processos` >= 1 (ou API_PROCESSOS) usa o modo de produção com processos
+    pré-criados; senão, o servidor de desenvolvimento do Flask. `assincrono`
+    troca o Flask pelo servidor aiohttp (servidor_async) nos dois modos.
+    """
     host = host or config.api.host
     porta = porta or config.api.porta
     debug = debug or config.api.debug
+    processos = config.api.processos if processos is None else processos
+    
+    if processos and not debug:
+        from .producao import servir
+        servir(host, porta, processos, config.api.timeout_gracioso,
+               aquecer=aquecer, precarregar=precarregar, assincrono=assincrono)
+        return
+    
+    if assincrono:
+        from .servidor_async import iniciar_servidor_async
+        iniciar_servidor_async(host, porta, aquecer=aquecer, precarregar=precarregar)
+        return
+    
+    # Com o reloader do debug, só o processo filho atende requisições
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        preparar_em_segundo_plano(aquecer=aquecer, precarregar=precarregar)
     
     logger.info(f"Servidor em {host}:{porta} (debug={debug})")
     app.run(host=host, port=porta, debug=debug)
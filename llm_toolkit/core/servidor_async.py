@@ -0,0 +1,421 @@
+"""
+Servidor assíncrono (aiohttp) com os mesmos endpoints do blueprint Flask
+
+Cada geração pendente é uma corrotina, não uma thread: um processo segura
+centenas de requisições na fila (ajuste API_FILA_MAX) com pouca memória.
+Requer aiohttp: pip install llm-toolkit[async]
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+try:
+    from aiohttp import web
+except ImportError:  # dependência opcional
+    web = None
+
+from ..api import obter_gerador
+from ..config import config
+from .agendador import Admissao, EsperaExcedida, FilaCheia, obter_agendador
+from .aquecimento import preparar_em_segundo_plano, prontidao
+from .cache import obter_cache
+from .llm import registro_modelos, sessoes, verificar_arquivos
+from .metricas import LATENCIA_HTTP, REQUISICOES, registro
+from .parada import coletar_fim
+from .perfil import Rastreio, definir_rastreio, em_thread, obter_perfil, rastreio_atual
+from .sessoes import LimiteSessoes
+from .similares import obter_similares
+# Também registra os medidores de fila e cache usados em /metricas
+from .servidor import _evento_sse
+
+logger = logging.getLogger(__name__)
+
+
+def _json(dados: dict, status: int = 200) -> "web.Response":
+    return web.json_response(dados, status=status)
+
+
+async def _corpo(request) -> dict:
+    """Corpo JSON da requisição ({} se ausente ou inválido)"""
+    try:
+        dados = await request.json()
+    except ValueError:
+        return {}
+    return dados if isinstance(dados, dict) else {}
+
+
+async def _registrar_requisicao(request, handler):
+    """Latência, contadores e rastreio por fase (middleware)"""
+    request["inicio"] = inicio = time.perf_counter()
+    recurso = request.match_info.route.resource
+    endpoint = recurso.canonical if recurso is not None else "desconhecido"
+    rastreio = Rastreio(endpoint) if endpoint.startswith("/gerar") or endpoint.endswith("/turnos") else None
+    definir_rastreio(rastreio)
+
+    try:
+        resposta = await handler(request)
+    except web.HTTPNotFound:
+        resposta = _json({"sucesso": False, "erro": "Endpoint não encontrado"}, 404)
+    except web.HTTPException as e:
+        resposta = _json({"sucesso": False, "erro": e.reason}, e.status)
+    except Exception as e:
+        logger.error(f"Erro 500: {e}")
+        resposta = _json({"sucesso": False, "erro": "Erro interno"}, 500)
+
+    # Streams: latência até os cabeçalhos, como no servidor Flask
+    LATENCIA_HTTP.observar(request.get("latencia", time.perf_counter() - inicio), endpoint=endpoint)
+    REQUISICOES.inc(endpoint=endpoint, metodo=request.method, status=resposta.status)
+    if rastreio is not None:
+        if not resposta.prepared:
+            resposta.headers["Server-Timing"] = rastreio.server_timing()
+        obter_perfil().registrar(rastreio)
+    return resposta
+
+
+async def health(request):
+    """Verificação de saúde (503 se faltar binário ou modelo)"""
+    arquivos = verificar_arquivos()
+    ok = all(arquivos.values())
+    return _json({
+        "sucesso": ok,
+        "status": "ok" if ok else "degradado",
+        "versao": "1.0.0",
+        **arquivos
+    }, 200 if ok else 503)
+
+
+async def ready(request):
+    """Prontidão: 200 só depois da pré-carga e do aquecimento"""
+    estado = prontidao.para_dict()
+    return _json({"sucesso": estado["pronto"], "dados": estado}, 200 if estado["pronto"] else 503)
+
+
+def _recusar(erro: FilaCheia):
+    """429 (fila cheia) ou 503 (espera excedida) com Retry-After"""
+    resposta = _json({"sucesso": False, "erro": str(erro)}, 503 if isinstance(erro, EsperaExcedida) else 429)
+    resposta.headers["Retry-After"] = str(erro.retry_after)
+    return resposta
+
+
+def _cabecalhos_fila(resposta, espera: float):
+    """Expõe espera e profundidade da fila ao chamador"""
+    resposta.headers["X-Fila-Espera"] = f"{espera:.3f}"
+    resposta.headers["X-Fila-Profundidade"] = str(obter_agendador().estatisticas()["profundidade"])
+    return resposta
+
+
+async def gerar(request):
+    """Gera resposta"""
+    dados = await _corpo(request)
+    prompt = dados.get("prompt")
+
+    if not prompt:
+        return _json({"sucesso": False, "erro": "Campo 'prompt' obrigatório"}, 400)
+
+    # Só ocupa vaga se for gerar: iguais em andamento são esperadas sem vaga
+    admissao = Admissao(dados.get("prioridade"))
+    try:
+        resposta = await obter_gerador().gerar_async(
+            prompt,
+            temp=dados.get("temperatura"),
+            tokens=dados.get("tokens"),
+            modelo=dados.get("modelo"),
+            admissao=admissao
+        )
+    except FilaCheia as e:
+        return _recusar(e)
+
+    status = 200 if resposta.sucesso else 400
+    return _cabecalhos_fila(_json(resposta.para_dict(), status), admissao.espera)
+
+
+async def gerar_stream(request):
+    """Gera resposta via Server-Sent Events (um evento por bloco)"""
+    dados = await _corpo(request)
+    prompt = dados.get("prompt")
+
+    if not prompt:
+        return _json({"sucesso": False, "erro": "Campo 'prompt' obrigatório"}, 400)
+
+    # A vaga (só de quem inicia a geração) fica reservada até o stream terminar
+    admissao = Admissao(dados.get("prioridade"))
+    try:
+        blocos = await obter_gerador().gerar_stream_async(
+            prompt,
+            temp=dados.get("temperatura"),
+            tokens=dados.get("tokens"),
+            modelo=dados.get("modelo"),
+            admissao=admissao
+        )
+    except ValueError as e:
+        return _json({"sucesso": False, "erro": str(e)}, 400)
+    except FilaCheia as e:
+        return _recusar(e)
+
+    rastreio = rastreio_atual()
+    resposta = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"
+    })
+    _cabecalhos_fila(resposta, admissao.espera)
+    if rastreio is not None:
+        resposta.headers["Server-Timing"] = rastreio.server_timing()
+
+    partes = []
+    try:
+        await resposta.prepare(request)
+        request["latencia"] = time.perf_counter() - request["inicio"]
+        try:
+            with coletar_fim() as termino:
+                async for bloco in blocos:
+                    partes.append(bloco)
+                    await resposta.write(_evento_sse({"token": bloco}).encode("utf-8"))
+        except ConnectionResetError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro no stream: {e}")
+            await resposta.write(_evento_sse({"sucesso": False, "erro": str(e)[:100]}, "erro").encode("utf-8"))
+            return resposta
+        # Sem detalhes de término: a resposta veio do cache
+        fim = {"sucesso": True, "dados": "".join(partes).strip(), "fim": termino or {"motivo": "cache"}}
+        if rastreio is not None:
+            fim["tempos"] = rastreio.para_dict()["fases"]
+        await resposta.write(_evento_sse(fim, "fim").encode("utf-8"))
+        return resposta
+    finally:
+        await blocos.aclose()
+        admissao.liberar(medir=False)
+
+
+async def gerar_multiplo(request):
+    """Gera múltiplas respostas"""
+    dados = await _corpo(request)
+    prompts = dados.get("prompts", [])
+
+    if not prompts or not isinstance(prompts, list):
+        return _json({"sucesso": False, "erro": "'prompts' deve ser lista"}, 400)
+
+    agendador = obter_agendador()
+    if agendador.cheio():
+        return _recusar(FilaCheia("Fila cheia", agendador.estimar_espera(agendador.capacidade)))
+
+    respostas = await obter_gerador().gerar_multiplo_async(
+        prompts,
+        temp=dados.get("temperatura"),
+        tokens=dados.get("tokens"),
+        max_paralelo=dados.get("max_paralelo"),
+        timeout_item=dados.get("timeout_item"),
+        prioridade=dados.get("prioridade", "batch"),
+        modelo=dados.get("modelo")
+    )
+    resultados = [r.para_dict() for r in respostas]
+    falhas = sum(1 for r in respostas if not r.sucesso)
+
+    return _json({
+        "sucesso": True,
+        "dados": resultados,
+        "total": len(resultados),
+        "falhas": falhas
+    })
+
+
+def _inteiro(request, nome: str, padrao=None):
+    try:
+        return int(request.query[nome])
+    except (KeyError, ValueError):
+        return padrao
+
+
+async def historico(request):
+    """Obtém histórico paginado (`limite`/`ultimos`, `cursor`, `busca`)"""
+    limite = _inteiro(request, "limite") or _inteiro(request, "ultimos", 10)
+    # Consulta ao SQLite fora do event loop
+    hist, proximo = await em_thread(
+        obter_gerador().listar_historico,
+        limite,
+        cursor=_inteiro(request, "cursor"),
+        busca=request.query.get("busca") or None
+    )
+    return _json({
+        "sucesso": True,
+        "dados": hist,
+        "total": len(hist),
+        "proximo_cursor": proximo
+    })
+
+
+async def historico_exportar(request):
+    """Exporta o histórico completo em NDJSON (transmitido em blocos)"""
+    registros = obter_gerador().historico.exportar()
+    resposta = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await resposta.prepare(request)
+    while True:
+        bloco = await em_thread(list, itertools.islice(registros, 500))
+        if not bloco:
+            return resposta
+        await resposta.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in bloco).encode("utf-8"))
+
+
+async def limpar_historico(request):
+    """Limpa histórico"""
+    await em_thread(obter_gerador().limpar_historico)
+    return _json({"sucesso": True, "mensagem": "Histórico limpo"})
+
+
+async def metricas(request):
+    """Métricas no formato texto do Prometheus"""
+    return web.Response(body=registro.exportar().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def perfil(request):
+    """Requisições de geração mais lentas entre as recentes, com tempo por fase"""
+    lentas = obter_perfil().mais_lentas(_inteiro(request, "limite", 10))
+    return _json({"sucesso": True, "dados": lentas, "total": len(lentas)})
+
+
+async def fila(request):
+    """Estado do controle de admissão"""
+    return _json({"sucesso": True, "dados": obter_agendador().estatisticas()})
+
+
+async def modelos(request):
+    """Modelos do registro: residência, RAM estimada e contadores por modelo"""
+    return _json({"sucesso": True, "dados": registro_modelos().estatisticas()})
+
+
+async def criar_sessao(request):
+    """Abre uma sessão de conversa (`modelo` opcional)"""
+    modelo = (await _corpo(request)).get("modelo")
+    try:
+        registro_modelos().obter(modelo)
+        sessao = sessoes().criar(modelo)
+    except ValueError as e:
+        return _json({"sucesso": False, "erro": str(e)}, 400)
+    except LimiteSessoes as e:
+        return _json({"sucesso": False, "erro": str(e)}, 429)
+    return _json({"sucesso": True, "dados": sessao.para_dict()}, 201)
+
+
+async def listar_sessoes(request):
+    """Sessões abertas e limites"""
+    gerenciador = sessoes()
+    return _json({"sucesso": True, "dados": gerenciador.listar(), **gerenciador.estatisticas()})
+
+
+async def obter_sessao(request):
+    """Sessão com a conversa até aqui"""
+    try:
+        dados = sessoes().obter(request.match_info["sessao"]).para_dict(turnos=True)
+    except KeyError as e:
+        return _json({"sucesso": False, "erro": e.args[0]}, 404)
+    return _json({"sucesso": True, "dados": dados})
+
+
+async def encerrar_sessao(request):
+    """Encerra a sessão e descarta seu estado"""
+    sessao = request.match_info["sessao"]
+    if not await em_thread(sessoes().encerrar, sessao):
+        return _json({"sucesso": False, "erro": f"Sessão '{sessao}' não encontrada"}, 404)
+    return _json({"sucesso": True, "mensagem": "Sessão encerrada"})
+
+
+async def gerar_turno(request):
+    """
+    Acrescenta um turno à sessão e gera a resposta
+
+    O turno roda numa thread (o slot/arquivo da sessão é usado pelo caminho
+    síncrono); a espera na fila continua sem ocupar threads.
+    """
+    dados = await _corpo(request)
+    prompt = dados.get("prompt")
+
+    if not prompt:
+        return _json({"sucesso": False, "erro": "Campo 'prompt' obrigatório"}, 400)
+
+    gerador = obter_gerador()
+    try:
+        async with obter_agendador().vaga_async(dados.get("prioridade")) as espera:
+            resposta = await em_thread(
+                gerador.gerar_turno,
+                request.match_info["sessao"],
+                prompt,
+                temp=dados.get("temperatura"),
+                tokens=dados.get("tokens")
+            )
+    except FilaCheia as e:
+        return _recusar(e)
+    except KeyError as e:
+        return _json({"sucesso": False, "erro": e.args[0]}, 404)
+
+    status = 200 if resposta.sucesso else 400
+    return _cabecalhos_fila(_json(resposta.para_dict(), status), espera)
+
+
+async def cache_estatisticas(request):
+    """Contadores do cache de respostas (e do aproximado, se ativo)"""
+    dados = obter_cache().estatisticas()
+    if config.cache.similares:
+        dados["similares"] = obter_similares().estatisticas()
+    return _json({"sucesso": True, "dados": dados})
+
+
+async def cache_purgar(request):
+    """Esvazia o cache de respostas (memória e disco) e o aproximado"""
+    removidas = await em_thread(obter_cache().purgar)
+    extras = {"removidas_similares": obter_similares().purgar()} if config.cache.similares else {}
+    return _json({"sucesso": True, "mensagem": "Cache purgado", "removidas": removidas, **extras})
+
+
+async def _fechar_sessoes(app) -> None:
+    from .pool import fechar_sessoes
+    await fechar_sessoes()
+
+
+def criar_app_async() -> "web.Application":
+    """Factory da aplicação aiohttp"""
+    if web is None:
+        raise ImportError("Servidor assíncrono requer aiohttp: pip install aiohttp")
+    app = web.Application(middlewares=[web.middleware(_registrar_requisicao)])
+    app.router.add_get('/health', health)
+    app.router.add_get('/ready', ready)
+    app.router.add_post('/gerar', gerar)
+    app.router.add_post('/gerar-stream', gerar_stream)
+    app.router.add_post('/gerar-multiplo', gerar_multiplo)
+    app.router.add_get('/historico', historico)
+    app.router.add_get('/historico/exportar', historico_exportar)
+    app.router.add_post('/limpar-historico', limpar_historico)
+    app.router.add_get('/metricas', metricas)
+    app.router.add_get('/perfil', perfil)
+    app.router.add_get('/fila', fila)
+    app.router.add_get('/modelos', modelos)
+    app.router.add_post('/sessoes', criar_sessao)
+    app.router.add_get('/sessoes', listar_sessoes)
+    app.router.add_get('/sessoes/{sessao}', obter_sessao)
+    app.router.add_delete('/sessoes/{sessao}', encerrar_sessao)
+    app.router.add_post('/sessoes/{sessao}/turnos', gerar_turno)
+    app.router.add_get('/cache', cache_estatisticas)
+    app.router.add_post('/cache/purgar', cache_purgar)
+    app.on_cleanup.append(_fechar_sessoes)
+    return app
+
+
+def iniciar_servidor_async(host: str = None, porta: int = None, aquecer: bool = None,
+                           precarregar: str = None, sock=None):
+    """
+    Inicia o servidor assíncrono; pré-carga e aquecimento rodam em segundo plano (/ready)
+
+    Com `sock` atende num socket já aberto (modo produção). SIGTERM/SIGINT
+    esperam as requisições em andamento por até API_TIMEOUT_GRACIOSO.
+    """
+    app = criar_app_async()
+    preparar_em_segundo_plano(aquecer=aquecer, precarregar=precarregar)
+    if sock is None:
+        host = host or config.api.host
+        porta = porta or config.api.porta
+        logger.info(f"Servidor assíncrono em {host}:{porta}")
+        web.run_app(app, host=host, port=porta, shutdown_timeout=config.api.timeout_gracioso, print=None)
+    else:
+        web.run_app(app, sock=sock, shutdown_timeout=config.api.timeout_gracioso, print=None)
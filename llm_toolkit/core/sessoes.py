@@ -0,0 +1,203 @@
+"""
+Sessões de conversa: o contexto já avaliado fica residente entre os turnos
+
+Cada turno estende o prompt do anterior (sistema + turnos + pergunta nova),
+então o llama.cpp só avalia os tokens novos. No modo residente a sessão
+fica presa a um slot de um worker (o KV da conversa continua lá); no modo
+por requisição o llama-cli lê e regrava um cache de prompt da sessão em
+disco. Sessões ociosas há SESSOES_OCIOSA segundos são descartadas e, com
+SESSOES_MAX sessões abertas, criar outra descarta a usada há mais tempo.
+
+As sessões vivem na memória do processo: com API_PROCESSOS > 1, cada
+processo tem as suas.
+"""
+
+import logging
+import secrets
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..config import config
+from .metricas import SESSOES_DESCARTADAS
+
+logger = logging.getLogger(__name__)
+
+
+class LimiteSessoes(RuntimeError):
+    """Todas as sessões abertas estão no meio de um turno"""
+
+
+@dataclass
+class Sessao:
+    """Conversa com turnos (pergunta, resposta) e onde seu estado está guardado"""
+    id: str
+    modelo: Optional[str] = None
+    turnos: List[Tuple[str, str]] = field(default_factory=list)
+    trabalhador: Optional[int] = None   # modo residente: worker e slot fixos
+    slot: Optional[int] = None
+    arquivo: Optional[Path] = None      # modo por requisição: cache de prompt do llama-cli
+    tokens_estado: int = 0              # tokens da conversa já avaliados (no slot ou no arquivo)
+    criada: str = field(default_factory=lambda: datetime.now().isoformat())
+    ultimo_uso: float = field(default_factory=time.monotonic)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def ocupada(self) -> bool:
+        return self._lock.locked()
+
+    @contextmanager
+    def uso(self, timeout: float) -> Iterator[None]:
+        """Um turno por vez (TimeoutError se o anterior não terminar a tempo)"""
+        if not self._lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Timeout ({timeout}s): sessão '{self.id}' ocupada")
+        try:
+            yield
+        finally:
+            self.ultimo_uso = time.monotonic()
+            self._lock.release()
+
+    def para_dict(self, turnos: bool = False) -> Dict:
+        dados = {
+            "id": self.id,
+            "modelo": self.modelo,
+            "turnos": len(self.turnos),
+            "criada": self.criada,
+            "ociosa_s": round(time.monotonic() - self.ultimo_uso, 1),
+        }
+        if turnos:
+            dados["conversa"] = [{"prompt": p, "resposta": r} for p, r in self.turnos]
+        return dados
+
+
+class GerenciadorSessoes:
+    """Sessões abertas, com descarte por ociosidade e limite de quantidade"""
+
+    def __init__(self, maximo: int, ociosa: float, diretorio: Path, workers: int = 0, slots: int = 1):
+        self.maximo = maximo
+        self.ociosa = ociosa
+        self.diretorio = Path(diretorio)
+        # Posições (worker, slot) dos workers residentes; 0 = modo por requisição
+        self.posicoes = workers * slots
+        self.slots = slots
+        # Em ordem de uso: a primeira é a descartada quando o limite é atingido
+        self._sessoes: "OrderedDict[str, Sessao]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._limpar_arquivos()
+
+    def criar(self, modelo: Optional[str] = None) -> Sessao:
+        """Abre uma sessão (LimiteSessoes se o limite foi atingido e todas estão em uso)"""
+        with self._lock:
+            self._expirar()
+            if len(self._sessoes) >= self.maximo:
+                livre = next((s for s in self._sessoes.values() if not s.ocupada), None)
+                if livre is None:
+                    raise LimiteSessoes(f"Limite de {self.maximo} sessões atingido")
+                self._descartar(livre, "limite")
+
+            sessao = Sessao(secrets.token_hex(8), modelo)
+            if self.posicoes:
+                sessao.trabalhador, sessao.slot = divmod(self._posicao_livre(), self.slots)
+            else:
+                sessao.arquivo = self.diretorio / f"sessao-{sessao.id}.bin"
+            self._sessoes[sessao.id] = sessao
+            logger.info(f"Sessão {sessao.id} criada ({len(self._sessoes)} abertas)")
+            return sessao
+
+    def _posicao_livre(self) -> int:
+        """Posição (worker, slot) com menos sessões: cada slot guarda o KV de uma conversa"""
+        uso = Counter(s.trabalhador * self.slots + s.slot for s in self._sessoes.values())
+        return min(range(self.posicoes), key=lambda p: uso[p])
+
+    def obter(self, sessao_id: str) -> Sessao:
+        """Sessão aberta pelo id (KeyError se não existe ou expirou)"""
+        with self._lock:
+            self._expirar()
+            sessao = self._sessoes.get(sessao_id)
+            if sessao is None:
+                raise KeyError(f"Sessão '{sessao_id}' não encontrada")
+            self._sessoes.move_to_end(sessao_id)
+            return sessao
+
+    def encerrar(self, sessao_id: str) -> bool:
+        """Descarta a sessão e seu estado em disco; False se não existe"""
+        with self._lock:
+            sessao = self._sessoes.get(sessao_id)
+            if sessao is None:
+                return False
+            self._descartar(sessao, "encerrada")
+            return True
+
+    def listar(self) -> List[Dict]:
+        with self._lock:
+            self._expirar()
+            return [s.para_dict() for s in self._sessoes.values()]
+
+    def __len__(self) -> int:
+        return len(self._sessoes)
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            self._expirar()
+            return {
+                "abertas": len(self._sessoes),
+                "maximo": self.maximo,
+                "ociosa_s": self.ociosa,
+                "estado": "slot" if self.posicoes else "arquivo",
+            }
+
+    def _expirar(self) -> None:
+        """Descarta as ociosas (chamar com o lock)"""
+        limite = time.monotonic() - self.ociosa
+        for sessao in [s for s in self._sessoes.values() if s.ultimo_uso < limite and not s.ocupada]:
+            self._descartar(sessao, "ociosa")
+
+    def _descartar(self, sessao: Sessao, motivo: str) -> None:
+        del self._sessoes[sessao.id]
+        if sessao.arquivo is not None:
+            sessao.arquivo.unlink(missing_ok=True)
+        SESSOES_DESCARTADAS.inc(motivo=motivo)
+        logger.info(f"Sessão {sessao.id} descartada ({motivo})")
+
+    def _limpar_arquivos(self) -> None:
+        """Apaga caches de sessões abandonadas (ociosos no disco além do prazo)"""
+        limite = time.time() - self.ociosa
+        for arquivo in self.diretorio.glob("sessao-*.bin"):
+            try:
+                if arquivo.stat().st_mtime < limite:
+                    arquivo.unlink()
+            except OSError:
+                pass
+
+    def encerrar_todas(self) -> None:
+        with self._lock:
+            for sessao in list(self._sessoes.values()):
+                self._descartar(sessao, "encerrada")
+
+
+# Singleton
+_gerenciador = None
+_gerenciador_lock = threading.Lock()
+
+def obter_sessoes(workers: int = 0, slots: int = 1) -> GerenciadorSessoes:
+    """Obtém gerenciador global (criado no primeiro uso, com config.sessoes)"""
+    global _gerenciador
+    with _gerenciador_lock:
+        if _gerenciador is None:
+            _gerenciador = GerenciadorSessoes(config.sessoes.maximo, config.sessoes.ociosa,
+                                              Path(config.sessoes.diretorio), workers, slots)
+        return _gerenciador
+
+
+def resetar_sessoes() -> None:
+    """Descarta as sessões e o gerenciador (útil para testes)"""
+    global _gerenciador
+    with _gerenciador_lock:
+        if _gerenciador is not None:
+            _gerenciador.encerrar_todas()
+        _gerenciador = None
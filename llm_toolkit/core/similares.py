@@ -0,0 +1,246 @@
+"""
+Cache aproximado: prompts quase iguais reaproveitam a resposta
+
+Prompts que diferem só em espaços, maiúsculas, pontuação, acentos ou uma
+palavra erram o cache exato. Aqui o prompt é normalizado, vira um conjunto
+de trechos de caracteres e uma assinatura MinHash; o índice LSH (bandas da
+assinatura) acha os candidatos sem percorrer as entradas, e a fração de
+valores iguais nas assinaturas estima a similaridade de Jaccard, comparada
+com CACHE_SIMILARIDADE. Só em memória, limitado a CACHE_SIMILARES_MB.
+"""
+
+import logging
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from operator import eq
+from typing import Dict, List, Optional, Tuple
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 ** 2
+_SEM_PALAVRA = re.compile(r"[\W_]+")
+# Trechos de caracteres comparados (shingles)
+_TRECHO = 4
+_PERMUTACOES = 64
+
+
+def normalizar(prompt: str) -> str:
+    """Minúsculas, sem acentos nem pontuação, espaços colapsados"""
+    texto = unicodedata.normalize("NFKD", prompt.casefold())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _SEM_PALAVRA.sub(" ", texto).strip()
+
+
+def _escolher_bandas(limiar: float, permutacoes: int) -> Tuple[int, int]:
+    """
+    (bandas, linhas por banda) do LSH
+
+    Dois prompts viram candidatos se alguma banda inteira coincide; o ponto
+    de virada da curva fica em ~(1/bandas)^(1/linhas). Usa a banda mais
+    longa (menos candidatos) cujo ponto de virada ainda fica abaixo do limiar.
+    """
+    linhas = 1
+    for r in (2, 4, 8, 16, 32):
+        if permutacoes % r == 0 and (r / permutacoes) ** (1 / r) < limiar:
+            linhas = r
+    return permutacoes // linhas, linhas
+
+
+class _Entrada:
+    __slots__ = ("contexto", "assinatura", "exato", "resposta", "criado", "tamanho")
+
+    def __init__(self, contexto: int, assinatura: array, exato: int, resposta: str, tamanho: int):
+        self.contexto = contexto
+        self.assinatura = assinatura
+        self.exato = exato
+        self.resposta = resposta
+        self.criado = time.time()
+        self.tamanho = tamanho
+
+
+class CacheSimilares:
+    """Respostas indexadas por MinHash/LSH, com LRU limitado por memória"""
+
+    def __init__(self, limiar: float = 0.85, memoria_max: int = 256 * _MB,
+                 ttl: float = 86400, permutacoes: int = _PERMUTACOES):
+        self.limiar = limiar
+        self.memoria_max = memoria_max
+        self.ttl = ttl
+        self.permutacoes = permutacoes
+        self.bandas, self.linhas = _escolher_bandas(limiar, permutacoes)
+        self._entradas: "OrderedDict[int, _Entrada]" = OrderedDict()
+        # Banda -> entradas com ela; texto normalizado -> entrada (atalho do acerto exato)
+        self._indice: Dict[int, List[int]] = {}
+        self._exatos: Dict[int, int] = {}
+        self._proximo = 0
+        self._memoria = 0
+        self._lock = threading.Lock()
+        self.contadores = {"acertos": 0, "acertos_normalizados": 0, "faltas": 0, "gravacoes": 0, "despejos": 0}
+
+    def assinatura(self, normalizado: str) -> array:
+        """
+        MinHash dos trechos de `_TRECHO` caracteres, com uma permutação só
+
+        O hash de cada trecho escolhe a posição da assinatura e a posição
+        guarda o menor valor (one permutation hashing); posições vazias copiam
+        a próxima preenchida, deslocada pela distância (densificação).
+        """
+        k = self.permutacoes
+        minimos = [None] * k
+        for h in map(hash, {normalizado[i:i + _TRECHO] for i in range(max(1, len(normalizado) - _TRECHO + 1))}):
+            posicao, valor = h % k, h // k
+            atual = minimos[posicao]
+            if atual is None or valor < atual:
+                minimos[posicao] = valor
+        cheias = [i for i, v in enumerate(minimos) if v is not None]
+        if len(cheias) < k:
+            for i in range(k):
+                if minimos[i] is None:
+                    j = cheias[bisect_left(cheias, i) % len(cheias)]
+                    minimos[i] = minimos[j] + (j - i) % k
+        return array("I", [v & 0xFFFFFFFF for v in minimos])
+
+    def _chaves_bandas(self, contexto: int, assinatura: array) -> List[int]:
+        r = self.linhas
+        return [hash((contexto, b, assinatura[b * r:(b + 1) * r].tobytes())) for b in range(self.bandas)]
+
+    def obter(self, prompt: str, contexto: str) -> Optional[Tuple[str, float]]:
+        """(resposta, similaridade) da entrada mais parecida acima do limiar, ou None"""
+        normalizado = normalizar(prompt)
+        ctx = hash(contexto)
+        agora = time.time()
+        with self._lock:
+            indice = self._exatos.get(hash((ctx, normalizado)))
+            if indice is not None and self._valida(indice, agora):
+                self.contadores["acertos_normalizados"] += 1
+                return self._usar(indice), 1.0
+
+        assinatura = self.assinatura(normalizado)
+        chaves = self._chaves_bandas(ctx, assinatura)
+        with self._lock:
+            candidatos = set()
+            for chave in chaves:
+                candidatos.update(self._indice.get(chave, ()))
+            melhor, similaridade = None, self.limiar
+            for indice in candidatos:
+                entrada = self._entradas[indice]
+                if entrada.contexto != ctx:
+                    continue
+                parecida = sum(map(eq, assinatura, entrada.assinatura)) / self.permutacoes
+                if parecida >= similaridade:
+                    melhor, similaridade = indice, parecida
+            if melhor is None or not self._valida(melhor, agora):
+                self.contadores["faltas"] += 1
+                return None
+            self.contadores["acertos"] += 1
+            return self._usar(melhor), similaridade
+
+    def _valida(self, indice: int, agora: float) -> bool:
+        """Entrada ainda no prazo (remove a expirada; chamar com o lock)"""
+        if agora - self._entradas[indice].criado < self.ttl:
+            return True
+        self._remover(indice)
+        return False
+
+    def _usar(self, indice: int) -> str:
+        self._entradas.move_to_end(indice)
+        return self._entradas[indice].resposta
+
+    def gravar(self, prompt: str, contexto: str, resposta: str) -> None:
+        """Indexa a resposta do prompt (substitui a de um prompt com o mesmo texto normalizado)"""
+        normalizado = normalizar(prompt)
+        ctx = hash(contexto)
+        exato = hash((ctx, normalizado))
+        assinatura = self.assinatura(normalizado)
+        chaves = self._chaves_bandas(ctx, assinatura)
+        # Resposta + assinatura + posições no índice e nos dicionários (aproximado)
+        tamanho = sys.getsizeof(resposta) + sys.getsizeof(assinatura) + 150 * len(chaves) + 400
+        with self._lock:
+            anterior = self._exatos.get(exato)
+            if anterior is not None:
+                self._remover(anterior)
+            indice = self._proximo
+            self._proximo += 1
+            self._entradas[indice] = _Entrada(ctx, assinatura, exato, resposta, tamanho)
+            self._exatos[exato] = indice
+            for chave in chaves:
+                self._indice.setdefault(chave, []).append(indice)
+            self._memoria += tamanho
+            self.contadores["gravacoes"] += 1
+            while self._memoria > self.memoria_max and len(self._entradas) > 1:
+                self._remover(next(iter(self._entradas)))
+                self.contadores["despejos"] += 1
+
+    def _remover(self, indice: int) -> None:
+        """Tira a entrada do LRU e do índice (chamar com o lock)"""
+        entrada = self._entradas.pop(indice)
+        for chave in self._chaves_bandas(entrada.contexto, entrada.assinatura):
+            balde = self._indice[chave]
+            balde.remove(indice)
+            if not balde:
+                del self._indice[chave]
+        if self._exatos.get(entrada.exato) == indice:
+            del self._exatos[entrada.exato]
+        self._memoria -= entrada.tamanho
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def purgar(self) -> int:
+        """Remove todas as entradas; retorna quantas saíram"""
+        with self._lock:
+            removidas = len(self._entradas)
+            self._entradas.clear()
+            self._indice.clear()
+            self._exatos.clear()
+            self._memoria = 0
+        logger.info(f"Cache aproximado purgado ({removidas} entradas)")
+        return removidas
+
+    def estatisticas(self) -> Dict:
+        """Contadores, ocupação e parâmetros do LSH"""
+        with self._lock:
+            acertos = self.contadores["acertos"] + self.contadores["acertos_normalizados"]
+            total = acertos + self.contadores["faltas"]
+            return {
+                **self.contadores,
+                "taxa_acerto": round(acertos / total, 4) if total else 0.0,
+                "entradas": len(self._entradas),
+                "memoria_mb": round(self._memoria / _MB, 1),
+                "memoria_max_mb": round(self.memoria_max / _MB, 1),
+                "limiar": self.limiar,
+                "bandas": self.bandas,
+                "linhas": self.linhas,
+            }
+
+
+# Singleton
+_similares = None
+_similares_lock = threading.Lock()
+
+def obter_similares() -> CacheSimilares:
+    """Obtém cache aproximado global configurado por config.cache"""
+    global _similares
+    with _similares_lock:
+        if _similares is None:
+            _similares = CacheSimilares(
+                limiar=config.cache.similaridade,
+                memoria_max=config.cache.similares_mb * _MB,
+                ttl=config.cache.ttl
+            )
+        return _similares
+
+
+def resetar_similares() -> None:
+    """Descarta o cache aproximado global"""
+    global _similares
+    with _similares_lock:
+        _similares = None
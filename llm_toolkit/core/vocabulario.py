@@ -0,0 +1,291 @@
+"""
+Tokenizador em processo a partir do vocabulário do GGUF
+
+O cabeçalho do GGUF (metadados chave/valor) é lido por mmap: os tensores
+do modelo nunca são tocados, então carregar o vocabulário não lê os GB de
+pesos. Suporta os tokenizadores SentencePiece ('llama', ex.: Gemma) e BPE
+em bytes ('gpt2'); a pré-tokenização do BPE usa a regex do GPT-2, então
+modelos com outra regex podem diferir por poucos tokens.
+"""
+
+import heapq
+import logging
+import mmap
+import re
+import struct
+import threading
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_MAGICO = b"GGUF"
+
+# Tipos de valor do GGUF -> formato do struct (8 = string, 9 = array)
+_ESCALARES = {0: "B", 1: "b", 2: "H", 3: "h", 4: "I", 5: "i", 6: "f", 7: "?", 10: "Q", 11: "q", 12: "d"}
+_STRING, _ARRAY = 8, 9
+
+# Palavra do SentencePiece: espaços (▁) iniciais e o texto até o próximo espaço
+_PALAVRA_SPM = re.compile(r"▁*[^▁]+|▁+")
+
+# Pré-tokenização do GPT-2 (\p{L}/\p{N} aproximados com classes do `re`)
+_PRE_BPE = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d+| ?[^\s\w]+|\s+(?!\S)|\s+""")
+
+
+class LeitorGGUF:
+    """
+    Metadados de um arquivo GGUF (versão 2 ou 3), lidos via mmap
+
+    Com `arrays=False` os arrays (vocabulário, scores) são pulados e ficam
+    como None: basta para ler a arquitetura sem decodificar o vocabulário.
+    Cabeçalho truncado levanta struct.error.
+    """
+
+    def __init__(self, caminho: Path, arrays: bool = True):
+        with open(caminho, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._pos = 0
+        self._arrays = arrays
+        try:
+            self.metadados = self._ler_cabecalho()
+        finally:
+            self._mm.close()
+
+    def _ler(self, formato: str):
+        valor, = struct.unpack_from("<" + formato, self._mm, self._pos)
+        self._pos += struct.calcsize(formato)
+        return valor
+
+    def _ler_string(self) -> str:
+        tamanho = self._ler("Q")
+        texto = self._mm[self._pos:self._pos + tamanho].decode("utf-8", errors="replace")
+        self._pos += tamanho
+        return texto
+
+    def _ler_valor(self, tipo: int):
+        if tipo == _STRING:
+            return self._ler_string()
+        if tipo == _ARRAY:
+            tipo_item, quantidade = self._ler("I"), self._ler("Q")
+            if not self._arrays:
+                self._pular(tipo_item, quantidade)
+                return None
+            if tipo_item in _ESCALARES:
+                # Arrays numéricos (scores, tipos de token) copiados de uma vez
+                itens = array(_ESCALARES[tipo_item])
+                tamanho = itens.itemsize * quantidade
+                itens.frombytes(self._mm[self._pos:self._pos + tamanho])
+                self._pos += tamanho
+                return itens
+            return [self._ler_valor(tipo_item) for _ in range(quantidade)]
+        if tipo in _ESCALARES:
+            return self._ler(_ESCALARES[tipo])
+        raise ValueError(f"Tipo GGUF desconhecido: {tipo}")
+
+    def _pular(self, tipo: int, quantidade: int) -> None:
+        """Avança sobre `quantidade` valores do `tipo` sem decodificá-los"""
+        if tipo in _ESCALARES:
+            self._pos += struct.calcsize(_ESCALARES[tipo]) * quantidade
+        elif tipo == _STRING:
+            for _ in range(quantidade):
+                tamanho = self._ler("Q")
+                self._pos += tamanho
+        elif tipo == _ARRAY:
+            for _ in range(quantidade):
+                tipo_item = self._ler("I")
+                self._pular(tipo_item, self._ler("Q"))
+        else:
+            raise ValueError(f"Tipo GGUF desconhecido: {tipo}")
+
+    def _ler_cabecalho(self) -> Dict:
+        if self._mm[:4] != _MAGICO:
+            raise ValueError("Arquivo não é GGUF")
+        self._pos = 4
+        versao = self._ler("I")
+        if versao < 2:
+            raise ValueError(f"GGUF versão {versao} não suportada")
+        self._ler("Q")                  # número de tensores
+        quantidade = self._ler("Q")
+        metadados = {}
+        for _ in range(quantidade):
+            chave = self._ler_string()
+            metadados[chave] = self._ler_valor(self._ler("I"))
+        return metadados
+
+
+def _bytes_unicode() -> Dict[int, str]:
+    """Mapa byte -> caractere do BPE em bytes do GPT-2"""
+    visiveis = [*range(ord("!"), ord("~") + 1), *range(ord("¡"), ord("¬") + 1), *range(ord("®"), ord("ÿ") + 1)]
+    mapa, extra = {}, 0
+    for b in range(256):
+        if b in visiveis:
+            mapa[b] = chr(b)
+        else:
+            mapa[b] = chr(256 + extra)
+            extra += 1
+    return mapa
+
+
+class Tokenizador:
+    """Conta e gera ids de tokens como o llama.cpp (sem tokens especiais no texto)"""
+
+    def __init__(self, metadados: Dict, cache: int = 1024):
+        self.tipo = metadados.get("tokenizer.ggml.model")
+        if self.tipo not in ("llama", "gpt2"):
+            raise ValueError(f"Tokenizador '{self.tipo}' não suportado")
+        self.pecas: List[str] = metadados["tokenizer.ggml.tokens"]
+        self.ids = {peca: i for i, peca in enumerate(self.pecas)}
+        self.desconhecido = metadados.get("tokenizer.ggml.unknown_token_id", 0)
+        self.bos = bool(metadados.get("tokenizer.ggml.add_bos_token", self.tipo == "llama"))
+        self.id_bos = metadados.get("tokenizer.ggml.bos_token_id", 1)
+        arquitetura = metadados.get("general.architecture", "")
+        self.contexto_treino: Optional[int] = metadados.get(f"{arquitetura}.context_length")
+        # Nenhum token cobre mais caracteres que a maior peça
+        self.maior_peca = max(map(len, self.pecas), default=1)
+
+        if self.tipo == "llama":
+            self.pontuacoes = metadados.get("tokenizer.ggml.scores") or array("f", bytes(4 * len(self.pecas)))
+            self.prefixo_espaco = bool(metadados.get("tokenizer.ggml.add_space_prefix", True))
+            self._palavra = lru_cache(maxsize=8192)(self._spm_palavra)
+        else:
+            self.rank = {tuple(m.split(" ", 1)): i for i, m in enumerate(metadados.get("tokenizer.ggml.merges", []))}
+            self._bytes = _bytes_unicode()
+            self._palavra = lru_cache(maxsize=8192)(self._bpe_palavra)
+
+        # Contagem por prompt: validação e orçamento repetem os mesmos textos
+        self.contar = lru_cache(maxsize=cache)(self._contar)
+
+    def _contar(self, texto: str) -> int:
+        """Tokens de `texto`, incluindo o BOS quando o modelo o adiciona"""
+        return len(self.tokenizar(texto))
+
+    def tokenizar(self, texto: str, bos: Optional[bool] = None) -> List[int]:
+        """Ids dos tokens de `texto`"""
+        ids = [self.id_bos] if (self.bos if bos is None else bos) else []
+        if texto:
+            ids += self._spm(texto) if self.tipo == "llama" else self._bpe(texto)
+        return ids
+
+    def _spm(self, texto: str) -> List[int]:
+        """
+        SentencePiece, palavra a palavra (com cache por palavra)
+
+        Peças do SentencePiece não atravessam o início de uma palavra (o ▁
+        só aparece no começo), então unir cada palavra isoladamente dá o
+        mesmo resultado que unir o texto inteiro.
+        """
+        texto = texto.replace(" ", "▁")
+        if self.prefixo_espaco:
+            texto = "▁" + texto
+        ids = []
+        for palavra in _PALAVRA_SPM.findall(texto):
+            ids += self._palavra(palavra)
+        return ids
+
+    def _spm_palavra(self, palavra: str) -> List[int]:
+        """Une o par vizinho de maior pontuação até não haver pares no vocabulário"""
+        simbolos = list(palavra)
+        proximo = list(range(1, len(simbolos))) + [-1]
+        anterior = list(range(-1, len(simbolos) - 1))
+        fila = []
+
+        def par(i: int) -> None:
+            j = proximo[i] if i >= 0 else -1
+            if j < 0:
+                return
+            peca = simbolos[i] + simbolos[j]
+            indice = self.ids.get(peca)
+            if indice is not None:
+                # Maior pontuação primeiro; empate, o par mais à esquerda
+                heapq.heappush(fila, (-self.pontuacoes[indice], i, peca))
+
+        for i in range(len(simbolos) - 1):
+            par(i)
+        while fila:
+            _, i, peca = heapq.heappop(fila)
+            j = proximo[i]
+            if j < 0 or not simbolos[i] or simbolos[i] + simbolos[j] != peca:
+                continue    # par desfeito por uma união anterior
+            simbolos[i], simbolos[j] = peca, ""
+            proximo[i] = proximo[j]
+            if proximo[j] >= 0:
+                anterior[proximo[j]] = i
+            par(anterior[i])
+            par(i)
+
+        ids = []
+        i = 0
+        while i >= 0:
+            indice = self.ids.get(simbolos[i])
+            if indice is not None:
+                ids.append(indice)
+            else:
+                # Fora do vocabulário: um token por byte (<0xNN>)
+                ids += [self.ids.get(f"<0x{b:02X}>", self.desconhecido) for b in simbolos[i].encode("utf-8")]
+            i = proximo[i]
+        return ids
+
+    def _bpe(self, texto: str) -> List[int]:
+        ids = []
+        for palavra in _PRE_BPE.findall(texto):
+            ids += self._palavra("".join(self._bytes[b] for b in palavra.encode("utf-8")))
+        return ids
+
+    def _bpe_palavra(self, palavra: str) -> List[int]:
+        """BPE: aplica as uniões em ordem de prioridade (rank)"""
+        partes = list(palavra)
+        while len(partes) > 1:
+            melhor = min(((self.rank.get(p), k) for k, p in enumerate(zip(partes, partes[1:]))
+                          if p in self.rank), default=None)
+            if melhor is None:
+                break
+            k = melhor[1]
+            partes[k:k + 2] = [partes[k] + partes[k + 1]]
+        return [self.ids.get(p, self.desconhecido) for p in partes]
+
+
+def carregar_tokenizador(modelo: Path) -> Tokenizador:
+    """Lê o vocabulário do GGUF (ValueError se o formato ou o tokenizador não é suportado)"""
+    return Tokenizador(LeitorGGUF(modelo).metadados)
+
+
+# Um tokenizador por arquivo de modelo (trocar o arquivo recarrega)
+_tokenizadores: Dict[str, tuple] = {}
+_ultimo = None
+_lock = threading.Lock()
+
+def obter_tokenizador(modelo: Path) -> Optional[Tokenizador]:
+    """Tokenizador do modelo (carregado no primeiro uso); None se indisponível"""
+    global _ultimo
+    try:
+        info = modelo.stat()
+    except OSError:
+        return None
+    chave = (info.st_size, info.st_mtime_ns)
+    with _lock:
+        em_cache = _tokenizadores.get(str(modelo))
+        if em_cache is None or em_cache[0] != chave:
+            try:
+                tokenizador = carregar_tokenizador(modelo)
+                logger.info(f"Vocabulário de {modelo.name}: {len(tokenizador.pecas)} tokens ({tokenizador.tipo})")
+            except (ValueError, KeyError, OSError, struct.error) as e:
+                logger.warning(f"Vocabulário indisponível em {modelo.name} ({e}); usando estimativa")
+                tokenizador = None
+            em_cache = _tokenizadores[str(modelo)] = (chave, tokenizador)
+        _ultimo = em_cache[1]
+        return _ultimo
+
+
+def tokenizador_carregado() -> Optional[Tokenizador]:
+    """Último tokenizador usado, sem ler arquivos"""
+    return _ultimo
+
+
+def resetar_tokenizador() -> None:
+    """Descarta os tokenizadores (útil para testes)"""
+    global _ultimo
+    with _lock:
+        _tokenizadores.clear()
+        _ultimo = None
@@ -4,17 +4,34 @@ Script de download automático - llm_toolkit
 Baixa llama.cpp e modelo TinyLlama 1.1B Q4.
 """
 
+import argparse
+import hashlib
+import json
 import os
+import re
 import sys
+import threading
+import time
 import urllib.request
 import zipfile
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Optional, Tuple
 
 BASE_DIR = Path(__file__).parent
 BIN_DIR = BASE_DIR / "bin"
 MODELS_DIR = BASE_DIR / "resources" / "models"
 PROMPTS_DIR = BASE_DIR / "resources" / "prompts"
 
+# Checksums esperados: {"arquivo": {"sha256": ..., "tamanho": ...}}
+MANIFEST_FILE = Path(os.getenv("DOWNLOAD_MANIFESTO") or BASE_DIR / "resources" / "manifest.json")
+
+# Downloads em partes: faixas de CHUNK_SIZE baixadas por PARALLEL_PARTS conexões
+CHUNK_SIZE = 8 * 1024 * 1024
+PARALLEL_PARTS = int(os.getenv("DOWNLOAD_PARTES", "4"))
+RETRIES = 3
+USER_AGENT = "llm-toolkit-download/1.0"
+
 # URLs confiáveis
 MODEL_URL = "https://huggingface.co/lmstudio-community/gemma-2-2b-it-GGUF/resolve/main/gemma-2-2b-it-Q4_K_M.gguf"
 
@@ -31,8 +48,213 @@ def print_status(text: str, emoji: str = "ℹ️") -> None:
     print(f"{emoji} {text}")
 
 
-def download_with_progress(url: str, dest: Path) -> bool:
-    """Baixa arquivo com barra de progresso."""
+def load_manifest() -> dict:
+    """Lê o manifesto de checksums (vazio se não existir)."""
+    if not MANIFEST_FILE.exists():
+        return {}
+    return json.loads(MANIFEST_FILE.read_text(encoding="utf-8"))
+
+
+def save_manifest_entry(name: str, sha256: str, size: int, url: str) -> None:
+    """Registra o checksum de um download verificado."""
+    manifest = load_manifest()
+    manifest[name] = {"sha256": sha256, "tamanho": size, "url": url}
+    MANIFEST_FILE.parent.mkdir(parents=True, exist_ok=True)
+    MANIFEST_FILE.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+class _RedirectCapture(urllib.request.HTTPRedirectHandler):
+    """Guarda o X-Linked-Etag (sha256 no Hugging Face) visto antes do redirect para a CDN."""
+
+    linked_etag = None
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        self.linked_etag = self.linked_etag or headers.get("X-Linked-Etag")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def _request(url: str, start: int = None, end: int = None) -> urllib.request.Request:
+    headers = {"User-Agent": USER_AGENT}
+    if start is not None:
+        headers["Range"] = f"bytes={start}-{end}"
+    return urllib.request.Request(url, headers=headers)
+
+
+def _probe(url: str) -> Tuple[str, Optional[int], bool, Optional[str]]:
+    """
+    Consulta o servidor com um Range de 1 byte.
+
+    Returns:
+        (URL final após redirects, tamanho, aceita Range, sha256 anunciado)
+    """
+    capture = _RedirectCapture()
+    opener = urllib.request.build_opener(capture)
+    with opener.open(_request(url, 0, 0), timeout=30) as resp:
+        etag = (capture.linked_etag or resp.headers.get("X-Linked-Etag") or "").strip('"').lower()
+        sha256 = etag if re.fullmatch(r"[0-9a-f]{64}", etag) else None
+        if resp.status == 206 and "/" in resp.headers.get("Content-Range", ""):
+            total = resp.headers["Content-Range"].rsplit("/", 1)[1]
+            if total.isdigit():
+                return resp.geturl(), int(total), True, sha256
+        length = resp.headers.get("Content-Length")
+        return resp.geturl(), (int(length) if length else None), False, sha256
+
+
+class _Progress:
+    """Bytes baixados (somados por várias threads) e barra no terminal."""
+
+    def __init__(self, total: Optional[int], done: int = 0):
+        self.total = total
+        self.done = done
+        self._lock = threading.Lock()
+
+    def add(self, n: int) -> None:
+        with self._lock:
+            self.done += n
+
+    def show(self) -> None:
+        mb_down = self.done / (1024 * 1024)
+        if not self.total:
+            print(f'\r{mb_down:.1f} MB', end='', flush=True)
+            return
+        percent = min(100, self.done * 100 / self.total)
+        mb_total = self.total / (1024 * 1024)
+        bar_len = 40
+        filled = int(bar_len * percent / 100)
+        bar = '█' * filled + '-' * (bar_len - filled)
+        print(f'\r[{bar}] {percent:.1f}% ({mb_down:.1f}/{mb_total:.1f} MB)', end='', flush=True)
+
+
+class _SequentialHash:
+    """SHA-256 calculado durante o download: avança sobre as faixas contíguas já concluídas."""
+
+    def __init__(self, part: Path, total: int):
+        self.part = part
+        self.total = total
+        self.sha = hashlib.sha256()
+        self.next_chunk = 0
+
+    def advance(self, done: set) -> None:
+        # Faixas recém-escritas ainda estão no cache de páginas: a releitura é barata
+        with open(self.part, "rb") as f:
+            while self.next_chunk in done:
+                f.seek(self.next_chunk * CHUNK_SIZE)
+                remaining = min(CHUNK_SIZE, self.total - self.next_chunk * CHUNK_SIZE)
+                while remaining > 0:
+                    data = f.read(min(1 << 20, remaining))
+                    if not data:
+                        raise IOError("Arquivo parcial menor que o esperado")
+                    self.sha.update(data)
+                    remaining -= len(data)
+                self.next_chunk += 1
+
+    def hexdigest(self) -> str:
+        return self.sha.hexdigest()
+
+
+def _fetch_chunk(url: str, part: Path, index: int, total: int, progress: _Progress) -> int:
+    """Baixa uma faixa direto na sua posição do arquivo .part (com retentativas)."""
+    start = index * CHUNK_SIZE
+    end = min(start + CHUNK_SIZE, total) - 1
+    for attempt in range(1, RETRIES + 1):
+        written = 0
+        try:
+            with urllib.request.urlopen(_request(url, start, end), timeout=60) as resp, \
+                    open(part, "r+b") as f:
+                if resp.status != 206:
+                    raise IOError(f"Servidor ignorou Range (HTTP {resp.status})")
+                f.seek(start)
+                while True:
+                    data = resp.read(1 << 16)
+                    if not data:
+                        break
+                    f.write(data)
+                    written += len(data)
+                    progress.add(len(data))
+            if written != end - start + 1:
+                raise IOError(f"Faixa {index} incompleta ({written} de {end - start + 1} bytes)")
+            return index
+        except Exception:
+            progress.add(-written)
+            if attempt == RETRIES:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def _download_ranges(url: str, part: Path, total: int, parts: int, source: str) -> str:
+    """Baixa em faixas paralelas, retomando de `.part.json`; retorna o sha256."""
+    state_file = part.with_name(part.name + ".json")
+    chunks = (total + CHUNK_SIZE - 1) // CHUNK_SIZE
+    state = {}
+    if state_file.exists() and part.exists():
+        state = json.loads(state_file.read_text(encoding="utf-8"))
+    if (state.get("url"), state.get("total"), state.get("chunk")) != (source, total, CHUNK_SIZE):
+        # Parcial de outro arquivo: recomeça
+        state = {"url": source, "total": total, "chunk": CHUNK_SIZE, "done": []}
+        with open(part, "wb") as f:
+            f.truncate(total)
+    done = set(state["done"])
+    if done:
+        print_status(f"Retomando: {len(done)}/{chunks} partes já no disco", "🔁")
+
+    def save_state() -> None:
+        state["done"] = sorted(done)
+        state_file.write_text(json.dumps(state), encoding="utf-8")
+
+    progress = _Progress(total, sum(min(CHUNK_SIZE, total - i * CHUNK_SIZE) for i in done))
+    hasher = _SequentialHash(part, total)
+    pending = [i for i in range(chunks) if i not in done]
+    with ThreadPoolExecutor(max_workers=max(1, parts)) as executor:
+        futures = {executor.submit(_fetch_chunk, url, part, i, total, progress) for i in pending}
+        try:
+            while futures:
+                finished, futures = wait(futures, timeout=0.2, return_when=FIRST_EXCEPTION)
+                for future in finished:
+                    done.add(future.result())
+                if finished:
+                    save_state()
+                hasher.advance(done)
+                progress.show()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            save_state()
+            raise
+    hasher.advance(done)
+    progress.show()
+    print()
+    state_file.unlink(missing_ok=True)
+    return hasher.hexdigest()
+
+
+def _download_stream(url: str, part: Path, total: Optional[int]) -> str:
+    """Servidor sem Range: uma conexão, do início, com hash em linha."""
+    sha = hashlib.sha256()
+    progress = _Progress(total)
+    with urllib.request.urlopen(_request(url), timeout=60) as resp, open(part, "wb") as f:
+        while True:
+            data = resp.read(1 << 16)
+            if not data:
+                break
+            f.write(data)
+            sha.update(data)
+            progress.add(len(data))
+            progress.show()
+    print()
+    return sha.hexdigest()
+
+
+def download_with_progress(url: str, dest: Path, sha256: Optional[str] = None,
+                           parts: int = PARALLEL_PARTS) -> bool:
+    """
+    Baixa arquivo com barra de progresso.
+
+    Usa requisições Range paralelas num `.part` pré-alocado e retoma o que já
+    estiver no disco. O SHA-256 é conferido contra `sha256`, o manifesto ou o
+    checksum anunciado pelo servidor, nessa ordem; sem nenhum, o calculado é
+    registrado no manifesto.
+    """
+    part = dest.with_name(dest.name + ".part")
     try:
         # Garantir que o diretório existe
         dest.parent.mkdir(parents=True, exist_ok=True)
@@ -40,31 +262,37 @@ def download_with_progress(url: str, dest: Path) -> bool:
         print_status(f"Baixando: {dest.name}", "📥")
         print(f"URL: {url}\n")
         
-        def show_progress(block_num, block_size, total_size):
-            if total_size > 0:
-                downloaded = block_num * block_size
-                percent = min(100, downloaded * 100 / total_size)
-                mb_down = downloaded / (1024 * 1024)
-                mb_total = total_size / (1024 * 1024)
-                bar_len = 40
-                filled = int(bar_len * percent / 100)
-                bar = '█' * filled + '-' * (bar_len - filled)
-                print(f'\r[{bar}] {percent:.1f}% ({mb_down:.1f}/{mb_total:.1f} MB)', end='', flush=True)
-        
-        urllib.request.urlretrieve(url, dest, show_progress)
-        print()
+        final_url, total, ranges, announced = _probe(url)
+        manifest = load_manifest().get(dest.name, {})
+        expected = (sha256 or manifest.get("sha256") or announced or "").lower() or None
+
+        if ranges and total:
+            digest = _download_ranges(final_url, part, total, parts, url)
+        else:
+            digest = _download_stream(final_url, part, total)
+
+        if total is not None and part.stat().st_size != total:
+            raise IOError(f"Tamanho {part.stat().st_size} difere do esperado ({total})")
+        if expected and digest != expected:
+            part.unlink()
+            part.with_name(part.name + ".json").unlink(missing_ok=True)
+            print_status(f"Checksum inválido: {digest} (esperado {expected})", "❌")
+            return False
+
+        os.replace(part, dest)
+        if expected:
+            print_status("SHA-256 verificado", "🔒")
+        else:
+            save_manifest_entry(dest.name, digest, dest.stat().st_size, url)
+            print_status(f"SHA-256 registrado no manifesto: {digest}", "📝")
         return True
     except KeyboardInterrupt:
         print()
-        print_status("Download cancelado pelo usuário", "⚠️")
-        if dest.exists():
-            dest.unlink()
+        print_status("Download interrompido; execute de novo para retomar", "⚠️")
         return False
     except Exception as e:
         print()
-        print_status(f"Erro: {e}", "❌")
-        if dest.exists():
-            dest.unlink()
+        print_status(f"Erro: {e} (o parcial foi mantido para retomar)", "❌")
         return False
 
 
@@ -115,6 +343,12 @@ def download_llama_cpp() -> bool:
                     import shutil
                     shutil.move(str(found[0]), str(llama_exe))
                     print_status(f"Instalado: {llama_exe}", "✅")
+
+                    # llama-server: usado pelos workers residentes (LLM_WORKERS > 0)
+                    server_exe = BIN_DIR / "llama-server.exe"
+                    servidores = list(BIN_DIR.rglob("llama-server.exe"))
+                    if servidores and servidores[0] != server_exe:
+                        shutil.move(str(servidores[0]), str(server_exe))
                     return True
                 else:
                     print_status("Executável não encontrado no ZIP", "⚠️")
@@ -164,8 +398,38 @@ def download_model() -> bool:
         return False
 
 
+def _file_name(url: str) -> str:
+    return url.rsplit("/", 1)[-1].split("?", 1)[0]
+
+
+def download_extra_models(urls: list) -> bool:
+    """Baixa GGUFs adicionais para o registro de modelos (LLM_MODELOS)."""
+    ok = True
+    for url in urls:
+        name = _file_name(url)
+        dest = MODELS_DIR / name
+        if dest.exists():
+            print_status(f"{name} já baixado", "✅")
+            continue
+        print_status(f"Baixando {name}", "📥")
+        if download_with_progress(url, dest):
+            print_status(f"Modelo salvo: {dest}", "✅")
+        else:
+            print_status(f"Falha ao baixar {name}", "❌")
+            ok = False
+    if ok and urls:
+        names = ",".join(f"{Path(_file_name(u)).stem}={_file_name(u)}" for u in urls)
+        print(f"\nRegistre com: LLM_MODELOS={names}  (nomes à sua escolha)")
+    return ok
+
+
 def main() -> None:
     """Função principal."""
+    parser = argparse.ArgumentParser(description="Setup do llm_toolkit")
+    parser.add_argument("models", nargs="*", metavar="URL",
+                        help="GGUFs adicionais a baixar em resources/models (ver LLM_MODELOS)")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("🚀 Setup llm_toolkit")
     print("=" * 60)
@@ -188,7 +452,7 @@ def main() -> None:
     
     # Download
     llama_ok = download_llama_cpp()
-    model_ok = download_model()
+    model_ok = download_model() and download_extra_models(args.models)
     
     # Resumo
     print("\n" + "=" * 60)
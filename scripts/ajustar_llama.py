@@ -0,0 +1,64 @@
+"""CLI para ajustar threads e lote do llama.cpp neste host e modelo"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from llm_toolkit.config import config
+from llm_toolkit.core import ajuste, llm
+
+
+def _mb(n: int) -> str:
+    return f"{n / 1024 ** 2:.1f} MB" if n >= 1024 ** 2 else f"{n // 1024} KB"
+
+
+def main():
+    """Mede as combinações, mostra os resultados e salva o melhor perfil"""
+    parser = argparse.ArgumentParser(description='Ajuste de threads e lote do llama.cpp')
+    parser.add_argument('--repeticoes', type=int, default=3, help='Execuções por combinação (mediana)')
+    parser.add_argument('--tokens', type=int, default=64, help='Tokens gerados por execução')
+    parser.add_argument('--prompt', default='Explique em poucas palavras o que é Python.',
+                        help='Pergunta usada nas medições (montada com o prompt do sistema)')
+    parser.add_argument('--threads', type=int, nargs='+', help='Threads a testar (padrão: pela topologia)')
+    parser.add_argument('--lotes', type=int, nargs='+', help='Tamanhos de lote a testar')
+    parser.add_argument('--modelo', help='Nome do modelo no registro (padrão: LLM_MODELO_PADRAO)')
+    parser.add_argument('--nao-salvar', action='store_true', help='Só mostra o resultado')
+
+    args = parser.parse_args()
+    try:
+        arquivo = llm.registro_modelos().obter(args.modelo).arquivo
+    except ValueError as e:
+        sys.exit(str(e))
+    # As medições usam o llama-cli mesmo quando o servidor roda com workers
+    if not llm.LLAMA_EXE.exists() or not arquivo.exists():
+        sys.exit("Faltam llama-cli ou modelo: execute download.py")
+
+    cpu = ajuste.detectar_cpu()
+    info = ajuste.info_modelo(arquivo)
+    caches = " ".join(f"{nome}={_mb(tamanho)}" for nome, tamanho in cpu["caches"].items()) or "-"
+
+    print(f"\nAjuste do llama.cpp")
+    print(f"{'='*50}")
+    print(f"CPU: {cpu['modelo']} | {cpu['fisicos']} físicos / {cpu['logicos']} lógicos | {caches}")
+    print(f"Modelo: {info['arquivo']} ({_mb(info['tamanho'])}) {info.get('arquitetura') or ''} "
+          f"camadas={info.get('camadas') or '-'} contexto={info.get('contexto_treino') or '-'}")
+    print(f"{'='*50}")
+    print(f"{'threads':>8}{'lote':>8}{'ms':>10}{'tok/s':>10}")
+
+    def _mostrar(m):
+        print(f"{m['threads']:>8}{m['batch']:>8}{m['ms']:>10.1f}{m['tokens_seg'] or '-':>10}")
+
+    resultado = ajuste.ajustar(
+        llm.comando_medicao(args.prompt, args.tokens, arquivo), cpu, info, config.llm.contexto,
+        repeticoes=args.repeticoes, threads=args.threads, lotes=args.lotes, progresso=_mostrar
+    )
+    print(f"\nMelhor: --threads {resultado['threads']} --batch-size {resultado['batch']} ({resultado['ms']:.1f} ms)")
+    if not args.nao_salvar:
+        destino = ajuste.salvar_perfil(llm.PERFIS_DIR, arquivo, resultado, cpu, info)
+        print(f"Perfil salvo em {destino} (carregado automaticamente; LLM_PERFIL=false desliga)")
+
+
+if __name__ == '__main__':
+    main()
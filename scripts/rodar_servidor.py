@@ -16,17 +16,27 @@ def main():
     parser.add_argument('--porta', type=int, default=5000, help='Porta (padrão: 5000)')
     parser.add_argument('--debug', action='store_true', help='Modo debug')
     parser.add_argument('--publico', action='store_true', help='Permitir externo (0.0.0.0)')
+    parser.add_argument('--sem-aquecimento', action='store_true', help='Não gerar resposta de aquecimento')
+    parser.add_argument('--precarregar', choices=['nao', 'ler', 'travar'],
+                        help='Pré-carga do modelo na RAM (padrão: LLM_PRECARREGAR)')
+    parser.add_argument('--workers', type=int,
+                        help='Modo produção: N processos pré-criados (padrão: API_PROCESSOS)')
+    parser.add_argument('--async', dest='assincrono', action='store_true',
+                        help='Servidor assíncrono aiohttp (gerações pendentes sem thread)')
     
     args = parser.parse_args()
     host = '0.0.0.0' if args.publico else args.host
     
     print(f"\nServidorAPI REST - LLM Local")
     print(f"{'='*50}")
-    print(f"Host: {host}:{args.porta} | Debug: {args.debug}")
-    print(f"Endpoints: /health /gerar /gerar-multiplo /historico /limpar-historico")
+    print(f"Host: {host}:{args.porta} | Debug: {args.debug} | Processos: {args.workers or '-'}")
+    print(f"Endpoints: /health /ready /gerar /gerar-stream /gerar-multiplo /historico /limpar-historico /fila /cache /metricas /perfil")
     print(f"{'='*50}\n")
     
-    iniciar_servidor(host=host, porta=args.porta, debug=args.debug)
+    iniciar_servidor(host=host, porta=args.porta, debug=args.debug,
+                     aquecer=False if args.sem_aquecimento else None,
+                     precarregar=args.precarregar, processos=args.workers,
+                     assincrono=args.assincrono)
 
 
 if __name__ == '__main__':
@@ -12,7 +12,7 @@ setup(
     description="Chat LLM Local - Interface Python para llama.cpp + Gemma 2B",
     long_description=long_description,
     long_description_content_type="text/markdown",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     classifiers=[
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3.8",
@@ -26,6 +26,9 @@ setup(
     install_requires=[
         "flask>=2.0.0",
     ],
+    extras_require={
+        "async": ["aiohttp>=3.9.0"],
+    },
     entry_points={
         "console_scripts": [
             "llm-servidor=llm_toolkit.cli:main",
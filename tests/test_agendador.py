@@ -0,0 +1,139 @@
+"""Agendador: threads e corrotinas na mesma fila, timeout contado da admissão"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from llm_toolkit.api.server import GeradorLLM
+from llm_toolkit.client.models import RespostaCliente
+from llm_toolkit.core import agendador as modulo
+from llm_toolkit.core.agendador import Admissao, Agendador, EsperaExcedida, FilaCheia
+
+
+def _ate(condicao, timeout: float = 5) -> None:
+    """Espera (em thread) `condicao()` ficar verdadeira"""
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida"
+        time.sleep(0.005)
+
+
+async def _ate_async(condicao, timeout: float = 5) -> None:
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida"
+        await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+def agendador(monkeypatch):
+    """Agendador global com uma vaga (usado pelas Admissao)"""
+    agendador = Agendador(concorrencia=1, capacidade=4, timeout=5)
+    monkeypatch.setattr(modulo, "_agendador", agendador)
+    return agendador
+
+
+def test_threads_e_corrotinas_dividem_a_fila(agendador):
+    agendador.adquirir()
+    ordem = []
+
+    def thread():
+        agendador.adquirir("batch")
+        ordem.append("thread")
+        agendador.liberar()
+
+    esperando = threading.Thread(target=thread)
+    esperando.start()
+    _ate(lambda: agendador.estatisticas()["profundidade"] == 1)
+
+    async def corrotina():
+        tarefa = asyncio.ensure_future(agendador.adquirir_async("interativo"))
+        await _ate_async(lambda: agendador.estatisticas()["profundidade"] == 2)
+        agendador.liberar()
+        await tarefa
+        ordem.append("corrotina")
+        agendador.liberar()
+
+    asyncio.run(corrotina())
+    esperando.join(5)
+
+    # Interativo passa na frente do batch, mesmo tendo chegado depois
+    assert ordem == ["corrotina", "thread"]
+    estatisticas = agendador.estatisticas()
+    assert estatisticas["ativos"] == 0
+    assert estatisticas["admitidos"] == 3
+
+
+def test_corrotina_acordada_por_outra_thread(agendador):
+    agendador.adquirir()
+    threading.Timer(0.1, agendador.liberar).start()
+
+    async def corrotina():
+        return await asyncio.wait_for(agendador.adquirir_async(), 2)
+
+    assert asyncio.run(corrotina()) >= 0.05
+    assert agendador.estatisticas()["ativos"] == 1
+
+
+def test_espera_excedida_sai_da_fila(agendador):
+    agendador.timeout = 0.1
+    agendador.adquirir()
+
+    with pytest.raises(EsperaExcedida):
+        agendador.adquirir()
+    with pytest.raises(EsperaExcedida):
+        asyncio.run(agendador.adquirir_async())
+
+    estatisticas = agendador.estatisticas()
+    assert estatisticas["profundidade"] == 0
+    assert estatisticas["expirados"] == 2
+
+
+def test_fila_cheia(agendador):
+    agendador.capacidade = 0
+    agendador.adquirir()
+
+    with pytest.raises(FilaCheia):
+        agendador.adquirir()
+    # Itens de um lote já aceito entram mesmo assim
+    threading.Timer(0.05, agendador.liberar).start()
+    assert agendador.adquirir(forcar=True) > 0
+
+
+@pytest.mark.parametrize("trabalho, sucesso", [(0.1, True), (0.5, False)])
+def test_timeout_do_item_conta_da_admissao(agendador, trabalho, sucesso):
+    agendador.adquirir()
+    # O item fica 0.3s na fila, mais que o timeout_item de 0.25s
+    threading.Timer(0.3, agendador.liberar).start()
+    admissao = Admissao(forcar=True)
+
+    def item():
+        with admissao.vaga():
+            time.sleep(trabalho)
+        return RespostaCliente(sucesso=True, dados="ok")
+
+    with ThreadPoolExecutor(1) as executor:
+        futuro = executor.submit(item)
+        resposta = GeradorLLM._aguardar_item(futuro, admissao, 0, timeout_item=0.25)
+
+    assert resposta.sucesso is sucesso
+    assert admissao.espera >= 0.2
+
+
+def test_admissao_dispensada_acorda_quem_espera(agendador):
+    admissao = Admissao()
+
+    async def esperar():
+        tarefa = asyncio.ensure_future(admissao.esperar_async())
+        await asyncio.sleep(0.01)
+        assert not tarefa.done()
+        threading.Thread(target=admissao.dispensar).start()
+        await asyncio.wait_for(tarefa, 2)
+
+    asyncio.run(esperar())
+    assert admissao.esperar(0)
+    assert admissao.inicio is not None
+    assert agendador.estatisticas()["ativos"] == 0
@@ -0,0 +1,166 @@
+"""Coalescência: chamadas e streams iguais compartilham a geração"""
+
+import asyncio
+import threading
+import time
+
+from llm_toolkit.core.coalescencia import Coalescencia
+
+BLOCOS = ["um ", "dois ", "tres ", "quatro"]
+
+
+class _Fonte:
+    """Stream falso: conta blocos lidos e se foi fechado"""
+
+    def __init__(self, pausa: float = 0.0):
+        self.pausa = pausa
+        self.lidos = 0
+        self.fechada = False
+
+    def gerar(self):
+        try:
+            for bloco in BLOCOS:
+                time.sleep(self.pausa)
+                self.lidos += 1
+                yield bloco
+        finally:
+            self.fechada = True
+
+    async def gerar_async(self):
+        try:
+            for bloco in BLOCOS:
+                await asyncio.sleep(self.pausa)
+                self.lidos += 1
+                yield bloco
+        finally:
+            self.fechada = True
+
+
+def test_executar_espera_a_chamada_em_andamento():
+    coalescencia = Coalescencia()
+    chamadas, seguidores = [], []
+    liberar = threading.Event()
+
+    def funcao():
+        chamadas.append(1)
+        liberar.wait(2)
+        return "resposta"
+
+    resultados = []
+    lider = threading.Thread(target=lambda: resultados.append(coalescencia.executar("k", funcao)))
+    lider.start()
+    while not chamadas:
+        time.sleep(0.005)
+    seguidor = threading.Thread(target=lambda: resultados.append(
+        coalescencia.executar("k", funcao, ao_seguir=lambda: seguidores.append(1))))
+    seguidor.start()
+    while not seguidores:
+        time.sleep(0.005)
+    liberar.set()
+    lider.join(2)
+    seguidor.join(2)
+
+    assert sorted(resultados) == [("resposta", False), ("resposta", True)]
+    assert len(chamadas) == 1
+    assert coalescencia.em_andamento() == 0
+
+
+def test_transmitir_segue_apos_o_lider_desistir():
+    coalescencia = Coalescencia()
+    fonte = _Fonte()
+    lider = coalescencia.transmitir("k", fonte.gerar)
+    assert next(lider) == "um "
+
+    seguidor = coalescencia.transmitir("k", lambda: _Fonte().gerar())
+    assert seguidor.coalescida
+    lider.close()
+
+    assert "".join(seguidor) == "".join(BLOCOS)
+    assert fonte.lidos == len(BLOCOS)
+    assert coalescencia.em_andamento() == 0
+
+
+def test_transmitir_fecha_a_fonte_quando_todos_saem():
+    coalescencia = Coalescencia()
+    fonte = _Fonte()
+    lider = coalescencia.transmitir("k", fonte.gerar)
+    next(lider)
+    seguidor = coalescencia.transmitir("k", fonte.gerar)
+
+    lider.close()
+    assert not fonte.fechada
+    seguidor.close()
+
+    assert fonte.fechada
+    assert fonte.lidos == 1
+    assert coalescencia.em_andamento() == 0
+
+
+def test_transmitir_async_segue_apos_o_lider_desistir():
+    async def cenario():
+        coalescencia = Coalescencia()
+        fonte = _Fonte(pausa=0.01)
+
+        async def criar():
+            return fonte.gerar_async()
+
+        lider = await coalescencia.transmitir_async("k", criar)
+        assert await lider.__anext__() == "um "
+        seguidor = await coalescencia.transmitir_async("k", criar)
+        await lider.aclose()
+
+        recebidos = [bloco async for bloco in seguidor]
+        assert recebidos == BLOCOS
+        assert fonte.fechada
+        assert coalescencia.em_andamento() == 0
+
+    asyncio.run(cenario())
+
+
+def test_transmitir_async_publica_so_depois_de_criar():
+    async def cenario():
+        coalescencia = Coalescencia()
+        fontes = []
+
+        async def criar():
+            # Ex.: esperando vaga no agendador; nada foi publicado ainda
+            await asyncio.sleep(0.02)
+            fontes.append(_Fonte())
+            return fontes[-1].gerar_async()
+
+        primeira, segunda = await asyncio.gather(
+            coalescencia.transmitir_async("k", criar),
+            coalescencia.transmitir_async("k", criar),
+        )
+
+        async def ler(assinatura):
+            return [bloco async for bloco in assinatura]
+
+        resultados = await asyncio.gather(ler(primeira), ler(segunda))
+
+        # Quem terminou de criar depois descarta a sua fonte sem gerar
+        assert resultados == [BLOCOS, BLOCOS]
+        assert sorted(fonte.lidos for fonte in fontes) == [0, len(BLOCOS)]
+        assert coalescencia.em_andamento() == 0
+
+    asyncio.run(cenario())
+
+
+def test_transmitir_async_cancela_quando_todos_saem():
+    async def cenario():
+        coalescencia = Coalescencia()
+        fonte = _Fonte(pausa=0.05)
+
+        async def criar():
+            return fonte.gerar_async()
+
+        lider = await coalescencia.transmitir_async("k", criar)
+        await lider.__anext__()
+        await lider.aclose()
+        await asyncio.sleep(0.01)
+
+        assert fonte.fechada
+        assert fonte.lidos < len(BLOCOS)
+        assert coalescencia.em_andamento() == 0
+
+    asyncio.run(cenario())
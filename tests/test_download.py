@@ -0,0 +1,115 @@
+"""Downloads em faixas: paralelo, retomada, checksum e servidor sem Range"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_toolkit import download
+
+CHUNK = 1024
+CONTEUDO = os.urandom(10 * CHUNK + 300)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve CONTEUDO; com `aceita_range`, responde 206 às requisições Range"""
+
+    aceita_range = True
+    faixas = []
+
+    def do_GET(self):
+        faixa = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if faixa and self.aceita_range:
+            inicio, fim = int(faixa.group(1)), int(faixa.group(2))
+            self.faixas.append((inicio, fim))
+            corpo = CONTEUDO[inicio:fim + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {inicio}-{fim}/{len(CONTEUDO)}")
+        else:
+            corpo = CONTEUDO
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor(monkeypatch, tmp_path):
+    """Servidor HTTP local; devolve (url, classe do handler)"""
+    monkeypatch.setattr(download, "CHUNK_SIZE", CHUNK)
+    monkeypatch.setattr(download, "MANIFEST_FILE", tmp_path / "manifest.json")
+    handler = type("Handler", (_Handler,), {"faixas": []})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/modelo.gguf", handler
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _faixas_baixadas(handler):
+    """Índices das faixas pedidas, sem a sondagem de 1 byte"""
+    return sorted(inicio // CHUNK for inicio, fim in handler.faixas if fim > inicio)
+
+
+def test_download_paralelo(servidor, tmp_path):
+    url, handler = servidor
+    destino = tmp_path / "modelo.gguf"
+
+    assert download.download_with_progress(url, destino, parts=4)
+
+    assert destino.read_bytes() == CONTEUDO
+    assert _faixas_baixadas(handler) == list(range(11))
+    assert not (tmp_path / "modelo.gguf.part").exists()
+    assert not (tmp_path / "modelo.gguf.part.json").exists()
+    manifesto = json.loads((tmp_path / "manifest.json").read_text(encoding="utf-8"))
+    assert manifesto["modelo.gguf"]["sha256"] == hashlib.sha256(CONTEUDO).hexdigest()
+
+
+def test_retoma_de_part_json(servidor, tmp_path):
+    url, handler = servidor
+    destino = tmp_path / "modelo.gguf"
+    parcial = tmp_path / "modelo.gguf.part"
+    with open(parcial, "wb") as f:
+        f.truncate(len(CONTEUDO))
+        f.seek(0)
+        f.write(CONTEUDO[:3 * CHUNK])
+    (tmp_path / "modelo.gguf.part.json").write_text(json.dumps(
+        {"url": url, "total": len(CONTEUDO), "chunk": CHUNK, "done": [0, 1, 2]}
+    ), encoding="utf-8")
+
+    assert download.download_with_progress(url, destino, parts=2)
+
+    assert destino.read_bytes() == CONTEUDO
+    assert _faixas_baixadas(handler) == list(range(3, 11))
+
+
+def test_rejeita_sha256_divergente(servidor, tmp_path):
+    url, _ = servidor
+    destino = tmp_path / "modelo.gguf"
+
+    assert not download.download_with_progress(url, destino, sha256="0" * 64)
+
+    assert not destino.exists()
+    assert not (tmp_path / "modelo.gguf.part").exists()
+    assert not (tmp_path / "modelo.gguf.part.json").exists()
+
+
+def test_servidor_sem_range(servidor, tmp_path):
+    url, handler = servidor
+    handler.aceita_range = False
+    destino = tmp_path / "modelo.gguf"
+
+    assert download.download_with_progress(
+        url, destino, sha256=hashlib.sha256(CONTEUDO).hexdigest()
+    )
+
+    assert destino.read_bytes() == CONTEUDO
+    assert handler.faixas == []
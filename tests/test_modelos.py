@@ -0,0 +1,84 @@
+"""RegistroModelos.residir: despejo LRU sob o orçamento de RAM"""
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from llm_toolkit.core.modelos import Modelo, RegistroModelos
+
+_MB = 1024 ** 2
+
+
+@pytest.fixture
+def registro():
+    """Três modelos de 40 MB num orçamento de 100 MB"""
+    modelos = {nome: Modelo(nome, Path(f"{nome}.gguf"), memoria=40 * _MB) for nome in ("a", "b", "c")}
+    return RegistroModelos(modelos, "a", ram_max=100 * _MB)
+
+
+def _residir(registro, nome, timeout: float = 1):
+    return registro.residir(registro.obter(nome), lambda: nome, contexto=2048, timeout=timeout)
+
+
+def test_despeja_o_usado_ha_mais_tempo(registro):
+    _residir(registro, "a")
+    _residir(registro, "b")
+    # Usar `a` de novo o torna o mais recente: `b` é quem sai
+    assert _residir(registro, "a") == "a"
+
+    _residir(registro, "c")
+
+    assert list(registro._residentes) == ["a", "c"]
+    assert registro.ram_residente() == 80 * _MB
+    estatisticas = registro.estatisticas()["modelos"]
+    assert estatisticas["b"]["despejos"] == 1
+    assert estatisticas["a"]["carregamentos"] == 1
+
+
+def test_modelo_em_uso_nao_e_despejado(registro):
+    _residir(registro, "a")
+    _residir(registro, "b")
+    carregado = []
+
+    with registro.vaga(registro.obter("a"), 1), registro.vaga(registro.obter("b"), 1):
+        esperando = threading.Thread(target=lambda: carregado.append(_residir(registro, "c", 2)))
+        esperando.start()
+        time.sleep(0.1)
+        # Os dois residentes têm gerações em andamento: `c` espera
+        assert not carregado
+        assert list(registro._residentes) == ["a", "b"]
+
+    esperando.join(2)
+    assert carregado == ["c"]
+    assert list(registro._residentes) == ["b", "c"]
+
+
+def test_timeout_sem_ram(registro):
+    _residir(registro, "a")
+    _residir(registro, "b")
+
+    with registro.vaga(registro.obter("a"), 1), registro.vaga(registro.obter("b"), 1):
+        with pytest.raises(TimeoutError):
+            _residir(registro, "c", timeout=0.1)
+
+    assert list(registro._residentes) == ["a", "b"]
+
+
+def test_modelo_maior_que_o_orcamento_carrega_sozinho(registro):
+    _residir(registro, "a")
+    registro.obter("b").memoria = 150 * _MB
+
+    assert _residir(registro, "b") == "b"
+    assert list(registro._residentes) == ["b"]
+
+
+def test_sem_orcamento_nao_despeja():
+    modelos = {nome: Modelo(nome, Path(f"{nome}.gguf"), memoria=40 * _MB) for nome in ("a", "b", "c")}
+    registro = RegistroModelos(modelos, "a")
+
+    for nome in modelos:
+        _residir(registro, nome)
+
+    assert list(registro._residentes) == ["a", "b", "c"]
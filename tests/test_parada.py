@@ -0,0 +1,60 @@
+"""DetectorParada: sequências de parada que atravessam blocos"""
+
+import pytest
+
+from llm_toolkit.core.parada import DetectorParada
+
+
+def _alimentar(paradas, blocos):
+    detector = DetectorParada(paradas)
+    repassado = ""
+    for bloco in blocos:
+        repassado += detector.alimentar(bloco)
+        if detector.parou:
+            break
+    else:
+        repassado += detector.finalizar()
+    return detector, repassado
+
+
+@pytest.mark.parametrize("blocos", [
+    ["Resposta final", "\nUsuário:", " mais texto"],
+    ["Resposta final\nUs", "uário: mais texto"],
+    ["Resposta final\n", "U", "s", "u", "á", "r", "i", "o", ":", " mais"],
+])
+def test_parada_dividida_entre_blocos(blocos):
+    detector, repassado = _alimentar(["\nUsuário:"], blocos)
+
+    assert detector.parou
+    assert detector.sequencia == "\nUsuário:"
+    assert repassado == detector.texto == "Resposta final"
+
+
+def test_prefixo_retido_e_devolvido_quando_nao_completa():
+    detector = DetectorParada(["</s>"])
+
+    assert detector.alimentar("fim </") == "fim "
+    assert detector.alimentar("div>") == "</div>"
+    assert not detector.parou
+    assert detector.finalizar() == ""
+
+
+def test_prefixo_retido_sai_ao_finalizar():
+    detector, repassado = _alimentar(["</s>"], ["texto <", "/"])
+
+    assert not detector.parou
+    assert repassado == "texto </"
+
+
+def test_primeira_sequencia_encontrada_vence():
+    detector, repassado = _alimentar(["###", "\n\n"], ["a\n", "\nb ##", "#"])
+
+    assert detector.sequencia == "\n\n"
+    assert repassado == "a"
+
+
+def test_brancos_iniciais_ignorados():
+    detector, repassado = _alimentar(["\n"], ["  ", "\n", " texto", "\nresto"])
+
+    assert detector.sequencia == "\n"
+    assert repassado == "texto"
@@ -0,0 +1,71 @@
+"""CacheSimilares: acerto aproximado e despejo LRU por memória"""
+
+from llm_toolkit.core.similares import CacheSimilares
+
+PROMPTS = [
+    "Qual é a capital da França?",
+    "Explique o teorema de Pitágoras com um exemplo",
+    "Liste três linguagens de programação funcionais",
+    "Como funciona a fotossíntese nas plantas verdes",
+    "Escreva um haicai sobre o mar em novembro",
+]
+
+
+def _cache(entradas: int) -> CacheSimilares:
+    """Cache com memória para cerca de `entradas` respostas curtas"""
+    medida = CacheSimilares()
+    medida.gravar(PROMPTS[0], "ctx", "resposta 0")
+    return CacheSimilares(memoria_max=medida._memoria * entradas)
+
+
+def test_acerto_aproximado_e_por_contexto():
+    cache = CacheSimilares()
+    cache.gravar("Qual é a capital da França?", "ctx", "Paris")
+
+    assert cache.obter("qual e a capital da franca", "ctx") == ("Paris", 1.0)
+    longo = " ".join(PROMPTS[1:]) + ". " + " ".join(PROMPTS[1:])
+    cache.gravar(longo, "ctx", "longa")
+    # Uma letra trocada num prompt longo: quase todos os trechos coincidem
+    resposta, similaridade = cache.obter(longo.replace("haicai", "haikai", 1), "ctx")
+    assert resposta == "longa" and similaridade >= cache.limiar
+    assert cache.obter("Qual é a capital da França?", "outro") is None
+
+
+def test_despeja_o_usado_ha_mais_tempo():
+    cache = _cache(3)
+    for i, prompt in enumerate(PROMPTS[:3]):
+        cache.gravar(prompt, "ctx", f"resposta {i}")
+    # Usar a primeira a torna a mais recente: a segunda sai no lugar dela
+    assert cache.obter(PROMPTS[0], "ctx")[0] == "resposta 0"
+
+    cache.gravar(PROMPTS[3], "ctx", "resposta 3")
+
+    assert len(cache) == 3
+    assert cache.contadores["despejos"] == 1
+    assert cache.obter(PROMPTS[1], "ctx") is None
+    for i in (0, 2, 3):
+        assert cache.obter(PROMPTS[i], "ctx")[0] == f"resposta {i}"
+
+
+def test_despejo_limpa_o_indice():
+    cache = _cache(2)
+    for i, prompt in enumerate(PROMPTS):
+        cache.gravar(prompt, "ctx", f"resposta {i}")
+
+    vivos = set(cache._entradas)
+    assert len(vivos) == 2
+    assert {i for balde in cache._indice.values() for i in balde} == vivos
+    assert set(cache._exatos.values()) == vivos
+    assert cache._memoria == sum(e.tamanho for e in cache._entradas.values())
+    assert cache._memoria <= cache.memoria_max
+
+
+def test_regravar_substitui_sem_duplicar():
+    cache = CacheSimilares()
+    cache.gravar("Qual é a capital da França?", "ctx", "Paris")
+    cache.gravar("qual é a capital da frança", "ctx", "Paris!")
+
+    assert len(cache) == 1
+    assert len(cache._exatos) == 1
+    assert cache._memoria == next(iter(cache._entradas.values())).tamanho
+    assert cache.obter("Qual é a capital da França?", "ctx")[0] == "Paris!"